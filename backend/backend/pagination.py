@@ -0,0 +1,249 @@
+"""
+Keyset (seek) pagination shared by the post, comment and messaging APIs.
+
+Pages are addressed by an opaque cursor holding the sort key of the last
+row that was returned, e.g. ``(created_at, id)``. The next page is fetched
+with a ``WHERE (created_at, id) < (...)`` seek, so deep pages cost the same
+as the first one and no ``COUNT(*)`` is ever issued.
+
+The response body stays a plain list; the cursor for the next page is sent
+in the ``X-Next-Cursor`` header and as a ``Link: <...>; rel="next"`` header.
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Default sort key; the last field must be unique (normally the primary key)
+    ordering = ('-created_at', '-id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        # Honour ?ordering= from an OrderingFilter on the view, with the
+        # primary key appended as the tie breaker
+        for backend in getattr(view, 'filter_backends', []) if view else []:
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    ordering = [field for field in ordering if field.lstrip('-') not in ('id', 'pk')]
+                    tie_breaker = '-id' if ordering[-1].startswith('-') else 'id'
+                    return tuple(ordering) + (tie_breaker,)
+        return self.ordering
+
+    def encode_cursor(self, key):
+        # Full precision isoformat; DjangoJSONEncoder truncates microseconds
+        def default(value):
+            if isinstance(value, datetime.datetime):
+                return value.isoformat()
+            raise TypeError(f'Cannot encode {value!r} in a cursor')
+        payload = json.dumps(list(key), default=default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model=None, param=None):
+        """Return the sort key carried by the request's cursor, or None"""
+        encoded = request.query_params.get(param or self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(key, list) or len(key) != len(self.key_fields):
+                raise ValueError(encoded)
+            if model is not None:
+                key = [
+                    model._meta.get_field(field).to_python(value)
+                    for field, value in zip(self.key_fields, key)
+                ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return tuple(key)
+
+    @property
+    def key_fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def seek_filter(self, key, ordering=None):
+        """Build the WHERE clause selecting rows that sort after ``key``"""
+        ordering = ordering or self.ordering
+        condition = Q()
+        for position, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            prefix = {ordering[i].lstrip('-'): key[i] for i in range(position)}
+            condition |= Q(**prefix, **{f'{name}__{lookup}': key[position]})
+        return condition
+
+    def paginate_keyset(self, request, fetch, key_func, model=None):
+        """
+        Paginate an arbitrary keyset source.
+
+        ``fetch(after, limit)`` must return up to ``limit`` items sorted by
+        ``self.ordering`` that come strictly after the ``after`` key (or from
+        the start when it is None). ``key_func(item)`` returns an item's key.
+        """
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        after = self.decode_cursor(request, model)
+        items = list(fetch(after, self.page_size_value + 1))
+        self.has_next = len(items) > self.page_size_value
+        page = items[:self.page_size_value]
+        self.next_key = key_func(page[-1]) if self.has_next else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+
+        after = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        if after is not None:
+            queryset = queryset.filter(self.seek_filter(after))
+
+        items = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(items) > self.page_size_value
+        page = items[:self.page_size_value]
+        if self.has_next:
+            last = page[-1]
+            self.next_key = tuple(getattr(last, field) for field in self.key_fields)
+        else:
+            self.next_key = None
+        return page
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_key))
+
+    def get_paginated_response(self, data):
+        headers = {}
+        if self.next_key is not None:
+            headers['X-Next-Cursor'] = self.encode_cursor(self.next_key)
+            headers['Link'] = f'<{self.get_next_link()}>; rel="next"'
+        return Response(data, headers=headers)
+
+    def get_paginated_response_schema(self, schema):
+        return schema
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """
+    Message history around a position, returned oldest to newest.
+
+    Without parameters the newest page is returned. ``?before=<cursor>``
+    pages back in time, ``?after=<cursor>`` forward and ``?around=<message
+    id>`` returns a page centred on that message. The cursors for the
+    neighbouring pages are sent in ``X-Before-Cursor`` and ``X-After-Cursor``;
+    ``cursor`` and ``X-Next-Cursor`` remain aliases for ``before``.
+    """
+    ordering = ('-timestamp', '-id')
+    before_query_param = 'before'
+    after_query_param = 'after'
+    around_query_param = 'around'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = size = self.get_page_size(request)
+        params = request.query_params
+        older_ordering, newer_ordering = self.ordering, ('timestamp', 'id')
+
+        # The redundant timestamp bound lets SQLite seek into
+        # messaging_message_history_idx instead of scanning from one end
+        def older(key, limit):
+            rows = queryset.order_by(*older_ordering)
+            if key is not None:
+                rows = rows.filter(self.seek_filter(key, older_ordering), timestamp__lte=key[0])
+            return list(rows[:limit])
+
+        def newer(key, limit):
+            rows = queryset.order_by(*newer_ordering)
+            rows = rows.filter(self.seek_filter(key, newer_ordering), timestamp__gte=key[0])
+            return list(rows[:limit])
+
+        if params.get(self.around_query_param):
+            try:
+                anchor = queryset.get(pk=int(params[self.around_query_param]))
+            except (ValueError, queryset.model.DoesNotExist):
+                raise NotFound('Message not found')
+            key = (anchor.timestamp, anchor.id)
+            before = older(key, size // 2 + 1)
+            after = newer(key, size - size // 2)
+            self.has_older = len(before) > size // 2
+            self.has_newer = len(after) > size - size // 2 - 1
+            page = before[:size // 2][::-1] + [anchor] + after[:size - size // 2 - 1]
+        elif params.get(self.after_query_param):
+            key = self.decode_cursor(request, queryset.model, self.after_query_param)
+            items = newer(key, size + 1)
+            self.has_older, self.has_newer = True, len(items) > size
+            page = items[:size]
+        else:
+            key = self.decode_cursor(request, queryset.model, self.before_query_param)
+            if key is None:
+                key = self.decode_cursor(request, queryset.model)
+            items = older(key, size + 1)
+            self.has_older, self.has_newer = len(items) > size, key is not None
+            page = items[:size][::-1]
+
+        self.before_key = (page[0].timestamp, page[0].id) if page and self.has_older else None
+        self.after_key = (page[-1].timestamp, page[-1].id) if page and self.has_newer else None
+        self.next_key = self.before_key
+        return page
+
+    def get_paginated_response(self, data):
+        headers = {}
+        url = self.request.build_absolute_uri()
+        links = []
+        if self.before_key is not None:
+            cursor = self.encode_cursor(self.before_key)
+            headers['X-Before-Cursor'] = headers['X-Next-Cursor'] = cursor
+            links.append(f'<{self._link(url, self.before_query_param, cursor)}>; rel="next"')
+        if self.after_key is not None:
+            cursor = self.encode_cursor(self.after_key)
+            headers['X-After-Cursor'] = cursor
+            links.append(f'<{self._link(url, self.after_query_param, cursor)}>; rel="prev"')
+        if links:
+            headers['Link'] = ', '.join(links)
+        return Response(data, headers=headers)
+
+    def _link(self, url, param, cursor):
+        for other in (self.cursor_query_param, self.before_query_param, self.after_query_param, self.around_query_param):
+            url = remove_query_param(url, other)
+        return replace_query_param(url, param, cursor)
+
+
+class InboxKeysetPagination(KeysetPagination):
+    ordering = ('-last_activity_at', '-id')
+
+
+class CommentKeysetPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+
+class CommentThreadKeysetPagination(KeysetPagination):
+    ordering = ('path',)
+
+
+class DirectoryKeysetPagination(KeysetPagination):
+    ordering = ('id',)
@@ -174,20 +174,76 @@ CORS_ALLOW_HEADERS = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Change this to IsAuthenticated after testing
     ],
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 # Channel layers configuration
+# Shared by every ASGI worker on this machine (see messaging/channel_layer.py)
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+        "BACKEND": "messaging.channel_layer.SQLiteChannelLayer",
+        "CONFIG": {
+            "path": os.getenv('CHANNEL_LAYER_PATH', str(BASE_DIR / 'channels.sqlite3')),
+            "capacity": 100,
+            "expiry": 60,
+            "group_expiry": 86400,
+        },
     }
 }
 
+# Caches; "shared" is seen by every worker on this machine
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv('SHARED_CACHE_PATH', str(BASE_DIR / 'cache')),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+# Liked-post sets (see posts/likes.py); must be a cache shared by all workers
+LIKED_POSTS_CACHE = 'shared'
+# Carries follow changes and rebuild_follow_graph's reload request to every worker (see users/follow_graph.py)
+FOLLOW_GRAPH_CACHE = 'shared'
+# Carries connection changes to every worker's connection cache (see users/connections.py)
+CONNECTION_CACHE_SIGNAL_CACHE = 'shared'
+# Network page batch-mate snapshots (see users/directory.py)
+NETWORK_COHORT_CACHE = 'shared'
+
+# Chat message group commit (see messaging/writer.py)
+MESSAGE_WRITER_DELAY_SECONDS = 0.005
+MESSAGE_WRITER_MAX_BATCH = 200
+
+# Home timeline settings (see posts/timeline.py)
+TIMELINE_MAX_LENGTH = 500
+TIMELINE_FANOUT_THRESHOLD = 1000
+
+# Seconds between flushes of buffered post views (0 writes on every view)
+VIEW_COUNT_FLUSH_INTERVAL = 5
+
+# Trending posts (see posts/trending.py)
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_TOP_N = 15
+
+# Seconds a JWT-authenticated user is served from the per-process cache
+AUTH_USER_CACHE_SECONDS = 30
+
+# Google sign-in (see users/google.py): ID tokens must be issued for one of these clients
+GOOGLE_CLIENT_IDS = os.getenv(
+    'GOOGLE_CLIENT_IDS', '1009859219635-jpmqpp4hvpuj2j85vjn7g700pvpbcb3d.apps.googleusercontent.com'
+).split(',')
+GOOGLE_CERTS_URL = os.getenv('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+# Fallback lifetime of the cached key set when Google sends no max-age
+GOOGLE_CERTS_CACHE_SECONDS = 3600
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -204,6 +260,18 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'sanjayr1110@gmail.com'  # Replace with your Gmail
 EMAIL_HOST_PASSWORD = 'xamk mtgv hdtt qpyg'  # Replace with your app password
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = 10
+
+# Email outbox (see users/outbox.py); run manage.py send_outbox_emails to deliver
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_OUTBOX_KEEP_SENT_DAYS = 7
+EMAIL_OUTBOX_KEEP_DEAD_DAYS = 30
+
+# Lifetimes of single-use account tokens (see users/tokens.py); run
+# manage.py sweep_expired_tokens periodically to delete expired ones
+PASSWORD_RESET_TOKEN_SECONDS = 3600
+ACTIVATION_TOKEN_SECONDS = 3 * 24 * 3600
 
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
@@ -229,6 +297,9 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Let the frontend read pagination cursors (see backend/pagination.py)
+CORS_EXPOSE_HEADERS = ['Link', 'X-Next-Cursor']
+
 # Allow WebSocket connections
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,18 @@
+"""
+Shared helpers for the apps' test suites.
+"""
+from django.test import override_settings
+
+# Test classes run against in-memory caches, so they never read or wipe the
+# on-disk ``shared`` cache of a running server, whose keys (post and user
+# ids) would collide with the test database's
+isolated_caches = override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-default',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-shared',
+    },
+})
@@ -0,0 +1,362 @@
+"""
+A channel layer shared by every ASGI process on one machine.
+
+``InMemoryChannelLayer`` only reaches sockets held by the same process, so
+a ``group_send`` to ``chat_user_<id>`` is lost when that user's socket
+lives in another worker. ``SQLiteChannelLayer`` keeps queued messages and
+group memberships in a local SQLite file in WAL mode, which every worker
+opens:
+
+- ``send`` inserts a row, refusing with ``ChannelFull`` once the channel
+  holds its capacity (``capacity``, or the first matching
+  ``channel_capacity`` pattern).
+- ``group_send`` inserts one row per member in a single transaction,
+  skipping full channels like the other layers do.
+- Each process names its channels ``<prefix><client id>!<suffix>``, so one
+  poller task per process collects the rows of all of its sockets with one
+  ``DELETE ... RETURNING`` over that name range and hands them to
+  in-memory queues. The poller backs off from ``poll_interval`` to
+  ``max_poll_interval`` while idle. Messages between channels of the same
+  process skip the database.
+- Messages expire after ``expiry`` seconds and memberships after
+  ``group_expiry``. A channel with an expired message is treated as gone
+  and dropped from its groups, as the in-memory layer does.
+
+All database work runs on one thread per process. ``manage.py
+benchmark_channel_layer`` measures throughput and latency across worker
+processes.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import sqlite3
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_channel_idx ON channel_messages (channel, id);
+CREATE INDEX IF NOT EXISTS channel_messages_expires_idx ON channel_messages (expires);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    grp TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (grp, channel)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS channel_groups_channel_idx ON channel_groups (channel);
+"""
+
+# Seconds between sweeps of expired messages and memberships
+CLEANUP_INTERVAL = 1.0
+
+
+def _encode(message):
+    # JSON with bytes (e.g. binary websocket frames) wrapped as base64
+    def default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'__bytes__': base64.b64encode(value).decode()}
+        raise TypeError(f'Cannot send {type(value).__name__} over the channel layer')
+    return json.dumps(message, default=default, separators=(',', ':'))
+
+
+def _decode_hook(value):
+    if len(value) == 1 and '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def _decode(body):
+    return json.loads(body, object_hook=_decode_hook)
+
+
+def _random_name(length=12):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        path='channels.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.001,
+        max_poll_interval=0.02,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._reset()
+
+    def _reset(self):
+        # Everything here belongs to one process; a forked child starts over
+        self._pid = os.getpid()
+        self.client_id = _random_name()
+        self._db = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='channel-layer')
+        self._local_prefixes = set()
+        self._queues = {}  # local channel -> asyncio.Queue of (expires, message)
+        self._receivers = 0
+        self._poller = None
+        self._last_cleanup = 0.0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    # Database side, always on the executor thread
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, isolation_level=None, timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # Messages are ephemeral; losing the tail on power loss is fine
+            self._db.execute('PRAGMA synchronous=OFF')
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def _run(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _cleanup(self, db, now):
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        db.execute(
+            'DELETE FROM channel_groups WHERE channel IN '
+            '(SELECT DISTINCT channel FROM channel_messages WHERE expires <= ?)',
+            (now,),
+        )
+        db.execute('DELETE FROM channel_messages WHERE expires <= ?', (now,))
+        db.execute('DELETE FROM channel_groups WHERE expires <= ?', (now,))
+
+    def _insert(self, db, now, channels, body):
+        """Queue ``body`` on every channel that has room; returns the full ones"""
+        if not channels:
+            return []
+        placeholders = ','.join('?' * len(channels))
+        depth = dict(db.execute(
+            f'SELECT channel, COUNT(*) FROM channel_messages '
+            f'WHERE channel IN ({placeholders}) AND expires > ? GROUP BY channel',
+            (*channels, now),
+        ))
+        full = [channel for channel in channels if depth.get(channel, 0) >= self.get_capacity(channel)]
+        rows = [(channel, now + self.expiry, body) for channel in channels if channel not in full]
+        db.executemany('INSERT INTO channel_messages (channel, expires, body) VALUES (?, ?, ?)', rows)
+        return full
+
+    def _db_send(self, channel, body):
+        db = self._connection()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            full = self._insert(db, now, [channel], body)
+            self._cleanup(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return not full
+
+    def _db_group_send(self, group, body):
+        """Queue ``body`` for the group's remote members; returns its local members"""
+        db = self._connection()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            members = [
+                row[0] for row in
+                db.execute('SELECT channel FROM channel_groups WHERE grp = ? AND expires > ?', (group, now))
+            ]
+            local = [channel for channel in members if self._is_local(channel)]
+            remote = [channel for channel in members if not self._is_local(channel)]
+            self._insert(db, now, remote, body)
+            self._cleanup(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return local
+
+    def _db_pop(self, channel):
+        db = self._connection()
+        row = db.execute(
+            'DELETE FROM channel_messages WHERE id = '
+            '(SELECT id FROM channel_messages WHERE channel = ? AND expires > ? ORDER BY id LIMIT 1) '
+            'RETURNING body',
+            (channel, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _db_pop_local(self, prefixes):
+        db = self._connection()
+        now = time.time()
+        rows = []
+        for prefix in prefixes:
+            # Every channel named "<prefix>...": "!" + 1 is '"'
+            rows.extend(db.execute(
+                'DELETE FROM channel_messages WHERE channel >= ? AND channel < ? AND expires > ? '
+                'RETURNING id, channel, expires, body',
+                (prefix, prefix[:-1] + '"', now),
+            ))
+        rows.sort()
+        return rows
+
+    def _db_group_add(self, group, channel):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO channel_groups (grp, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry),
+        )
+
+    def _db_group_discard(self, group, channel):
+        self._connection().execute('DELETE FROM channel_groups WHERE grp = ? AND channel = ?', (group, channel))
+
+    def _db_flush(self):
+        db = self._connection()
+        db.execute('DELETE FROM channel_messages')
+        db.execute('DELETE FROM channel_groups')
+
+    # Process-local delivery
+
+    def _is_local(self, channel):
+        return '!' in channel and channel.split('!', 1)[0].endswith(self.client_id)
+
+    def _queue(self, channel):
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _deliver(self, channel, expires, message):
+        try:
+            self._queue(channel).put_nowait((expires, message))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def _drop_expired(self):
+        now = time.time()
+        for channel, queue in list(self._queues.items()):
+            while not queue.empty() and queue._queue[0][0] <= now:
+                queue.get_nowait()
+            if queue.empty() and not queue._getters:
+                del self._queues[channel]
+
+    async def _poll(self):
+        delay = self.poll_interval
+        while self._receivers:
+            rows = await self._run(self._db_pop_local, tuple(self._local_prefixes))
+            for _, channel, expires, body in rows:
+                self._deliver(channel, expires, _decode(body))
+            if rows:
+                delay = self.poll_interval
+            else:
+                self._drop_expired()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not asyncio.get_running_loop():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        self._check_pid()
+
+        if self._is_local(channel):
+            if not self._deliver(channel, time.time() + self.expiry, _decode(_encode(message))):
+                raise ChannelFull(channel)
+            return
+        if not await self._run(self._db_send, channel, _encode(message)):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._check_pid()
+
+        if not self._is_local(channel):
+            # A general channel; any process may consume it
+            delay = self.poll_interval
+            while True:
+                body = await self._run(self._db_pop, channel)
+                if body is not None:
+                    return _decode(body)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+        self._local_prefixes.add(channel.split('!', 1)[0] + '!')
+        queue = self._queue(channel)
+        self._receivers += 1
+        try:
+            self._ensure_poller()
+            while True:
+                expires, message = await queue.get()
+                if expires > time.time():
+                    return message
+        finally:
+            self._receivers -= 1
+
+    async def new_channel(self, prefix='specific.'):
+        self._check_pid()
+        return f'{prefix}{self.client_id}!{_random_name()}'
+
+    async def flush(self):
+        self._check_pid()
+        self._queues = {}
+        await self._run(self._db_flush)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._check_pid()
+        await self._run(self._db_group_add, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        self._check_pid()
+        await self._run(self._db_group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        self._check_pid()
+
+        body = _encode(message)
+        local = await self._run(self._db_group_send, group, body)
+        expires = time.time() + self.expiry
+        for channel in local:
+            # Full channels are skipped, as with the other layers
+            self._deliver(channel, expires, _decode(body))
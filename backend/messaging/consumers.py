@@ -4,9 +4,9 @@ from channels.db import database_sync_to_async
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from .models import Message, Conversation
-from django.utils import timezone
 from django.db.models import Q
-from users.models import Connection
+from users.connections import are_connected, connection_cache
+from .writer import message_writer
 
 User = get_user_model()
 
@@ -16,6 +16,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_name = f"user_{self.user_id}"
         self.room_group_name = f"chat_{self.room_name}"
         self.user = None
+        # recipient id -> conversation id, looked up once per socket
+        self.conversation_ids = {}
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -152,26 +154,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except User.DoesNotExist:
             return None
             
-    @database_sync_to_async
-    def check_connection(self, sender_id, recipient_id):
-        return Connection.objects.filter(
-            (Q(sender_id=sender_id, receiver_id=recipient_id) | 
-             Q(sender_id=recipient_id, receiver_id=sender_id)),
-            status='ACCEPTED'
-        ).exists()
+    async def check_connection(self, sender_id, recipient_id):
+        # A cache hit needs no trip to the database thread
+        connected = connection_cache.peek(sender_id, recipient_id)
+        if connected is None:
+            connected = await database_sync_to_async(are_connected)(sender_id, recipient_id)
+        return connected
 
-    @database_sync_to_async
-    def save_message(self, sender_id, recipient_id, content, message_type='text', media_url=None, media_type=None):
-        conversation = Conversation.objects.get_or_create_conversation(sender_id, recipient_id)
-        message = Message.objects.create(
-            conversation=conversation,
+    async def save_message(self, sender_id, recipient_id, content, message_type='text', media_url=None, media_type=None):
+        conversation_id = self.conversation_ids.get(str(recipient_id))
+        if conversation_id is None:
+            conversation = await database_sync_to_async(Conversation.objects.get_or_create_conversation)(
+                sender_id, recipient_id
+            )
+            conversation_id = self.conversation_ids[str(recipient_id)] = conversation.id
+        # Committed together with other sockets' messages; returns after the commit
+        return await message_writer.write(Message(
+            conversation_id=conversation_id,
             sender_id=sender_id,
             receiver_id=recipient_id,
             content=content,
             message_type=message_type,
             media_type=media_type or ''
-        )
-        # Update conversation timestamp
-        conversation.updated_at = timezone.now()
-        conversation.save()
-        return message 
\ No newline at end of file
+        ))
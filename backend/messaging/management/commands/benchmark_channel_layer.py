@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from messaging.channel_layer import SQLiteChannelLayer
+
+GROUP = 'benchmark'
+IDLE_TIMEOUT = 10
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _worker(path, capacity, messages, ready, results):
+    async def run():
+        layer = SQLiteChannelLayer(path=path, capacity=capacity)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.put(os.getpid())
+        latencies, last_at = [], None
+        while len(latencies) < messages:
+            try:
+                message = await asyncio.wait_for(layer.receive(channel), IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            last_at = time.time()
+            latencies.append(last_at - message['sent'])
+            if message['n'] == messages - 1:
+                break
+        await layer.close()
+        results.put((latencies, last_at))
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Measure SQLiteChannelLayer group_send throughput and latency across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Receiving processes, one channel each')
+        parser.add_argument('--messages', type=int, default=2000, help='Messages sent to the group')
+        parser.add_argument('--rate', type=float, default=0, help='Messages per second to send (0: unthrottled)')
+        parser.add_argument('--path', help='SQLite file to use (default: a temporary file)')
+
+    def handle(self, *args, **options):
+        workers, messages, rate = options['workers'], options['messages'], options['rate']
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['path'] or os.path.join(directory, 'channels.sqlite3')
+            context = multiprocessing.get_context('fork')
+            ready, results = context.Queue(), context.Queue()
+            # Every message fits, so the run measures the layer rather than drops
+            processes = [
+                context.Process(target=_worker, args=(path, messages, messages, ready, results))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                ready.get()
+
+            started, send_seconds = asyncio.run(self.send(path, messages, rate))
+            outcomes = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+        latencies = [latency for outcome, _ in outcomes for latency in outcome]
+        finished = max((last_at for _, last_at in outcomes if last_at), default=started)
+        expected = workers * messages
+        elapsed = max(finished - started, 1e-9)
+
+        self.stdout.write(f'{workers} workers x {messages} messages, sent in {send_seconds:.3f}s '
+                          f'({messages / max(send_seconds, 1e-9):,.0f} group sends/s)')
+        self.stdout.write(f'delivered {len(latencies)}/{expected} in {elapsed:.3f}s '
+                          f'({len(latencies) / elapsed:,.0f} messages/s)')
+        if latencies:
+            self.stdout.write('latency ms: p50 {:.2f}  p95 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+                *(1000 * _percentile(latencies, fraction) for fraction in (0.5, 0.95, 0.99)),
+                1000 * max(latencies),
+            ))
+
+    async def send(self, path, messages, rate):
+        layer = SQLiteChannelLayer(path=path, capacity=messages)
+        interval = 1 / rate if rate else 0
+        started = time.time()
+        for n in range(messages):
+            await layer.group_send(GROUP, {'type': 'benchmark', 'n': n, 'sent': time.time()})
+            if interval:
+                await asyncio.sleep(max(started + (n + 1) * interval - time.time(), 0))
+        send_seconds = time.time() - started
+        await layer.close()
+        return started, send_seconds
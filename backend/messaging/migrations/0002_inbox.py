@@ -0,0 +1,65 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox(apps, schema_editor):
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    InboxEntry = apps.get_model('messaging', 'InboxEntry')
+
+    entries = []
+    for conversation in Conversation.objects.prefetch_related('participants').iterator(chunk_size=500):
+        participant_ids = [user.id for user in conversation.participants.all()]
+        last = Message.objects.filter(conversation=conversation).order_by('-timestamp', '-id').first()
+        for user_id in participant_ids:
+            others = [other_id for other_id in participant_ids if other_id != user_id]
+            entries.append(InboxEntry(
+                user_id=user_id,
+                conversation=conversation,
+                other_user_id=others[0] if others else None,
+                last_message=last,
+                last_message_sender_id=last.sender_id if last else None,
+                last_message_content=last.content if last else '',
+                last_message_type=last.message_type if last else '',
+                last_message_media=last.media_file.name if last and last.media_file else None,
+                last_message_is_read=last.is_read if last else False,
+                last_activity_at=last.timestamp if last else conversation.created_at,
+                unread_count=Message.objects.filter(conversation=conversation, is_read=False).exclude(sender_id=user_id).count(),
+            ))
+    InboxEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_content', models.TextField(blank=True, default='')),
+                ('last_message_type', models.CharField(blank=True, choices=[('text', 'Text'), ('image', 'Image'), ('video', 'Video'), ('gif', 'GIF'), ('file', 'File')], default='', max_length=10)),
+                ('last_message_media', models.FileField(blank=True, null=True, upload_to='messages/media/')),
+                ('last_message_is_read', models.BooleanField(default=False)),
+                ('last_activity_at', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='messaging.conversation')),
+                ('last_message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message')),
+                ('last_message_sender', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('other_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_activity_at', '-id'], name='messaging_inbox_activity_idx')],
+                'unique_together': {('user', 'conversation')},
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_seq_and_watermarks(apps, schema_editor):
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    InboxEntry = apps.get_model('messaging', 'InboxEntry')
+
+    for conversation in Conversation.objects.iterator(chunk_size=500):
+        messages = list(Message.objects.filter(conversation=conversation).order_by('timestamp', 'id'))
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        Message.objects.bulk_update(messages, ['seq'], batch_size=500)
+        Conversation.objects.filter(pk=conversation.pk).update(last_seq=len(messages))
+
+        entries = list(InboxEntry.objects.filter(conversation=conversation))
+        for entry in entries:
+            # Read up to just before the first unread message from someone else
+            first_unread = next(
+                (message.seq for message in messages if message.sender_id != entry.user_id and not message.is_read),
+                len(messages) + 1,
+            )
+            entry.last_message_seq = len(messages)
+            entry.last_read_seq = first_unread - 1
+        InboxEntry.objects.bulk_update(entries, ['last_message_seq', 'last_read_seq'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_message_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_message_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_read_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_seq_and_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='inboxentry',
+            name='last_message_is_read',
+        ),
+        migrations.RemoveField(
+            model_name='inboxentry',
+            name='unread_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('conversation', 'seq'), name='messaging_message_seq_unique'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Least
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -12,15 +15,33 @@ class ConversationManager(models.Manager):
         ).first()
         
         if not conversation:
-            conversation = self.create()
-            conversation.participants.add(user1_id, user2_id)
+            with transaction.atomic():
+                conversation = self.create()
+                conversation.participants.add(user1_id, user2_id)
+                InboxEntry.objects.bulk_create([
+                    InboxEntry(
+                        user_id=user_id,
+                        conversation=conversation,
+                        other_user_id=other_id,
+                        last_activity_at=conversation.created_at,
+                    )
+                    for user_id, other_id in ((user1_id, user2_id), (user2_id, user1_id))
+                ])
         
         return conversation
 
+    def allocate_seq(self, conversation_id, count=1):
+        """Reserve the next ``count`` message sequence numbers; returns the last one"""
+        # The UPDATE takes the row (SQLite: database) write lock until commit
+        self.filter(pk=conversation_id).update(last_seq=F('last_seq') + count, updated_at=timezone.now())
+        return self.filter(pk=conversation_id).values_list('last_seq', flat=True).get()
+
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Sequence number of the newest message
+    last_seq = models.PositiveIntegerField(default=0)
 
     objects = ConversationManager()
 
@@ -59,21 +80,143 @@ class Message(models.Model):
     media_file = models.FileField(upload_to='messages/media/', null=True, blank=True)
     media_type = models.CharField(max_length=50, blank=True)  # For MIME type
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    # Position in the conversation, 1, 2, 3, ...; compared with read watermarks
+    seq = models.PositiveIntegerField(null=True, editable=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Seeks through a conversation's history in either direction
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='messaging_message_history_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='messaging_message_seq_unique'),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.receiver and not self.conversation:
-            self.conversation = Conversation.objects.get_or_create_conversation(
-                self.sender.id,
-                self.receiver.id
-            )
-        super().save(*args, **kwargs)
+        creating = self._state.adding
+        with transaction.atomic():
+            if self.receiver and not self.conversation:
+                self.conversation = Conversation.objects.get_or_create_conversation(
+                    self.sender.id,
+                    self.receiver.id
+                )
+            if creating and self.conversation_id and self.seq is None:
+                self.seq = Conversation.objects.allocate_seq(self.conversation_id)
+            super().save(*args, **kwargs)
+            # Inbox rows change in the same transaction as the message
+            if creating and self.conversation_id:
+                InboxEntry.objects.record_message(self)
 
     def __str__(self):
         if self.conversation:
             other_user = self.conversation.get_other_participant(self.sender)
             return f"{self.sender.username} -> {other_user.username}: {self.content[:50]}"
         return f"Message from {self.sender.username}: {self.content[:50]}"
+
+
+class InboxEntryManager(models.Manager):
+    def record_message(self, message):
+        """Move ``message`` to the top of both participants' inboxes"""
+        sender_id = message.sender_id
+        receiver_id = message.receiver_id
+        if receiver_id is None:
+            receiver_id = (
+                message.conversation.participants.exclude(id=sender_id).values_list('id', flat=True).first()
+            )
+        snapshot = {
+            'last_message_id': message.id,
+            'last_message_seq': message.seq,
+            'last_message_sender_id': sender_id,
+            'last_message_content': message.content,
+            'last_message_type': message.message_type,
+            'last_message_media': message.media_file.name if message.media_file else None,
+            'last_activity_at': message.timestamp,
+        }
+        # Senders have read their own message and everything before it
+        participants = [(sender_id, receiver_id, {'last_read_seq': message.seq})]
+        if receiver_id is not None:
+            participants.append((receiver_id, sender_id, {}))
+        for user_id, other_id, watermark in participants:
+            updated = self.filter(user_id=user_id, conversation_id=message.conversation_id).update(
+                **snapshot, **watermark
+            )
+            if not updated:
+                self.create(
+                    user_id=user_id,
+                    conversation_id=message.conversation_id,
+                    other_user_id=other_id,
+                    **snapshot,
+                    **watermark
+                )
+
+    def mark_read(self, user_id, conversation_id, up_to_seq=None):
+        """
+        Move ``user_id``'s read watermark up to ``up_to_seq``, or the newest
+        message; one row update. It never moves down.
+        """
+        if up_to_seq is None:
+            self.filter(
+                user_id=user_id, conversation_id=conversation_id, last_read_seq__lt=F('last_message_seq')
+            ).update(last_read_seq=F('last_message_seq'))
+        else:
+            self.filter(
+                user_id=user_id, conversation_id=conversation_id, last_read_seq__lt=up_to_seq
+            ).update(last_read_seq=Least(up_to_seq, F('last_message_seq')))
+
+    def inbox(self, user):
+        """``user``'s inbox rows with the other participant and their watermark"""
+        other_watermark = self.filter(
+            conversation_id=OuterRef('conversation_id'), user_id=OuterRef('other_user_id')
+        ).values('last_read_seq')[:1]
+        return (
+            self.filter(user=user)
+            .select_related('other_user')
+            .annotate(other_last_read_seq=Subquery(other_watermark))
+        )
+
+
+class InboxEntry(models.Model):
+    """
+    One row per conversation per participant, kept up to date as messages
+    are saved, so an inbox page is a single indexed query.
+
+    ``last_read_seq`` is the participant's read watermark: every message
+    with ``seq`` up to it has been read, so the unread count is
+    ``last_message_seq - last_read_seq`` and reading the conversation is a
+    single row update.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_entries')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='inbox_entries')
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', null=True)
+    # Snapshot of the newest message
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, related_name='+', null=True)
+    last_message_seq = models.PositiveIntegerField(default=0)
+    last_message_sender = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    last_message_content = models.TextField(blank=True, default='')
+    last_message_type = models.CharField(max_length=10, choices=Message.MESSAGE_TYPES, blank=True, default='')
+    last_message_media = models.FileField(upload_to='messages/media/', null=True, blank=True)
+    last_activity_at = models.DateTimeField()
+    last_read_seq = models.PositiveIntegerField(default=0)
+
+    objects = InboxEntryManager()
+
+    class Meta:
+        unique_together = ['user', 'conversation']
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at', '-id'], name='messaging_inbox_activity_idx'),
+        ]
+
+    @property
+    def unread_count(self):
+        return max(self.last_message_seq - self.last_read_seq, 0)
+
+    @property
+    def last_message_is_read(self):
+        """Whether the newest message has been read by its recipient"""
+        if self.last_message_sender_id == self.user_id:
+            return (getattr(self, 'other_last_read_seq', None) or 0) >= self.last_message_seq
+        return self.last_read_seq >= self.last_message_seq
+
+    def __str__(self):
+        return f"Conversation {self.conversation_id} in {self.user_id}'s inbox"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Message, Conversation
+from .models import Message, InboxEntry
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -17,8 +17,10 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
 class MessageSerializer(serializers.ModelSerializer):
+    """``is_read`` needs the participants' watermarks as ``read_watermarks`` in the context"""
     is_sent_by_me = serializers.SerializerMethodField()
     media_url = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
@@ -30,6 +32,13 @@ class MessageSerializer(serializers.ModelSerializer):
             return obj.sender_id == request.user.id
         return False
 
+    def get_is_read(self, obj):
+        # Read once the recipient's watermark has reached the message
+        watermarks = self.context.get('read_watermarks', {})
+        return obj.seq is not None and any(
+            seq >= obj.seq for user_id, seq in watermarks.items() if user_id != obj.sender_id
+        )
+
     def get_media_url(self, obj):
         if obj.media_file:
             request = self.context.get('request')
@@ -38,28 +47,23 @@ class MessageSerializer(serializers.ModelSerializer):
         return None
 
 class ConversationSerializer(serializers.ModelSerializer):
-    other_user = serializers.SerializerMethodField()
+    """A conversation as listed in the inbox; expects ``other_user`` loaded with select_related"""
+    id = serializers.IntegerField(source='conversation_id')
+    other_user = UserSerializer()
     last_message = serializers.SerializerMethodField()
-    
+
     class Meta:
-        model = Conversation
-        fields = ['id', 'other_user', 'last_message']
-    
-    def get_other_user(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user'):
-            other_user = obj.get_other_participant(request.user)
-            return UserSerializer(other_user).data
-        return None
-    
+        model = InboxEntry
+        fields = ['id', 'other_user', 'last_message', 'unread_count']
+
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
-        if last_message:
-            return {
-                'content': last_message.content,
-                'message_type': last_message.message_type,
-                'media_url': self.context['request'].build_absolute_uri(last_message.media_file.url) if last_message.media_file else None,
-                'timestamp': last_message.timestamp,
-                'is_read': last_message.is_read
-            }
-        return None 
\ No newline at end of file
+        if obj.last_message_id is None:
+            return None
+        request = self.context.get('request')
+        return {
+            'content': obj.last_message_content,
+            'message_type': obj.last_message_type,
+            'media_url': request.build_absolute_uri(obj.last_message_media.url) if request and obj.last_message_media else None,
+            'timestamp': obj.last_activity_at,
+            'is_read': obj.last_message_is_read
+        }
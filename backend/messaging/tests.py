@@ -1,3 +1,281 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.testing import isolated_caches
+from users.models import Connection
+from .channel_layer import SQLiteChannelLayer
+from .models import Conversation, InboxEntry, Message
+from .writer import MessageWriter
+
+User = get_user_model()
+
+
+@isolated_caches
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_contact(self, index):
+        contact = User.objects.create_user(username=f'contact{index}', email=f'contact{index}@example.com', password='pass')
+        Connection.objects.create(sender=self.user, receiver=contact, status='ACCEPTED')
+        return contact
+
+    def send(self, sender, receiver, content):
+        return Message.objects.create(sender=sender, receiver=receiver, content=content)
+
+    def test_inbox_is_one_query_ordered_by_activity(self):
+        contacts = [self.create_contact(i) for i in range(5)]
+        for contact in contacts:
+            self.send(contact, self.user, f'Hi from {contact.username}')
+        self.send(self.user, contacts[0], 'Latest')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/messaging/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        self.assertEqual(
+            [entry['other_user']['id'] for entry in response.data],
+            [contacts[0].id] + [contact.id for contact in reversed(contacts[1:])],
+        )
+        self.assertEqual(response.data[0]['last_message']['content'], 'Latest')
+        # Replying to contacts[0] read their message
+        self.assertEqual([entry['unread_count'] for entry in response.data], [0, 1, 1, 1, 1])
+
+    def test_inbox_is_paginated(self):
+        for i in range(3):
+            self.send(self.create_contact(i), self.user, 'Hi')
+        response = self.client.get('/api/messaging/conversations/', {'page_size': 2})
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get('/api/messaging/conversations/', {'page_size': 2, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual(len(response.data), 1)
+
+    def test_reading_a_conversation_clears_unread_count(self):
+        contact = self.create_contact(0)
+        self.send(contact, self.user, 'One')
+        self.send(contact, self.user, 'Two')
+        conversation = Conversation.objects.get()
+        self.assertEqual(InboxEntry.objects.get(user=self.user).unread_count, 2)
+        self.assertEqual(InboxEntry.objects.get(user=contact, conversation=conversation).unread_count, 0)
+
+        response = self.client.get(f'/api/messaging/messages/{contact.id}/')
+        self.assertEqual([message['is_read'] for message in response.data], [False, False])
+        entries = InboxEntry.objects.filter(conversation=conversation)
+        self.assertEqual([entry.unread_count for entry in entries], [0, 0])
+
+        response = self.client.get(f'/api/messaging/messages/{contact.id}/')
+        self.assertEqual([message['is_read'] for message in response.data], [True, True])
+        contact_client = APIClient()
+        contact_client.force_authenticate(contact)
+        response = contact_client.get('/api/messaging/conversations/')
+        self.assertTrue(response.data[0]['last_message']['is_read'])
+
+    def test_reply_marks_earlier_messages_read(self):
+        contact = self.create_contact(0)
+        self.send(contact, self.user, 'Question')
+        reply = self.send(self.user, contact, 'Answer')
+        entry = InboxEntry.objects.get(user=self.user)
+        self.assertEqual((entry.last_message_seq, entry.last_read_seq, entry.unread_count), (2, 2, 0))
+        self.assertEqual(reply.seq, 2)
+        self.assertEqual(InboxEntry.objects.get(user=contact).unread_count, 1)
+
+
+@isolated_caches
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+        self.contact = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        Connection.objects.create(sender=self.user, receiver=self.contact, status='ACCEPTED')
+        self.messages = [
+            Message.objects.create(sender=self.contact, receiver=self.user, content=f'Message {i}')
+            for i in range(25)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/messaging/messages/{self.contact.id}/'
+
+    def contents(self, response):
+        return [message['content'] for message in response.data]
+
+    def test_newest_page_then_scroll_back(self):
+        response = self.client.get(self.url, {'page_size': 10})
+        self.assertEqual(self.contents(response), [f'Message {i}' for i in range(15, 25)])
+        self.assertNotIn('X-After-Cursor', response)
+
+        response = self.client.get(self.url, {'page_size': 10, 'before': response['X-Before-Cursor']})
+        self.assertEqual(self.contents(response), [f'Message {i}' for i in range(5, 15)])
+
+        response = self.client.get(self.url, {'page_size': 10, 'before': response['X-Before-Cursor']})
+        self.assertEqual(self.contents(response), [f'Message {i}' for i in range(5)])
+        self.assertNotIn('X-Before-Cursor', response)
+
+        response = self.client.get(self.url, {'page_size': 10, 'after': response['X-After-Cursor']})
+        self.assertEqual(self.contents(response), [f'Message {i}' for i in range(5, 15)])
+
+    def test_around_centres_on_message(self):
+        response = self.client.get(self.url, {'page_size': 6, 'around': self.messages[10].id})
+        self.assertEqual(self.contents(response), [f'Message {i}' for i in range(7, 13)])
+        self.assertIn('X-Before-Cursor', response)
+        self.assertIn('X-After-Cursor', response)
+
+        response = self.client.get(self.url, {'around': 0})
+        self.assertEqual(response.status_code, 404)
+
+    def test_history_pages_only_mark_shown_messages_read(self):
+        entry = InboxEntry.objects.get(user=self.user)
+        self.assertEqual(entry.unread_count, 25)
+
+        # Opened at an old message: read up to the newest one shown
+        response = self.client.get(self.url, {'page_size': 5, 'around': self.messages[10].id})
+        shown = Message.objects.filter(content__in=self.contents(response))
+        entry.refresh_from_db()
+        self.assertEqual(entry.last_read_seq, max(message.seq for message in shown))
+        self.assertEqual(entry.unread_count, 25 - entry.last_read_seq)
+
+        # Scrolling further back leaves the watermark where it is
+        watermark = entry.last_read_seq
+        self.client.get(self.url, {'page_size': 5, 'before': response['X-Before-Cursor']})
+        entry.refresh_from_db()
+        self.assertEqual(entry.last_read_seq, watermark)
+
+        self.client.get(self.url, {'page_size': 5})
+        entry.refresh_from_db()
+        self.assertEqual(entry.unread_count, 0)
+
+
+@isolated_caches
+class MessageWriterTests(TransactionTestCase):
+    # database_sync_to_async closes connections, so the writes must really commit
+    def setUp(self):
+        self.ada, self.bob, self.cy = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pass')
+            for name in ('ada', 'bob', 'cy')
+        ]
+        self.first = Conversation.objects.get_or_create_conversation(self.ada.id, self.bob.id)
+        self.second = Conversation.objects.get_or_create_conversation(self.ada.id, self.cy.id)
+
+    def message(self, conversation, sender, receiver, content):
+        return Message(conversation_id=conversation.id, sender_id=sender.id, receiver_id=receiver.id, content=content)
+
+    def test_concurrent_writes_share_one_transaction(self):
+        writer = MessageWriter(delay=0.01)
+        messages = [
+            self.message(self.first, self.ada, self.bob, 'Hi Bob'),
+            self.message(self.second, self.ada, self.cy, 'Hi Cy'),
+            self.message(self.first, self.bob, self.ada, 'Hi Ada'),
+            self.message(self.first, self.ada, self.bob, 'How are you?'),
+        ]
+
+        async def scenario():
+            return await asyncio.gather(*(writer.write(message) for message in messages))
+
+        saved = async_to_sync(scenario)()
+        self.assertEqual(writer.stats(), {'batches': 1, 'messages': 4, 'average_batch': 4.0})
+        self.assertTrue(all(message.pk for message in saved))
+        self.assertEqual(
+            list(Message.objects.filter(conversation=self.first).order_by('seq').values_list('seq', 'content')),
+            [(1, 'Hi Bob'), (2, 'Hi Ada'), (3, 'How are you?')],
+        )
+        self.assertEqual(Message.objects.get(conversation=self.second).seq, 1)
+
+        ada = InboxEntry.objects.get(user=self.ada, conversation=self.first)
+        bob = InboxEntry.objects.get(user=self.bob, conversation=self.first)
+        self.assertEqual((ada.last_message_content, ada.last_message_seq, ada.last_read_seq), ('How are you?', 3, 3))
+        # Bob replied after "Hi Bob", so only the newest message is unread for him
+        self.assertEqual((bob.last_read_seq, bob.unread_count), (2, 1))
+        self.assertEqual(InboxEntry.objects.get(user=self.cy).unread_count, 1)
+
+    def test_failed_message_only_fails_its_sender(self):
+        writer = MessageWriter(delay=0.01)
+        good = self.message(self.first, self.ada, self.bob, 'Hi Bob')
+        bad = Message(conversation_id=self.first.id, sender_id=0, receiver_id=self.bob.id, content='Nobody')
+
+        async def scenario():
+            return await asyncio.gather(writer.write(good), writer.write(bad), return_exceptions=True)
+
+        saved, error = async_to_sync(scenario)()
+        self.assertIsInstance(error, Exception)
+        self.assertEqual(saved.seq, 1)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['Hi Bob'])
+        self.assertEqual(Conversation.objects.get(pk=self.first.pk).last_seq, 1)
+
+
+@isolated_caches
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'channels.sqlite3')
+
+    def layer(self, **config):
+        return SQLiteChannelLayer(path=self.path, **config)
+
+    def test_group_send_reaches_channels_of_other_processes(self):
+        async def scenario():
+            # Two layer instances with their own client ids stand in for two processes
+            first, second = self.layer(), self.layer()
+            remote = await first.new_channel()
+            local = await second.new_channel()
+            await first.group_add('chat_user_1', remote)
+            await second.group_add('chat_user_1', local)
+
+            await second.group_send('chat_user_1', {'type': 'chat.message', 'body': b'\x00bytes'})
+            received = await asyncio.wait_for(asyncio.gather(first.receive(remote), second.receive(local)), 5)
+
+            await first.group_discard('chat_user_1', remote)
+            await second.group_send('chat_user_1', {'type': 'chat.message', 'body': 'again'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(first.receive(remote), 0.2)
+            await first.close()
+            await second.close()
+            return received
+
+        received = async_to_sync(scenario)()
+        self.assertEqual(received, [{'type': 'chat.message', 'body': b'\x00bytes'}] * 2)
+
+    def test_channel_capacity(self):
+        async def scenario():
+            sender, receiver = self.layer(capacity=2, channel_capacity={'specific.*': 3}), self.layer()
+            channel = await receiver.new_channel()
+            for i in range(3):
+                await sender.send(channel, {'type': 'test', 'n': i})
+            with self.assertRaises(ChannelFull):
+                await sender.send(channel, {'type': 'test', 'n': 3})
+            for i in range(2):
+                await sender.send('worker', {'type': 'test', 'n': i})
+            with self.assertRaises(ChannelFull):
+                await sender.send('worker', {'type': 'test', 'n': 2})
+
+            received = [await asyncio.wait_for(receiver.receive(channel), 5) for _ in range(3)]
+            general = await asyncio.wait_for(receiver.receive('worker'), 5)
+            await sender.close()
+            await receiver.close()
+            return [message['n'] for message in received], general['n']
+
+        self.assertEqual(async_to_sync(scenario)(), ([0, 1, 2], 0))
+
+    def test_expired_messages_and_memberships_are_dropped(self):
+        async def scenario():
+            sender, receiver = self.layer(expiry=0.05, group_expiry=0.05), self.layer()
+            channel = await receiver.new_channel()
+            await sender.group_add('group', channel)
+            await sender.send(channel, {'type': 'stale'})
+            await asyncio.sleep(0.1)
+            await sender.group_send('group', {'type': 'fresh'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(receiver.receive(channel), 0.2)
+            await sender.close()
+            await receiver.close()
+
+        async_to_sync(scenario)()
@@ -1,15 +1,18 @@
 from django.shortcuts import render
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.db.models import Q
-from .models import Message, Conversation
+from .models import Message, Conversation, InboxEntry
 from .serializers import MessageSerializer, ConversationSerializer
-from users.models import User, Connection
+from users.models import User
+from users.connections import are_connected
 from django.db.models import Max
 from django.utils import timezone
+from backend.pagination import InboxKeysetPagination, MessageKeysetPagination
 import os
 import mimetypes
 
@@ -31,22 +34,10 @@ def upload_media(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Check if users are connected
-        if not Connection.objects.filter(
-            (Q(sender=request.user, receiver_id=recipient_id) | Q(sender_id=recipient_id, receiver=request.user)),
-            status='ACCEPTED'
-        ).exists():
+        if not are_connected(request.user.id, recipient_id):
             return Response({'error': 'Users are not connected'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Get or create conversation
-        conversation = Conversation.objects.filter(
-            participants=request.user
-        ).filter(
-            participants=recipient_id
-        ).first()
-
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, recipient_id)
+        conversation = Conversation.objects.get_or_create_conversation(request.user.id, recipient_id)
 
         # Create message with media
         message = Message.objects.create(
@@ -74,61 +65,40 @@ def upload_media(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversations(request):
-    conversations = request.user.conversations.all()
-    data = []
-    
-    for conversation in conversations:
-        other_user = conversation.get_other_participant(request.user)
-        last_message = conversation.messages.last()
-        
-        data.append({
-            'id': conversation.id,
-            'other_user': {
-                'id': other_user.id,
-                'username': other_user.username,
-                'email': other_user.email,
-                'profile_picture': other_user.profile.profile_picture.url if hasattr(other_user, 'profile') and other_user.profile.profile_picture else None
-            },
-            'last_message': {
-                'content': last_message.content if last_message else None,
-                'message_type': last_message.message_type if last_message else None,
-                'media_url': request.build_absolute_uri(last_message.media_file.url) if last_message and last_message.media_file else None,
-                'timestamp': last_message.timestamp if last_message else None,
-                'is_read': last_message.is_read if last_message else None
-            } if last_message else None
-        })
-    
-    return Response(data)
+    """The user's conversations, most recently active first"""
+    entries = InboxEntry.objects.inbox(request.user)
+    paginator = InboxKeysetPagination()
+    page = paginator.paginate_queryset(entries, request)
+    serializer = ConversationSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_messages(request, user_id):
     try:
         # Check if users are connected
-        if not Connection.objects.filter(
-            (Q(sender=request.user, receiver_id=user_id) | Q(sender_id=user_id, receiver=request.user)),
-            status='ACCEPTED'
-        ).exists():
+        if not are_connected(request.user.id, user_id):
             return Response({'error': 'Users are not connected'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Get or create conversation
-        conversation = Conversation.objects.filter(
-            participants=request.user
-        ).filter(
-            participants=user_id
-        ).first()
-        
-        if not conversation:
-            # Create new conversation
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, user_id)
-        
+        conversation = Conversation.objects.get_or_create_conversation(request.user.id, user_id)
+
         messages = conversation.messages.all()
-        serializer = MessageSerializer(messages, many=True, context={'request': request})
         
-        # Mark messages as read
-        messages.filter(sender_id=user_id, is_read=False).update(is_read=True)
+        # Newest page by default, or ?before= / ?after= / ?around=; oldest to newest for display
+        paginator = MessageKeysetPagination()
+        page = paginator.paginate_queryset(messages, request)
+        watermarks = dict(InboxEntry.objects.filter(conversation=conversation).values_list('user_id', 'last_read_seq'))
+        serializer = MessageSerializer(page, many=True, context={'request': request, 'read_watermarks': watermarks})
+        
+        # Only what was shown counts as read; scrolling back through history
+        # must not move the watermark past unseen newer messages
+        shown = [message.seq for message in page if message.seq is not None]
+        if shown:
+            InboxEntry.objects.mark_read(request.user.id, conversation.id, up_to_seq=max(shown))
         
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+    except APIException:
+        # e.g. an unknown cursor or message (404)
+        raise
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
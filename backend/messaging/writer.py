@@ -0,0 +1,126 @@
+"""
+Group commit for chat messages.
+
+``ChatConsumer`` hands every message to ``message_writer.write()`` instead
+of saving it in its own transaction. Messages arriving within
+``MESSAGE_WRITER_DELAY_SECONDS`` of each other, from any socket served by
+this process, are written together. Each batch is one transaction with one
+sequence allocation per conversation, one multi-row INSERT and one inbox
+update per conversation. A batch is flushed early once it holds
+``MESSAGE_WRITER_MAX_BATCH`` messages. Batches run on the database thread
+shared with the consumers' other queries, one at a time, so messages
+arriving during a flush join the next batch.
+
+``write()`` resolves only after the batch has committed, so a sender is
+never acknowledged for a message that could still be rolled back. If a
+batch fails, its messages are retried one by one, so one bad message only
+fails its own sender.
+"""
+import asyncio
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import Conversation, InboxEntry, Message
+
+DELAY_SECONDS = getattr(settings, 'MESSAGE_WRITER_DELAY_SECONDS', 0.005)
+MAX_BATCH = getattr(settings, 'MESSAGE_WRITER_MAX_BATCH', 200)
+
+
+def _insert(messages):
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+
+    with transaction.atomic():
+        for conversation_id, batch in by_conversation.items():
+            last_seq = Conversation.objects.allocate_seq(conversation_id, len(batch))
+            for offset, message in enumerate(batch):
+                message.seq = last_seq - len(batch) + 1 + offset
+        Message.objects.bulk_create(messages)
+
+        for batch in by_conversation.values():
+            last = batch[-1]
+            InboxEntry.objects.record_message(last)
+            # Anyone else who wrote in this batch has read up to their own message
+            for sender_id in {message.sender_id for message in batch} - {last.sender_id}:
+                seq = max(message.seq for message in batch if message.sender_id == sender_id)
+                InboxEntry.objects.filter(
+                    user_id=sender_id, conversation_id=last.conversation_id, last_read_seq__lt=seq
+                ).update(last_read_seq=seq)
+
+
+def save_batch(messages):
+    """Save unsaved ``messages``; returns an exception or None for each"""
+    try:
+        _insert(messages)
+        return [None] * len(messages)
+    except Exception:
+        pass
+
+    errors = []
+    for message in messages:
+        message.pk = message.seq = None
+        message._state.adding = True
+        try:
+            _insert([message])
+            errors.append(None)
+        except Exception as error:
+            errors.append(error)
+    return errors
+
+
+class MessageWriter:
+    def __init__(self, delay=DELAY_SECONDS, max_batch=MAX_BATCH):
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending = []  # (message, future)
+        self._timer = None
+        self.batches = 0
+        self.messages = 0
+
+    async def write(self, message):
+        """Save an unsaved ``Message``; returns it once its batch has committed"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.delay, self._flush_soon)
+        return await future
+
+    def _flush_soon(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch):
+        try:
+            errors = await database_sync_to_async(save_batch)([message for message, _ in batch])
+        except Exception as error:
+            errors = [error] * len(batch)
+        self.batches += 1
+        self.messages += len(batch)
+        for (message, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(message)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'messages': self.messages,
+            'average_batch': round(self.messages / self.batches, 2) if self.batches else None,
+        }
+
+
+message_writer = MessageWriter()
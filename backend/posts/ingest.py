@@ -0,0 +1,129 @@
+"""
+Bulk post ingestion, e.g. for importing a legacy alumni newsletter.
+
+Rows are validated one by one, but slugs are allocated for a whole chunk
+with ``allocate_slugs`` and posts are written with ``bulk_create``. A bad row
+is reported with its row number and never aborts the rest of the batch.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from .models import Post, allocate_slugs
+from .serializers import PostCreateUpdateSerializer
+from . import search, timeline
+
+User = get_user_model()
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _error(row_number, errors):
+    return {'row': row_number, 'errors': errors}
+
+
+def _insert_chunk(posts):
+    """bulk_create a chunk, reallocating slugs once if another writer took one"""
+    for attempt in range(2):
+        for post, slug in zip(posts, allocate_slugs([post.title for post in posts])):
+            post.slug = slug
+        try:
+            with transaction.atomic():
+                return Post.objects.bulk_create(posts)
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def _ingest_chunk(chunk, default_author, allow_author_override):
+    """Validate and insert one chunk of ``(row_number, data)`` pairs"""
+    errors = []
+
+    emails = {
+        data.get('author_email') for _, data in chunk
+        if allow_author_override and isinstance(data, dict) and data.get('author_email')
+    }
+    authors = {user.email: user for user in User.objects.filter(email__in=emails)} if emails else {}
+
+    rows, posts = [], []
+    for row_number, data in chunk:
+        if isinstance(data, Exception):
+            errors.append(_error(row_number, {'non_field_errors': [f'Invalid JSON: {data}']}))
+            continue
+        if not isinstance(data, dict):
+            errors.append(_error(row_number, {'non_field_errors': ['Expected a JSON object']}))
+            continue
+
+        author = default_author
+        if allow_author_override and data.get('author_email'):
+            author = authors.get(data['author_email'])
+        if author is None:
+            errors.append(_error(row_number, {'author_email': ['Unknown or missing author']}))
+            continue
+
+        serializer = PostCreateUpdateSerializer(data=data)
+        if not serializer.is_valid():
+            errors.append(_error(row_number, serializer.errors))
+            continue
+        rows.append(row_number)
+        posts.append(Post(author=author, **serializer.validated_data))
+
+    if not posts:
+        return [], errors
+
+    try:
+        created = _insert_chunk(posts)
+    except IntegrityError:
+        # Isolate the offending rows
+        created = []
+        for row_number, post in zip(rows, posts):
+            post.slug = None
+            try:
+                with transaction.atomic():
+                    post.save()
+                created.append(post)
+            except IntegrityError as e:
+                errors.append(_error(row_number, {'non_field_errors': [str(e)]}))
+
+    search.index_posts([post.id for post in created])
+    timeline.fan_out_posts(created)
+    return created, errors
+
+
+def ingest_posts(rows, default_author=None, allow_author_override=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create posts from an iterable of ``(row_number, data)`` pairs.
+
+    ``data`` is a dict of post fields, or an exception if the row could not
+    be parsed. Rows are authored by ``default_author`` unless
+    ``allow_author_override`` is set and the row has an ``author_email``.
+    Returns a report with counts, throughput and per-row errors.
+    """
+    started = time.monotonic()
+    received = created = 0
+    errors = []
+
+    chunk = []
+    for row in rows:
+        received += 1
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            chunk_created, chunk_errors = _ingest_chunk(chunk, default_author, allow_author_override)
+            created += len(chunk_created)
+            errors.extend(chunk_errors)
+            chunk = []
+    if chunk:
+        chunk_created, chunk_errors = _ingest_chunk(chunk, default_author, allow_author_override)
+        created += len(chunk_created)
+        errors.extend(chunk_errors)
+
+    elapsed = time.monotonic() - started
+    return {
+        'received': received,
+        'created': created,
+        'failed': len(errors),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(received / elapsed, 1) if elapsed else None,
+        'errors': errors,
+    }
@@ -0,0 +1,75 @@
+"""
+Idempotent like/unlike and a per-user cache of liked post IDs.
+
+The cache lives under ``posts:liked:<user_id>`` in the ``LIKED_POSTS_CACHE``
+cache alias, which must be shared by every worker (by default a file-based
+cache on the local disk). ``set_like_state`` invalidates it once its writes
+have committed; any other Like save or delete invalidates it through
+``posts/signals.py``. A reader that loaded the set just before a commit may
+still store the old set; ``LIKED_CACHE_TIMEOUT`` bounds how long that lasts.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Post, Like
+
+LIKED_CACHE_TIMEOUT = getattr(settings, 'LIKED_CACHE_TIMEOUT', 300)
+
+
+def _cache():
+    return caches[getattr(settings, 'LIKED_POSTS_CACHE', 'default')]
+
+
+def _cache_key(user_id):
+    return f'posts:liked:{user_id}'
+
+
+def liked_post_ids(user_id):
+    """The set of post IDs a user has liked, from cache when possible"""
+    key = _cache_key(user_id)
+    liked = _cache().get(key)
+    if liked is None:
+        liked = frozenset(Like.objects.filter(user_id=user_id).values_list('post_id', flat=True))
+        _cache().set(key, liked, LIKED_CACHE_TIMEOUT)
+    return liked
+
+
+def invalidate(user_id):
+    _cache().delete(_cache_key(user_id))
+
+
+def _recount(post_ids):
+    """Set ``likes_count`` of ``post_ids`` from their Like rows"""
+    if not post_ids:
+        return
+    count = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(n=Count('*')).values('n')
+    Post.objects.filter(pk__in=post_ids).update(likes_count=Coalesce(Subquery(count), Value(0)))
+
+
+def set_like_state(user, post_ids, liked):
+    """
+    Make ``user`` like (or not like) every post in ``post_ids``.
+
+    Repeating a request is a no-op. Returns the IDs whose state changed.
+    Two identical requests racing may both report a change, but only one
+    row is written and the counters are recounted from the rows.
+    """
+    post_ids = list(dict.fromkeys(post_ids))
+    with transaction.atomic():
+        existing = set(
+            Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+        )
+        if liked:
+            changed = [post_id for post_id in post_ids if post_id not in existing]
+            Like.objects.bulk_create(
+                [Like(user=user, post_id=post_id) for post_id in changed], ignore_conflicts=True
+            )
+        else:
+            changed = [post_id for post_id in post_ids if post_id in existing]
+            Like.objects.filter(user=user, post_id__in=changed).delete()
+        _recount(changed)
+        transaction.on_commit(lambda: invalidate(user.id))
+    return changed
@@ -0,0 +1,55 @@
+import json
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.ingest import DEFAULT_CHUNK_SIZE, ingest_posts
+
+User = get_user_model()
+
+
+def read_ndjson(stream):
+    """Yield (line_number, data) pairs, with the parse error in place of bad lines"""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, e
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create posts from an NDJSON file (one JSON object per line, "-" for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', help='Email of the author for rows without author_email')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            try:
+                author = User.objects.get(email=options['author'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['author']}")
+
+        if options['path'] == '-':
+            report = self.ingest(sys.stdin, author, options['chunk_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as stream:
+                report = self.ingest(stream, author, options['chunk_size'])
+
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} of {report['received']} posts "
+            f"({report['failed']} failed) in {report['elapsed_seconds']}s, "
+            f"{report['rows_per_second']} rows/s"
+        ))
+
+    def ingest(self, stream, author, chunk_size):
+        return ingest_posts(read_ndjson(stream), default_author=author, allow_author_override=True, chunk_size=chunk_size)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 full-text index used by post search'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts'))
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from posts and follow relationships'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild the timeline of this user ID (repeatable)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        rebuilt = entries = 0
+        for user in users.iterator():
+            entries += timeline.rebuild(user)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines ({entries} entries)'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Post, Like, Comment
+
+
+def count_of(model):
+    return Coalesce(Subquery(
+        model.objects.filter(post=OuterRef('pk')).values('post').annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Repair drift between Post.likes_count/comments_count and the Like/Comment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted posts without fixing them')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        drifted = Post.objects.annotate(
+            actual_likes=count_of(Like),
+            actual_comments=count_of(Comment),
+        ).exclude(
+            likes_count=F('actual_likes'),
+            comments_count=F('actual_comments'),
+        ).only('id', 'likes_count', 'comments_count')
+
+        repaired = []
+        for post in drifted.iterator():
+            self.stdout.write(
+                f'Post {post.id}: likes {post.likes_count} -> {post.actual_likes}, '
+                f'comments {post.comments_count} -> {post.actual_comments}'
+            )
+            post.likes_count = post.actual_likes
+            post.comments_count = post.actual_comments
+            repaired.append(post)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(repaired)} posts have drifted counters'))
+            return
+
+        Post.objects.bulk_update(repaired, ['likes_count', 'comments_count'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters on {len(repaired)} posts'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_counters'),
+        ('users', '0007_connection'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+                "title, content, author_name, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+                "INSERT INTO posts_post_fts (rowid, title, content, author_name) "
+                "SELECT p.id, p.title, p.content, TRIM(u.first_name || ' ' || u.last_name || ' ' || u.username) "
+                "FROM posts_post p JOIN users_user u ON u.id = p.author_id",
+            ],
+            reverse_sql="DROP TABLE posts_post_fts",
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    parents = dict(Comment.objects.values_list('id', 'parent_id'))
+    resolved = {}
+
+    def resolve(comment_id):
+        # Returns (path, depth, thread_root_id)
+        if comment_id not in resolved:
+            segment = f"{comment_id:010d}"
+            parent_id = parents[comment_id]
+            if parent_id is None:
+                resolved[comment_id] = (segment, 0, None)
+            else:
+                parent_path, parent_depth, parent_root = resolve(parent_id)
+                resolved[comment_id] = (f"{parent_path}/{segment}", parent_depth + 1, parent_root or parent_id)
+        return resolved[comment_id]
+
+    comments = []
+    for comment in Comment.objects.only('id'):
+        comment.path, comment.depth, comment.thread_root_id = resolve(comment.id)
+        comments.append(comment)
+    Comment.objects.bulk_update(comments, ['path', 'depth', 'thread_root'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread_root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_comments', to='posts.comment'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread_root', 'path'], name='posts_comment_thread_idx'),
+        ),
+    ]
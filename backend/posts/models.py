@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils.text import slugify
 
@@ -22,30 +24,75 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=255, unique=True, null=True, blank=True)
     views_count = models.PositiveIntegerField(default=0)
+    # Denormalized counters, kept in step with Like/Comment writes
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='posts_post_created_idx'),
+        ]
         
     def save(self, *args, **kwargs):
         if not self.slug and self.title:
             # Create a unique slug
-            base_slug = slugify(self.title)
-            self.slug = base_slug
-            # Check for uniqueness
-            counter = 1
-            while Post.objects.filter(slug=self.slug).exists():
-                self.slug = f"{base_slug}-{counter}"
-                counter += 1
+            self.slug = allocate_slugs([self.title])[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.title or 'Post'} by {self.author.get_full_name() or self.author.username}"
         
-    def get_likes_count(self):
-        return self.likes.count()
-        
-    def get_comments_count(self):
-        return self.comments.count()
+    @classmethod
+    def adjust_counters(cls, post_ids, **deltas):
+        """Atomically add ``deltas`` to counter columns of one or more posts, e.g. likes_count=1"""
+        if not isinstance(post_ids, (list, tuple, set)):
+            post_ids = [post_ids]
+        if not post_ids:
+            return
+        cls.objects.filter(pk__in=post_ids).update(**{
+            field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()
+        })
+
+
+COMMENT_MAX_DEPTH = getattr(settings, 'COMMENT_MAX_DEPTH', 6)
+
+SLUG_BASE_MAX_LENGTH = 240
+# Bases are looked up in chunks to stay well under SQLite's expression depth limit
+SLUG_LOOKUP_CHUNK = 200
+
+
+def allocate_slugs(titles):
+    """
+    Return a unique slug for each title (None for empty titles), using one
+    prefix query per chunk of distinct titles instead of one query per
+    candidate slug.
+    """
+    bases = [slugify(title)[:SLUG_BASE_MAX_LENGTH] if title else None for title in titles]
+    distinct = sorted({base for base in bases if base is not None})
+    
+    taken = set()
+    for start in range(0, len(distinct), SLUG_LOOKUP_CHUNK):
+        condition = models.Q()
+        for base in distinct[start:start + SLUG_LOOKUP_CHUNK]:
+            condition |= models.Q(slug=base) | models.Q(slug__startswith=f'{base}-')
+        taken.update(Post.objects.filter(condition).values_list('slug', flat=True))
+    
+    slugs = []
+    counters = {}
+    for base in bases:
+        if base is None:
+            slugs.append(None)
+            continue
+        slug = base
+        counter = counters.get(base, 1)
+        while slug in taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        counters[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
 
 
 class Comment(models.Model):
@@ -53,11 +100,48 @@ class Comment(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Materialized path: zero-padded ids from the top-level comment down to
+    # this one, e.g. "0000000012/0000000034". Sorting a thread by path gives
+    # depth-first order, so a whole thread loads with one index range scan.
+    thread_root = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='thread_comments'
+    )
+    path = models.CharField(max_length=255, blank=True, default='')
+    depth = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    PATH_SEGMENT_WIDTH = 10
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='posts_comment_post_created_idx'),
+            models.Index(fields=['thread_root', 'path'], name='posts_comment_thread_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        if is_new and self.parent_id:
+            parent = self.parent
+            # Replies beyond the maximum depth attach to the deepest allowed ancestor
+            while parent.depth >= COMMENT_MAX_DEPTH:
+                parent = parent.parent
+            self.parent = parent
+            self.depth = parent.depth + 1
+            self.thread_root_id = parent.thread_root_id or parent.id
+        super().save(*args, **kwargs)
+        if is_new:
+            segment = f"{self.id:0{self.PATH_SEGMENT_WIDTH}d}"
+            self.path = f"{self.parent.path}/{segment}" if self.parent_id else segment
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+    
+    @property
+    def subtree_bounds(self):
+        """(lower, upper) path bounds of this comment's descendants"""
+        # '/' sorts just before '0', and segments have a fixed width, so every
+        # descendant path lies strictly between "<path>/" and "<path>0"
+        return f"{self.path}/", f"{self.path}0"
     
     def __str__(self):
         return f"Comment by {self.author.get_full_name() or self.author.username}"
@@ -77,3 +161,22 @@ class Like(models.Model):
         
     def __str__(self):
         return f"Like by {self.user.get_full_name() or self.user.username}"
+
+
+class TimelineEntry(models.Model):
+    """A post ID materialized into a user's home timeline (fan-out on write)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    # Copied from the post so the feed is served straight off the index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_feed_idx'),
+            models.Index(fields=['user', 'author'], name='posts_timeline_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.user_id}"
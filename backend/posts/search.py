@@ -0,0 +1,150 @@
+"""
+Full-text post search backed by an SQLite FTS5 table.
+
+``posts_post_fts`` holds the title, content and author name of every post,
+keyed by the post's id as rowid. It is kept in sync by the signal handlers
+in ``posts/signals.py`` and can be rebuilt with
+``manage.py rebuild_post_search_index``. Results are ranked with BM25 and
+come with highlighted titles and content snippets. Those are HTML: the
+post text is escaped and only the ``<mark>`` tags around matches are markup.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+# BM25 column weights: title, content, author_name
+RANK_EXPRESSION = f'bm25({FTS_TABLE}, 10.0, 4.0, 2.0)'
+
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+# FTS5 wraps matches in these; they are swapped for the tags after escaping
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+_MARKED_RE = re.compile(f'{_MATCH_START}([^{_MATCH_START}{_MATCH_END}]*){_MATCH_END}')
+SNIPPET_TOKENS = 24
+
+AUTHOR_NAME_SQL = "TRIM(u.first_name || ' ' || u.last_name || ' ' || u.username)"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_expression(query):
+    """Turn free text into an FTS5 query that prefix-matches every word"""
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _to_html(text):
+    """Escape FTS5 output and turn its match markers into ``<mark>`` tags"""
+    marked = _MARKED_RE.sub(rf'{HIGHLIGHT_OPEN}\1{HIGHLIGHT_CLOSE}', html.escape(text or ''))
+    # Marker characters typed into a post are dropped
+    return marked.replace(_MATCH_START, '').replace(_MATCH_END, '')
+
+
+def index_posts(post_ids):
+    """(Re)index the given posts"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, author_name) '
+            f'SELECT p.id, p.title, p.content, {AUTHOR_NAME_SQL} '
+            f'FROM posts_post p JOIN users_user u ON u.id = p.author_id '
+            f'WHERE p.id IN ({placeholders})',
+            post_ids,
+        )
+
+
+def index_author_posts(author_id):
+    """Reindex every post of an author, e.g. after a name change"""
+    index_posts(Post.objects.filter(author_id=author_id).values_list('id', flat=True))
+
+
+def unindex_post(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """Drop and repopulate the whole index; returns the number of posts indexed"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, author_name) '
+            f'SELECT p.id, p.title, p.content, {AUTHOR_NAME_SQL} '
+            f'FROM posts_post p JOIN users_user u ON u.id = p.author_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_posts(query, visible_posts, limit, after=None):
+    """
+    Return up to ``limit`` posts from ``visible_posts`` matching ``query``,
+    best match first.
+
+    ``after`` is an optional ``(score, id)`` key from a previous page. Each
+    returned post has ``search_score``, ``title_highlight`` and
+    ``search_snippet`` attributes.
+    """
+    match = build_match_expression(query)
+    if not match:
+        return []
+
+    # Restrict matches to the caller's queryset so visibility rules apply.
+    # The check is correlated on each match; an uncorrelated
+    # ``rowid IN (...)`` makes SQLite probe the FTS index once per visible post.
+    visible_sql, visible_params = (
+        visible_posts.order_by().filter(id=RawSQL('m.id', [])).values('id').query.sql_with_params()
+    )
+    sql = (
+        f'WITH m AS MATERIALIZED ('
+        f'SELECT rowid AS id, {RANK_EXPRESSION} AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        f') SELECT id, score FROM m WHERE EXISTS ({visible_sql})'
+    )
+    params = [match, *visible_params]
+    if after is not None:
+        score, post_id = after
+        sql += ' AND (score > %s OR (score = %s AND id > %s))'
+        params += [score, score, post_id]
+    sql += ' ORDER BY score, id LIMIT %s'
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ranked = cursor.fetchall()
+        if not ranked:
+            return []
+
+        # Highlights only for the page being returned
+        placeholders = ', '.join(['%s'] * len(ranked))
+        cursor.execute(
+            f'SELECT rowid, highlight({FTS_TABLE}, 0, %s, %s), '
+            f"snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS}) "
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})',
+            [_MATCH_START, _MATCH_END, _MATCH_START, _MATCH_END, match,
+             *[post_id for post_id, _ in ranked]],
+        )
+        highlights = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    posts = visible_posts.in_bulk([post_id for post_id, _ in ranked])
+    results = []
+    for post_id, score in ranked:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        post.search_score = score
+        title, snippet = highlights.get(post_id, (post.title, ''))
+        post.title_highlight, post.search_snippet = _to_html(title), _to_html(snippet)
+        results.append(post)
+    return results
@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import Post, Comment, Like
+from .models import Post, Comment, Like, COMMENT_MAX_DEPTH
 from django.contrib.auth import get_user_model
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from . import likes, threads
 
 User = get_user_model()
 
@@ -11,20 +14,51 @@ class UserBriefSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name', 'profile_pic']
 
 
+class CommentThreadSerializer(serializers.ModelSerializer):
+    """A comment and its loaded replies (``children`` set by posts.threads)"""
+    author = UserBriefSerializer(read_only=True)
+    replies = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Comment
+        fields = ['id', 'author', 'content', 'parent', 'depth', 'created_at', 'replies']
+    
+    def get_replies(self, obj):
+        return CommentThreadSerializer(getattr(obj, 'children', []), many=True, context=self.context).data
+
+
 class CommentSerializer(serializers.ModelSerializer):
     author = UserBriefSerializer(read_only=True)
     is_reply = serializers.BooleanField(read_only=True)
     replies = serializers.SerializerMethodField()
+    has_more_replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'author', 'content', 'parent', 'created_at', 'updated_at', 'is_reply', 'replies']
-        read_only_fields = ['author', 'created_at', 'updated_at']
+        fields = [
+            'id', 'post', 'author', 'content', 'parent', 'depth', 'created_at', 'updated_at',
+            'is_reply', 'replies', 'has_more_replies'
+        ]
+        read_only_fields = ['author', 'depth', 'created_at', 'updated_at']
+    
+    def load_thread(self, obj):
+        """Load the same bounded reply preview as the comment list, if not loaded yet"""
+        if hasattr(obj, 'children') or obj.pk is None:
+            return
+        view = self.context.get('view')
+        max_depth = view.get_max_depth() if hasattr(view, 'get_max_depth') else COMMENT_MAX_DEPTH
+        replies = threads.load_subtree(obj, threads.THREAD_PREVIEW_REPLIES + 1, max_depth=max_depth)
+        obj.has_more_replies = len(replies) > threads.THREAD_PREVIEW_REPLIES
+        threads.build_tree([obj] + replies[:threads.THREAD_PREVIEW_REPLIES])
+    
+    def get_has_more_replies(self, obj):
+        self.load_thread(obj)
+        return getattr(obj, 'has_more_replies', False)
     
     def get_replies(self, obj):
-        if hasattr(obj, 'replies'):
-            return CommentBriefSerializer(obj.replies.all(), many=True).data
-        return []
+        self.load_thread(obj)
+        # Thread assembled by posts.threads
+        return CommentThreadSerializer(getattr(obj, 'children', []), many=True, context=self.context).data
 
 
 class CommentBriefSerializer(serializers.ModelSerializer):
@@ -50,10 +84,62 @@ class LikeSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at']
 
 
+class LikeStateSerializer(serializers.Serializer):
+    post = serializers.IntegerField(required=False)
+    posts = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=200)
+    like = serializers.BooleanField()
+    
+    def validate(self, data):
+        if ('post' in data) == ('posts' in data):
+            raise serializers.ValidationError("Provide either 'post' or 'posts'")
+        data['post_ids'] = [data['post']] if 'post' in data else data['posts']
+        return data
+
+
+TOP_COMMENTS_COUNT = 3
+
+
+class PostPageData:
+    """Per-page data for a list of posts, loaded with a fixed number of queries"""
+
+    def __init__(self, posts, user):
+        post_ids = [post.id for post in posts]
+
+        # The current user's liked post IDs come from the per-user cache
+        self.liked_post_ids = frozenset()
+        if user is not None and user.is_authenticated and post_ids:
+            self.liked_post_ids = likes.liked_post_ids(user.id)
+
+        # One windowed query for the newest top-level comments of every post,
+        # plus one for the bounded reply previews of all of them
+        self.top_comments = {post_id: [] for post_id in post_ids}
+        if post_ids:
+            comments = Comment.objects.filter(post_id__in=post_ids, parent=None).annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F('post_id'),
+                    order_by=[F('created_at').desc(), F('id').desc()],
+                )
+            ).filter(position__lte=TOP_COMMENTS_COUNT).select_related('author').order_by('post_id', 'position')
+            for comment in threads.attach_thread_previews(comments, limit=threads.THREAD_PREVIEW_REPLIES):
+                self.top_comments[comment.post_id].append(comment)
+
+
+class PostListSerializer(serializers.ListSerializer):
+    """Serializes a page of posts with a constant number of queries"""
+
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        self.child.page_data = PostPageData(posts, getattr(request, 'user', None))
+        try:
+            return super().to_representation(posts)
+        finally:
+            self.child.page_data = None
+
+
 class PostSerializer(serializers.ModelSerializer):
     author = UserBriefSerializer(read_only=True)
-    comments_count = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
     liked_by_user = serializers.SerializerMethodField()
     top_comments = serializers.SerializerMethodField()
     
@@ -65,30 +151,43 @@ class PostSerializer(serializers.ModelSerializer):
             'slug', 'views_count', 'comments_count', 'likes_count', 
             'liked_by_user', 'top_comments'
         ]
-        read_only_fields = ['author', 'created_at', 'updated_at', 'slug', 'views_count']
+        read_only_fields = [
+            'author', 'created_at', 'updated_at', 'slug', 'views_count', 'comments_count', 'likes_count'
+        ]
+        list_serializer_class = PostListSerializer
+    
+    # Set by PostListSerializer while a page is being serialized
+    page_data = None
     
     def get_liked_by_user(self, obj):
+        if self.page_data is not None:
+            return obj.id in self.page_data.liked_post_ids
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
+            return obj.id in likes.liked_post_ids(request.user.id)
         return False
     
-    def get_comments_count(self, obj):
-        if hasattr(obj, 'comments_count_anno'):
-            return obj.comments_count_anno
-        return obj.comments.count()
-    
-    def get_likes_count(self, obj):
-        if hasattr(obj, 'likes_count_anno'):
-            return obj.likes_count_anno
-        return obj.likes.count()
-    
     def get_top_comments(self, obj):
+        if self.page_data is not None:
+            top_comments = self.page_data.top_comments.get(obj.id, [])
+            return CommentSerializer(top_comments, many=True, context=self.context).data
         # Get up to 3 top-level comments (non-replies)
-        top_comments = obj.comments.filter(parent=None).order_by('-created_at')[:3]
+        top_comments = threads.attach_thread_previews(
+            obj.comments.filter(parent=None).select_related('author').order_by('-created_at')[:TOP_COMMENTS_COUNT],
+            limit=threads.THREAD_PREVIEW_REPLIES,
+        )
         return CommentSerializer(top_comments, many=True, context=self.context).data
 
 
+class PostSearchResultSerializer(PostSerializer):
+    search_score = serializers.FloatField(read_only=True)
+    title_highlight = serializers.CharField(read_only=True)
+    search_snippet = serializers.CharField(read_only=True)
+    
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ['search_score', 'title_highlight', 'search_snippet']
+
+
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Post, Like
+from . import likes, search
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_posts([instance.id])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.id)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_liked_posts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        likes.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reindex_author_posts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Only name changes affect the index
+    if created or raw:
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return
+    search.index_author_posts(instance.id)
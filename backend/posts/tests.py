@@ -1,3 +1,402 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.testing import isolated_caches
+from . import likes, threads, timeline
+from .models import Post, Comment, Like, TimelineEntry
+from .trending import HALF_LIFE, TrendingEngine
+from .view_counter import ViewCountBuffer
+
+User = get_user_model()
+
+
+@isolated_caches
+class PostListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.author, title=f'Post {i}', content='Hello')
+            for j in range(4):
+                comment = Comment.objects.create(post=post, author=self.author, content=f'Comment {j}')
+                Comment.objects.create(post=post, author=self.user, content='Reply', parent=comment)
+            if i % 2:
+                Like.objects.create(post=post, user=self.user)
+
+    def count_list_queries(self, page_size):
+        # Start every measurement with a cold liked-posts cache
+        caches[settings.LIKED_POSTS_CACHE].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/posts/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), page_size)
+        return len(queries), response.data
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_posts(20)
+        small_page_queries, _ = self.count_list_queries(5)
+        large_page_queries, data = self.count_list_queries(20)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+        self.assertLessEqual(large_page_queries, 5)
+
+        for post in data:
+            self.assertEqual(len(post['top_comments']), 3)
+            self.assertEqual(len(post['top_comments'][0]['replies']), 1)
+        liked = {post['id']: post['liked_by_user'] for post in data}
+        self.assertEqual(liked, {
+            post.id: post.likes.filter(user=self.user).exists() for post in Post.objects.all()
+        })
+
+    def test_top_comments_are_newest_first(self):
+        self.create_posts(1)
+        _, data = self.count_list_queries(1)
+        contents = [comment['content'] for comment in data[0]['top_comments']]
+        self.assertEqual(contents, ['Comment 3', 'Comment 2', 'Comment 1'])
+
+
+@isolated_caches
+class LikeStateTests(TestCase):
+    def setUp(self):
+        caches[settings.LIKED_POSTS_CACHE].clear()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='Hello') for i in range(2)]
+
+    def likes_counts(self):
+        return list(Post.objects.order_by('id').values_list('likes_count', flat=True))
+
+    def test_repeated_requests_are_no_ops(self):
+        post_ids = [post.id for post in self.posts]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.set_like_state(self.user, post_ids, True), post_ids)
+        self.assertEqual(likes.set_like_state(self.user, post_ids, True), [])
+        self.assertEqual(self.likes_counts(), [1, 1])
+        self.assertEqual(likes.liked_post_ids(self.user.id), frozenset(post_ids))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.set_like_state(self.user, post_ids[:1], False), post_ids[:1])
+        self.assertEqual(self.likes_counts(), [0, 1])
+        self.assertEqual(likes.liked_post_ids(self.user.id), frozenset(post_ids[1:]))
+
+    def test_concurrent_duplicate_like(self):
+        post = self.posts[0]
+        bulk_create = Like.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # The same like committed by a concurrent request after our read
+            Like.objects.create(user=self.user, post=post)
+            Post.adjust_counters(post.id, likes_count=1)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Like.objects, 'bulk_create', racing_bulk_create):
+            likes.set_like_state(self.user, [post.id], True)
+        self.assertEqual(Like.objects.filter(post=post).count(), 1)
+        self.assertEqual(self.likes_counts(), [1, 0])
+
+
+@isolated_caches
+class TrendingEngineTests(TestCase):
+    def setUp(self):
+        self.cs = User.objects.create_user(username='cs', email='cs@example.com', password='pass', department='CS')
+        self.ee = User.objects.create_user(username='ee', email='ee@example.com', password='pass', department='EE')
+        self.engine = TrendingEngine()
+
+    def create_post(self, author, **fields):
+        return Post.objects.create(author=author, title='Post', content='Hello', **fields)
+
+    def like(self, post, at=None):
+        # A like handled by this process: counter first, then the engine
+        Post.adjust_counters(post.id, likes_count=1)
+        with mock.patch('posts.trending.time.time', return_value=at or time.time()):
+            self.engine.record_like(post.id)
+
+    def test_recent_engagement_outranks_older_engagement(self):
+        old, recent = self.create_post(self.cs), self.create_post(self.cs)
+        self.engine.seed()
+        two_half_lives_ago = time.time() - 2 * HALF_LIFE
+        for _ in range(3):
+            # Worth 3 / 4 of a like made now
+            self.like(old, at=two_half_lives_ago)
+        self.like(recent)
+        self.assertEqual(self.engine.top(), [recent.id, old.id])
+
+    def test_reseed_keeps_history_and_adds_other_workers_engagement(self):
+        liked, other = self.create_post(self.cs), self.create_post(self.cs)
+        self.engine.seed()
+        self.like(liked)
+        score = self.engine._scores[liked.id]
+
+        self.engine.seed()
+        self.assertAlmostEqual(self.engine._scores[liked.id], score)
+
+        # Two likes recorded by another worker only reach the counters
+        Post.adjust_counters(other.id, likes_count=2)
+        self.engine.seed()
+        self.assertEqual(self.engine.top(), [other.id, liked.id])
+
+    def test_unlike_lowers_score(self):
+        first, second = self.create_post(self.cs), self.create_post(self.cs)
+        self.engine.seed()
+        self.like(first)
+        self.like(first)
+        self.like(second)
+        self.assertEqual(self.engine.top()[0], first.id)
+
+        Post.adjust_counters(first.id, likes_count=-2)
+        self.engine.record_unlike(first.id)
+        self.engine.record_unlike(first.id)
+        self.engine.refresh()
+        self.assertEqual(self.engine.top()[0], second.id)
+
+    def test_department_top_n(self):
+        cs_posts = [self.create_post(self.cs) for _ in range(3)]
+        ee_post = self.create_post(self.ee)
+        self.engine.seed()
+        for likes, post in enumerate(cs_posts + [ee_post]):
+            for _ in range(likes):
+                self.like(post)
+
+        with mock.patch('posts.trending.TOP_N', 2):
+            self.engine.refresh()
+            self.assertEqual(self.engine.top(), [ee_post.id, cs_posts[2].id])
+            self.assertEqual(self.engine.top('CS'), [cs_posts[2].id, cs_posts[1].id])
+            self.assertEqual(self.engine.top('EE'), [ee_post.id])
+            self.assertEqual(self.engine.top('ME'), [])
+
+    def test_privacy_changes(self):
+        post = self.create_post(self.cs)
+        client = APIClient()
+        client.force_authenticate(self.cs)
+        self.engine.seed()
+        self.like(post)
+        with mock.patch('posts.views.trending_engine', self.engine):
+            client.patch(f'/api/posts/posts/{post.id}/', {'is_public': False}, format='json')
+            self.assertEqual(self.engine.top(), [])
+            # Events for a private post are ignored
+            self.engine.record_view(post.id)
+            self.assertEqual(self.engine.top(), [])
+
+            client.patch(f'/api/posts/posts/{post.id}/', {'is_public': True}, format='json')
+            self.assertEqual(self.engine.top(), [post.id])
+
+        # Made private by another worker: never served, and dropped at the next reseed
+        Post.objects.filter(id=post.id).update(is_public=False)
+        with mock.patch('posts.views.trending_engine', self.engine):
+            self.assertEqual(self.engine.top(), [post.id])
+            self.assertEqual(client.get('/api/posts/posts/trending/').data, [])
+            self.assertEqual(client.get('/api/posts/posts/trending/CS/').data, [])
+        self.engine.seed()
+        self.assertEqual(self.engine.top(), [])
+
+
+@isolated_caches
+class PostSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_highlights_escape_post_text(self):
+        Post.objects.create(
+            author=self.user,
+            title='<script>alert(1)</script> Reunion',
+            content='Join the reunion <img src=x onerror=alert(1)> on Friday \x02 stray',
+        )
+        response = self.client.get('/api/posts/posts/', {'search': 'reunion'})
+        self.assertEqual(response.status_code, 200)
+        result = response.data[0]
+        self.assertEqual(result['title_highlight'], '&lt;script&gt;alert(1)&lt;/script&gt; <mark>Reunion</mark>')
+        self.assertEqual(
+            result['search_snippet'],
+            'Join the <mark>reunion</mark> &lt;img src=x onerror=alert(1)&gt; on Friday  stray',
+        )
+
+
+@isolated_caches
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.delete(timeline.HEAVY_AUTHORS_CACHE_KEY)
+        self.reader, self.author, self.other = User.objects.bulk_create([
+            User(username=name, email=f'{name}@example.com') for name in ('reader', 'author', 'other')
+        ])
+        self.reader.following.add(self.author)
+
+    def publish(self, author, count=1):
+        posts = [Post.objects.create(author=author, title='Post', content='Hello') for _ in range(count)]
+        timeline.fan_out_posts(posts)
+        return posts
+
+    def feed(self, user, limit=50, before=None):
+        return [post.id for post in timeline.home_timeline(user, limit, before=before)]
+
+    def test_posts_fan_out_to_followers_only(self):
+        own = self.publish(self.reader)
+        followed = self.publish(self.author, 2)
+        self.publish(self.other)
+
+        self.assertEqual(self.feed(self.reader), [followed[1].id, followed[0].id, own[0].id])
+        self.assertEqual(self.feed(self.author), [followed[1].id, followed[0].id])
+        self.assertEqual(self.feed(self.reader, 2), [followed[1].id, followed[0].id])
+        older = timeline.home_timeline(self.reader, 1, before=(followed[0].created_at, followed[0].id))
+        self.assertEqual([post.id for post in older], [own[0].id])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        posts = self.publish(self.other, 2)
+        timeline.follow(self.reader, self.other)
+        self.assertEqual(self.feed(self.reader), [posts[1].id, posts[0].id])
+
+        timeline.unfollow(self.reader, self.other)
+        self.assertEqual(self.feed(self.reader), [])
+        self.assertFalse(TimelineEntry.objects.filter(author=self.other).exclude(user=self.other).exists())
+
+    def test_heavy_authors_are_merged_at_read_time(self):
+        self.other.following.add(self.author)
+        with mock.patch.object(timeline, 'FANOUT_THRESHOLD', 2):
+            posts = self.publish(self.author)
+            own = self.publish(self.reader)
+            self.assertFalse(TimelineEntry.objects.filter(user=self.reader, post=posts[0]).exists())
+            self.assertEqual(self.feed(self.reader), [own[0].id, posts[0].id])
+            self.assertEqual(timeline.rebuild(self.reader), 1)
+            self.assertEqual(self.feed(self.reader), [own[0].id, posts[0].id])
+
+    def test_timelines_are_trimmed(self):
+        with mock.patch.object(timeline, 'TIMELINE_MAX_LENGTH', 3), mock.patch.object(timeline, 'TRIM_EVERY', 1):
+            posts = self.publish(self.author, 5)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(self.feed(self.reader), [post.id for post in reversed(posts[2:])])
+
+
+@isolated_caches
+@mock.patch.object(ViewCountBuffer, '_ensure_worker')
+class ViewCountBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='Hello') for i in range(3)]
+        self.buffer = ViewCountBuffer(flush_interval=60)
+
+    def views_counts(self):
+        return list(Post.objects.order_by('id').values_list('views_count', flat=True))
+
+    def test_views_are_written_in_batches(self, ensure_worker):
+        for post, views in zip(self.posts, (2, 2, 1)):
+            for _ in range(views):
+                self.buffer.record(post.id)
+        self.assertEqual(self.views_counts(), [0, 0, 0])
+        self.assertEqual(self.buffer.pending(self.posts[0].id), 2)
+
+        # One UPDATE per distinct increment
+        with self.assertNumQueries(4):
+            self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(self.views_counts(), [2, 2, 1])
+        self.assertEqual(self.buffer.pending(self.posts[0].id), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+        stats = self.buffer.stats()
+        self.assertEqual((stats['flushes'], stats['flushed_views'], stats['backlog_views']), (1, 5, 0))
+
+    def test_failed_flush_is_retried(self, ensure_worker):
+        self.buffer.record(self.posts[0].id, 3)
+        with mock.patch.object(Post.objects, 'filter', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.buffer.record(self.posts[0].id)
+        self.assertEqual(self.buffer.pending(self.posts[0].id), 4)
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(self.views_counts(), [4, 0, 0])
+
+    def test_retrieve_includes_buffered_views(self, ensure_worker):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        post = self.posts[0]
+        with mock.patch('posts.views.view_counter', self.buffer):
+            client.get(f'/api/posts/posts/{post.id}/')
+            response = client.get(f'/api/posts/posts/{post.id}/')
+        self.assertEqual(response.data['views_count'], 2)
+        self.assertEqual(self.views_counts(), [0, 0, 0])
+
+
+@isolated_caches
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.post = Post.objects.create(author=self.user, title='Post', content='Hello')
+        # root
+        # +- a
+        # |  +- a1
+        # |  +- a2
+        # +- b
+        self.root = self.comment('root')
+        self.a = self.comment('a', self.root)
+        self.b = self.comment('b', self.root)
+        self.a1 = self.comment('a1', self.a)
+        self.a2 = self.comment('a2', self.a)
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(post=self.post, author=self.user, content=content, parent=parent)
+
+    def contents(self, comments):
+        return [comment.content for comment in comments]
+
+    def test_paths_give_depth_first_order(self):
+        self.assertEqual(self.a1.thread_root_id, self.root.id)
+        self.assertEqual(self.a1.depth, 2)
+        self.assertTrue(self.a1.path.startswith(f'{self.a.path}/'))
+        self.assertEqual(self.contents(threads.load_subtree(self.root, 10)), ['a', 'a1', 'a2', 'b'])
+        self.assertEqual(self.contents(threads.load_subtree(self.a, 10)), ['a1', 'a2'])
+        self.assertEqual(self.contents(threads.load_subtree(self.b, 10)), [])
+
+    def test_subtree_pages_and_depth_limit(self):
+        first = threads.load_subtree(self.root, 2)
+        self.assertEqual(self.contents(first), ['a', 'a1'])
+        rest = threads.load_subtree(self.root, 2, after_path=first[-1].path)
+        self.assertEqual(self.contents(rest), ['a2', 'b'])
+        self.assertEqual(self.contents(threads.load_subtree(self.root, 10, max_depth=1)), ['a', 'b'])
+
+    def test_replies_beyond_max_depth_attach_to_deepest_ancestor(self):
+        with mock.patch('posts.models.COMMENT_MAX_DEPTH', 2):
+            deep = self.comment('deep', self.a1)
+        self.assertEqual(deep.parent_id, self.a.id)
+        self.assertEqual(deep.depth, 2)
+
+    def test_thread_previews(self):
+        other = self.comment('other')
+        roots = threads.attach_thread_previews([self.root, other], limit=3)
+        self.assertTrue(roots[0].has_more_replies)
+        self.assertEqual(self.contents(roots[0].children), ['a'])
+        self.assertEqual(self.contents(roots[0].children[0].children), ['a1', 'a2'])
+        self.assertFalse(roots[1].has_more_replies)
+        self.assertEqual(roots[1].children, [])
+
+        tree = threads.build_tree(threads.load_subtree(self.root, 10))
+        self.assertEqual(self.contents(tree), ['a', 'b'])
+        self.assertEqual(self.contents(tree[0].children), ['a1', 'a2'])
+
+    def test_post_and_comment_responses_bound_reply_previews(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('posts.threads.THREAD_PREVIEW_REPLIES', 3):
+            post = client.get('/api/posts/posts/').data[0]
+            comment = client.get(f'/api/posts/comments/{self.root.id}/', {'depth': 1}).data
+
+        preview = post['top_comments'][0]
+        self.assertEqual(preview['content'], 'root')
+        self.assertEqual(self.contents_of(preview['replies']), ['a'])
+        self.assertEqual(self.contents_of(preview['replies'][0]['replies']), ['a1', 'a2'])
+        self.assertTrue(preview['has_more_replies'])
+        self.assertEqual(self.contents_of(comment['replies']), ['a', 'b'])
+        self.assertEqual(comment['replies'][0]['replies'], [])
+        self.assertFalse(comment['has_more_replies'])
 
-# Create your tests here.
+    def contents_of(self, data):
+        return [reply['content'] for reply in data]
@@ -0,0 +1,79 @@
+"""
+Loading comment threads with a bounded number of queries.
+
+Comments carry a materialized ``path`` and their ``thread_root``, so any
+thread or subtree is one ordered range scan over ``posts_comment_thread_idx``
+and is assembled into a tree in Python.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Comment, COMMENT_MAX_DEPTH
+
+# Replies loaded with each top-level comment in the comment list
+THREAD_PREVIEW_REPLIES = getattr(settings, 'COMMENT_THREAD_PREVIEW_REPLIES', 20)
+
+
+def build_tree(comments):
+    """
+    Attach comments (in path order) to their loaded parents as ``children``.
+
+    Returns the comments whose parent is not in the list, in order.
+    """
+    by_id = {}
+    top = []
+    for comment in comments:
+        comment.children = []
+        by_id[comment.id] = comment
+        parent = by_id.get(comment.parent_id)
+        if parent is not None:
+            parent.children.append(comment)
+        else:
+            top.append(comment)
+    return top
+
+
+def attach_thread_previews(roots, max_depth=COMMENT_MAX_DEPTH, limit=THREAD_PREVIEW_REPLIES):
+    """
+    Load the first ``limit`` replies (depth first, at most ``max_depth``
+    levels deep) of every top-level comment in one windowed query.
+
+    Sets ``children`` and ``has_more_replies`` on each root.
+    """
+    roots = list(roots)
+    if not roots:
+        return roots
+    replies = Comment.objects.filter(
+        thread_root_id__in=[root.id for root in roots],
+        depth__lte=max_depth,
+    ).annotate(
+        position=Window(RowNumber(), partition_by=F('thread_root_id'), order_by=F('path').asc())
+    ).filter(position__lte=limit + 1).select_related('author').order_by('thread_root_id', 'path')
+
+    by_root = defaultdict(list)
+    for reply in replies:
+        by_root[reply.thread_root_id].append(reply)
+
+    for root in roots:
+        thread = by_root[root.id]
+        root.has_more_replies = len(thread) > limit
+        build_tree([root] + thread[:limit])
+    return roots
+
+
+def load_subtree(comment, limit, max_depth=COMMENT_MAX_DEPTH, after_path=None):
+    """
+    Return up to ``limit`` descendants of ``comment`` in depth-first order,
+    at most ``max_depth`` levels below it and after ``after_path`` if given.
+    """
+    lower, upper = comment.subtree_bounds
+    replies = Comment.objects.filter(
+        thread_root_id=comment.thread_root_id or comment.id,
+        path__gt=max(lower, after_path) if after_path else lower,
+        path__lt=upper,
+        depth__lte=comment.depth + max_depth,
+    ).select_related('author').order_by('path')
+    return list(replies[:limit])
@@ -0,0 +1,165 @@
+"""
+Materialized home timelines.
+
+Every user has a bounded list of post IDs (``TimelineEntry`` rows) that is
+written when a post is created and when a follow is added or removed, so
+reading the feed is a single range scan over ``posts_timeline_feed_idx``.
+Posts by heavily followed authors are not fanned out; they are pulled and
+merged into the feed at read time instead.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, TimelineEntry
+
+User = get_user_model()
+Follow = User.following.through
+
+# Maximum number of entries kept per timeline
+TIMELINE_MAX_LENGTH = getattr(settings, 'TIMELINE_MAX_LENGTH', 500)
+# Authors with at least this many followers are pulled instead of pushed
+FANOUT_THRESHOLD = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 1000)
+# A recipient's timeline is trimmed on roughly one in every N fan-outs
+TRIM_EVERY = getattr(settings, 'TIMELINE_TRIM_EVERY', 16)
+
+HEAVY_AUTHORS_CACHE_KEY = 'timeline:heavy_authors'
+HEAVY_AUTHORS_CACHE_TIMEOUT = 60
+
+
+def heavy_author_ids():
+    """IDs of authors whose posts are merged at read time rather than fanned out"""
+    def compute():
+        return frozenset(
+            Follow.objects.values('to_user_id')
+            .annotate(followers=Count('id'))
+            .filter(followers__gte=FANOUT_THRESHOLD)
+            .values_list('to_user_id', flat=True)
+        )
+    return cache.get_or_set(HEAVY_AUTHORS_CACHE_KEY, compute, HEAVY_AUTHORS_CACHE_TIMEOUT)
+
+
+def trim_timelines(user_ids):
+    """Drop entries beyond TIMELINE_MAX_LENGTH from the given users' timelines"""
+    if not user_ids:
+        return 0
+    overflow = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=[F('created_at').desc(), F('post_id').desc()],
+        )
+    ).filter(position__gt=TIMELINE_MAX_LENGTH).values_list('id', flat=True)
+    deleted, _ = TimelineEntry.objects.filter(id__in=list(overflow)).delete()
+    return deleted
+
+
+def _push(user_ids, posts):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+            for user_id in user_ids
+            for post in posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post):
+    """Push a newly created post into its author's and followers' timelines"""
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """Fan out a batch of new posts, loading each author's followers once"""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+
+    followers = defaultdict(list)
+    for to_user_id, from_user_id in Follow.objects.filter(to_user_id__in=by_author).values_list(
+        'to_user_id', 'from_user_id'
+    ):
+        followers[to_user_id].append(from_user_id)
+
+    to_trim = set()
+    for author_id, author_posts in by_author.items():
+        recipients = [author_id]
+        if len(followers[author_id]) < FANOUT_THRESHOLD:
+            recipients.extend(followers[author_id])
+        _push(recipients, author_posts)
+
+        # Trimming every recipient on every post would rescan all of their
+        # timelines, so each post only trims the bucket of users it maps to.
+        buckets = {post.id % TRIM_EVERY for post in author_posts}
+        to_trim.update(user_id for user_id in recipients if user_id % TRIM_EVERY in buckets)
+    trim_timelines(list(to_trim))
+
+
+def follow(follower, followee):
+    """Backfill a newly followed user's recent posts into the follower's timeline"""
+    if followee.id in heavy_author_ids():
+        return
+    posts = list(
+        Post.objects.filter(author=followee).only('id', 'author_id', 'created_at')
+        .order_by('-created_at', '-id')[:TIMELINE_MAX_LENGTH]
+    )
+    _push([follower.id], posts)
+    trim_timelines([follower.id])
+
+
+def unfollow(follower, followee):
+    """Remove an unfollowed user's posts from the follower's timeline"""
+    TimelineEntry.objects.filter(user=follower, author=followee).delete()
+
+
+def rebuild(user):
+    """Recompute a user's timeline from scratch"""
+    heavy = heavy_author_ids()
+    following_ids = [
+        user_id for user_id in user.following.values_list('id', flat=True)
+        if user_id not in heavy
+    ]
+    posts = list(
+        Post.objects.filter(Q(author_id__in=following_ids) | Q(author=user))
+        .only('id', 'author_id', 'created_at')
+        .order_by('-created_at', '-id')[:TIMELINE_MAX_LENGTH]
+    )
+    TimelineEntry.objects.filter(user=user).delete()
+    _push([user.id], posts)
+    return len(posts)
+
+
+def _before(key, created_field, id_field):
+    created_at, pk = key
+    return Q(**{f'{created_field}__lt': created_at}) | Q(**{created_field: created_at, f'{id_field}__lt': pk})
+
+
+def home_timeline(user, limit, before=None):
+    """
+    Return up to ``limit`` posts for the user's home feed, newest first.
+
+    ``before`` is an optional ``(created_at, id)`` key; only posts strictly
+    older than it are returned.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if before is not None:
+        entries = entries.filter(_before(before, 'created_at', 'post_id'))
+    keys = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit])
+
+    heavy = heavy_author_ids()
+    if heavy:
+        pulled_authors = list(user.following.filter(id__in=heavy).values_list('id', flat=True))
+        if pulled_authors:
+            pulled = Post.objects.filter(author_id__in=pulled_authors)
+            if before is not None:
+                pulled = pulled.filter(_before(before, 'created_at', 'id'))
+            keys.extend(pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit])
+            keys = sorted(set(keys), reverse=True)[:limit]
+
+    posts = Post.objects.select_related('author').in_bulk([post_id for _, post_id in keys])
+    return [posts[post_id] for _, post_id in keys if post_id in posts]
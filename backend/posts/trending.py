@@ -0,0 +1,242 @@
+"""
+Incrementally maintained trending scores.
+
+Each public post from the last ``TRENDING_WINDOW_DAYS`` days has a score that
+decays exponentially with ``TRENDING_HALF_LIFE_HOURS``. Like, comment and view
+events add to it as they happen. To avoid rescaling every score as time
+passes, an event of weight ``w`` at time ``t`` contributes
+``w * 2 ** ((t - EPOCH) / half_life)``; the comparison between posts is the
+same as with the decayed value. Scores are kept as logarithms so they never
+overflow, and posts are ranked in a ``SortedList``.
+
+The top-N lists (overall and per department) are recomputed at most every
+``TRENDING_REFRESH_SECONDS`` and served from memory in between.
+
+Every process keeps its own engine. Each event it records is also counted
+per post, and every ``TRENDING_RESEED_SECONDS`` the engine reconciles with
+the post counters in the database: only engagement it has not counted
+(events handled by other workers, or unlikes) is added or subtracted, dated
+at the middle of the interval it must have happened in. Scores therefore
+keep their history across reseeds. Posts that are new, newly public, gone
+or private are picked up or dropped at the same time.
+"""
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from sortedcontainers import SortedList
+
+from .models import Post
+
+WINDOW = timedelta(days=getattr(settings, 'TRENDING_WINDOW_DAYS', 7))
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+REFRESH_SECONDS = getattr(settings, 'TRENDING_REFRESH_SECONDS', 30)
+RESEED_SECONDS = getattr(settings, 'TRENDING_RESEED_SECONDS', 600)
+TOP_N = getattr(settings, 'TRENDING_TOP_N', 15)
+
+POST_WEIGHT = 1.0
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+VIEW_WEIGHT = 0.1
+
+# Positions in the per-post engagement counts
+LIKES, COMMENTS, VIEWS = range(3)
+
+# Any fixed instant works; it only shifts every log score by the same amount
+EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+
+_GROWTH = math.log(2) / HALF_LIFE
+
+
+def _log_add(a, b):
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _log_sub(a, b):
+    """log(exp(a) - exp(b)), or None when the result would not be positive"""
+    if a is None or b >= a:
+        return None
+    return a + math.log1p(-math.exp(b - a))
+
+
+class TrendingEngine:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._scores = {}      # post_id -> log score
+        self._ranked = SortedList()  # (-log score, post_id)
+        self._departments = {}  # post_id -> author's department
+        self._created = {}     # post_id -> created_at timestamp
+        self._counted = {}     # post_id -> [likes, comments, views] in the score
+        self._ignored = set()  # private or too old to trend
+        self._top = []
+        self._top_by_department = {}
+        self._refreshed_at = None
+        self._seeded_at = None
+        self._seeded_wall = None  # time.time() of the last reseed
+
+    def _log_weight(self, weight, at):
+        return math.log(weight) + (at - EPOCH) * _GROWTH
+
+    def _bump(self, post_id, weight, at):
+        """Add ``weight`` (or take it away, if negative) at time ``at``"""
+        old = self._scores.get(post_id)
+        if weight > 0:
+            new = _log_add(old, self._log_weight(weight, at))
+        else:
+            # Never below the post's own weight
+            floor = self._log_weight(POST_WEIGHT, self._created[post_id])
+            new = max(_log_sub(old, self._log_weight(-weight, at)) or floor, floor)
+        if old is not None:
+            self._ranked.remove((-old, post_id))
+        self._scores[post_id] = new
+        self._ranked.add((-new, post_id))
+
+    def _track(self, post_id, department, created_at, counts=(0, 0, 0), now=None):
+        """Start ranking a post whose counters already hold ``counts``"""
+        now = time.time() if now is None else now
+        created = created_at.timestamp()
+        self._departments[post_id] = department
+        self._created[post_id] = created
+        self._counted[post_id] = [0, 0, 0]
+        self._ignored.discard(post_id)
+        self._bump(post_id, POST_WEIGHT, created)
+        self._catch_up(post_id, counts, (created + now) / 2)
+
+    def _catch_up(self, post_id, counts, at):
+        """Apply engagement in ``counts`` that the score does not include yet"""
+        counted = self._counted[post_id]
+        likes, comments, views = (new - old for new, old in zip(counts, counted))
+        # Buffered views reach the counter late, so the counter may lag behind
+        views = max(views, 0)
+        weight = likes * LIKE_WEIGHT + comments * COMMENT_WEIGHT + views * VIEW_WEIGHT
+        if weight:
+            self._bump(post_id, weight, at)
+        counted[LIKES], counted[COMMENTS] = counts[LIKES], counts[COMMENTS]
+        counted[VIEWS] += views
+
+    def forget(self, post_id):
+        """Stop ranking a post (deleted or made private)"""
+        with self._lock:
+            self._untrack(post_id)
+            self._ignored.add(post_id)
+            self._refreshed_at = None
+
+    def _untrack(self, post_id):
+        score = self._scores.pop(post_id, None)
+        if score is not None:
+            self._ranked.remove((-score, post_id))
+        self._departments.pop(post_id, None)
+        self._created.pop(post_id, None)
+        self._counted.pop(post_id, None)
+
+    def seed(self):
+        """Reconcile scores with the post counters; the first call builds them"""
+        since = timezone.now() - WINDOW
+        rows = Post.objects.filter(created_at__gte=since, is_public=True).values_list(
+            'id', 'created_at', 'author__department', 'likes_count', 'comments_count', 'views_count'
+        )
+        with self._lock:
+            now = time.time()
+            current = set()
+            for post_id, created_at, department, likes, comments, views in rows:
+                current.add(post_id)
+                if post_id in self._scores:
+                    self._departments[post_id] = department
+                    # Uncounted engagement happened at some point since the last reseed
+                    since_seed = max(self._seeded_wall or 0, self._created[post_id])
+                    self._catch_up(post_id, (likes, comments, views), (since_seed + now) / 2)
+                else:
+                    self._track(post_id, department, created_at, (likes, comments, views), now)
+            for post_id in set(self._scores) - current:
+                self._untrack(post_id)
+            self._ignored.clear()
+            self._seeded_at = time.monotonic()
+            self._seeded_wall = now
+            self._refreshed_at = None
+
+    def _ensure_seeded(self):
+        if self._seeded_at is None or time.monotonic() - self._seeded_at > RESEED_SECONDS:
+            self.seed()
+
+    def add_post(self, post, department):
+        """Start ranking a newly created (or newly public) post"""
+        if not post.is_public or post.created_at < timezone.now() - WINDOW:
+            return
+        with self._lock:
+            if post.id not in self._scores:
+                self._track(
+                    post.id, department, post.created_at,
+                    (post.likes_count, post.comments_count, post.views_count),
+                )
+                self._refreshed_at = None
+
+    def record(self, post_id, weight, counter):
+        """Add an engagement event of ``weight`` (negative to undo one) to a post's score"""
+        with self._lock:
+            self._ensure_seeded()
+            if post_id in self._ignored:
+                return
+            if post_id not in self._scores:
+                # Not seen by this process yet; its counters already include the event
+                post = Post.objects.filter(id=post_id).values_list(
+                    'created_at', 'author__department', 'is_public',
+                    'likes_count', 'comments_count', 'views_count',
+                ).first()
+                if post is None or not post[2] or post[0] < timezone.now() - WINDOW:
+                    self._ignored.add(post_id)
+                    return
+                self._track(post_id, post[1], post[0], post[3:])
+                if counter != VIEWS:
+                    return
+            self._bump(post_id, weight, time.time())
+            self._counted[post_id][counter] += 1 if weight > 0 else -1
+
+    def record_like(self, post_id):
+        self.record(post_id, LIKE_WEIGHT, LIKES)
+
+    def record_unlike(self, post_id):
+        self.record(post_id, -LIKE_WEIGHT, LIKES)
+
+    def record_comment(self, post_id):
+        self.record(post_id, COMMENT_WEIGHT, COMMENTS)
+
+    def record_view(self, post_id):
+        self.record(post_id, VIEW_WEIGHT, VIEWS)
+
+    def refresh(self):
+        """Recompute the cached top-N lists and drop posts outside the window"""
+        with self._lock:
+            cutoff = (timezone.now() - WINDOW).timestamp()
+            for post_id in [post_id for post_id, created in self._created.items() if created < cutoff]:
+                self._untrack(post_id)
+                self._ignored.add(post_id)
+
+            top, by_department = [], {}
+            for _, post_id in self._ranked:
+                if len(top) < TOP_N:
+                    top.append(post_id)
+                department_top = by_department.setdefault(self._departments.get(post_id), [])
+                if len(department_top) < TOP_N:
+                    department_top.append(post_id)
+            self._top = top
+            self._top_by_department = by_department
+            self._refreshed_at = time.monotonic()
+
+    def top(self, department=None):
+        """Post IDs of the current top-N, optionally for one department"""
+        with self._lock:
+            self._ensure_seeded()
+            if self._refreshed_at is None or time.monotonic() - self._refreshed_at > REFRESH_SECONDS:
+                self.refresh()
+            if department is None:
+                return list(self._top)
+            return list(self._top_by_department.get(department, []))
+
+
+trending_engine = TrendingEngine()
@@ -2,38 +2,41 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Post, Comment, Like
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from .models import Post, Comment, Like, COMMENT_MAX_DEPTH
+from . import likes, search, threads, timeline
+from .ingest import ingest_posts
+from .view_counter import view_counter
+from .trending import WINDOW as TRENDING_WINDOW, trending_engine
 from .serializers import (
     PostSerializer, 
+    PostSearchResultSerializer,
     PostCreateUpdateSerializer,
     CommentSerializer, 
+    CommentThreadSerializer,
     CommentCreateSerializer,
-    LikeSerializer
+    LikeSerializer,
+    LikeStateSerializer
 )
-from django.db.models import Count, Q, F
+from django.db import transaction
+from django.db.models import Q, F
 from django.utils import timezone
-from datetime import timedelta
+from backend.pagination import CommentKeysetPagination, CommentThreadKeysetPagination
 
 
 class PostViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing posts.
     """
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'content', 'author__username', 'author__first_name', 'author__last_name']
+    # ?search= is served from the FTS5 index in list() rather than a filter backend
+    filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'updated_at', 'views_count', 'likes_count']
     ordering = ['-created_at']
+    BULK_INGEST_MAX_ROWS = 5000
     
     def get_queryset(self):
         queryset = Post.objects.all().select_related('author')
         
-        # Include comment and like counts with different names to avoid conflict with properties
-        queryset = queryset.annotate(
-            likes_count_anno=Count('likes', distinct=True),
-            comments_count_anno=Count('comments', distinct=True)
-        )
-        
         # For non-public posts, only show the user's own posts
         if not self.request.user.is_authenticated:
             queryset = queryset.filter(is_public=True)
@@ -48,22 +51,81 @@ class PostViewSet(viewsets.ModelViewSet):
         return PostSerializer
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'trending']:
+        if self.action in ['list', 'retrieve', 'trending', 'trending_by_department']:
             return [AllowAny()]
+        if self.action == 'view_stats':
+            return [IsAdminUser()]
         return [IsAuthenticated()]
     
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('search', '').strip()
+        if not query:
+            return super().list(request, *args, **kwargs)
+        
+        # Ranked full-text search; the cursor is keyed on (score, id)
+        visible_posts = self.get_queryset()
+        page = self.paginator.paginate_keyset(
+            request,
+            lambda after, limit: search.search_posts(query, visible_posts, limit, after=after),
+            key_func=lambda post: (post.search_score, post.id),
+        )
+        serializer = PostSearchResultSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+    
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        timeline.fan_out_post(post)
+        trending_engine.add_post(post, self.request.user.department)
+    
+    def perform_update(self, serializer):
+        post = serializer.save()
+        if post.is_public:
+            # No-op unless the post was private until now
+            trending_engine.add_post(post, post.author.department)
+        else:
+            trending_engine.forget(post.id)
+    
+    def perform_destroy(self, instance):
+        trending_engine.forget(instance.id)
+        instance.delete()
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Increment view count
-        instance.views_count += 1
-        instance.save(update_fields=['views_count'])
+        # Buffer the view; it is written to the database in batches
+        view_counter.record(instance.id)
+        trending_engine.record_view(instance.id)
+        instance.views_count += view_counter.pending(instance.id)
         
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'])
+    def bulk_ingest(self, request):
+        """Create many posts at once from a JSON array; staff may set author_email per row"""
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {"error": "Expected a JSON array of posts"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > self.BULK_INGEST_MAX_ROWS:
+            return Response(
+                {"error": f"At most {self.BULK_INGEST_MAX_ROWS} posts can be ingested per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        report = ingest_posts(
+            enumerate(rows, start=1),
+            default_author=request.user,
+            allow_author_override=request.user.is_staff,
+        )
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def view_stats(self, request):
+        """Backlog and flush latency of the buffered view counter"""
+        return Response(view_counter.stats())
+    
     @action(detail=False, methods=['get'])
     def user_feed(self, request):
         """Get posts from users that the current user follows"""
@@ -73,43 +135,34 @@ class PostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        # Get posts from users the current user follows
-        following_users = request.user.following.all()
-        
-        posts = Post.objects.filter(
-            Q(author__in=following_users) | 
-            Q(author=request.user)
-        ).select_related('author').annotate(
-            likes_count_anno=Count('likes', distinct=True),
-            comments_count_anno=Count('comments', distinct=True)
-        ).order_by('-created_at')
-        
-        page = self.paginate_queryset(posts)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(posts, many=True)
+        # Read the precomputed timeline (own posts and posts from followed users)
+        page = self.paginator.paginate_keyset(
+            request,
+            lambda after, limit: timeline.home_timeline(request.user, limit, before=after),
+            key_func=lambda post: (post.created_at, post.id),
+            model=Post,
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    def _trending_response(self, post_ids):
+        # The engine only hears about privacy changes made in this process
+        # before its next reseed, so check visibility against the database
+        posts = Post.objects.select_related('author').filter(
+            id__in=post_ids, is_public=True, created_at__gte=timezone.now() - TRENDING_WINDOW
+        ).in_bulk()
+        serializer = self.get_serializer([posts[post_id] for post_id in post_ids if post_id in posts], many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def trending(self, request):
-        """Get trending posts based on recent activity"""
-        # Define what "recent" means - last 7 days
-        recent_date = timezone.now() - timedelta(days=7)
-        
-        # Get posts with high engagement (views, likes, comments) in the recent period
-        trending_posts = Post.objects.filter(
-            created_at__gte=recent_date,
-            is_public=True
-        ).select_related('author').annotate(
-            likes_count_anno=Count('likes', distinct=True),
-            comments_count_anno=Count('comments', distinct=True),
-            engagement_score=Count('likes', distinct=True) + Count('comments', distinct=True)*2 + (F('views_count')/10)
-        ).order_by('-engagement_score')[:15]
-        
-        serializer = self.get_serializer(trending_posts, many=True)
-        return Response(serializer.data)
+        """Get trending posts based on recent, time-decayed activity"""
+        return self._trending_response(trending_engine.top())
+    
+    @action(detail=False, methods=['get'], url_path=r'trending/(?P<department>[^/.]+)')
+    def trending_by_department(self, request, department=None):
+        """Get trending posts written by alumni of one department"""
+        return self._trending_response(trending_engine.top(department))
     
     @action(detail=False, methods=['get'])
     def my_posts(self, request):
@@ -134,6 +187,7 @@ class PostViewSet(viewsets.ModelViewSet):
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CommentKeysetPagination
     
     def get_queryset(self):
         # By default, only get top-level comments (no replies)
@@ -151,16 +205,52 @@ class CommentViewSet(viewsets.ModelViewSet):
             return CommentCreateSerializer
         return CommentSerializer
     
+    def get_max_depth(self):
+        """Reply levels to include, from ?depth= (defaults to all)"""
+        try:
+            depth = int(self.request.query_params.get('depth', COMMENT_MAX_DEPTH))
+        except ValueError:
+            depth = COMMENT_MAX_DEPTH
+        return max(0, min(depth, COMMENT_MAX_DEPTH))
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        # One query loads the first replies of every thread on the page
+        threads.attach_thread_previews(page, max_depth=self.get_max_depth())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user)
+            Post.adjust_counters(comment.post_id, comments_count=1)
+        trending_engine.record_comment(comment.post_id)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Deleting a comment also deletes its replies
+            _, deleted = instance.delete()
+            Post.adjust_counters(instance.post_id, comments_count=-deleted.get(Comment._meta.label, 0))
     
     @action(detail=True, methods=['get'])
     def replies(self, request, pk=None):
-        """Get replies to a specific comment"""
+        """Get all replies below a comment as a tree, paged in depth-first order"""
         comment = get_object_or_404(Comment, id=pk)
-        replies = Comment.objects.filter(parent=comment).select_related('author')
-        serializer = self.get_serializer(replies, many=True)
-        return Response(serializer.data)
+        max_depth = self.get_max_depth()
+        paginator = CommentThreadKeysetPagination()
+        page = paginator.paginate_keyset(
+            request,
+            lambda after, limit: threads.load_subtree(
+                comment, limit, max_depth=max_depth, after_path=after[0] if after else None
+            ),
+            key_func=lambda reply: (reply.path,),
+            model=Comment,
+        )
+        # Replies whose parent is on an earlier page are returned at the top
+        # level; their ``parent`` field says where they belong
+        serializer = CommentThreadSerializer(threads.build_tree(page), many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
 
 class LikeViewSet(viewsets.ModelViewSet):
@@ -180,15 +270,23 @@ class LikeViewSet(viewsets.ModelViewSet):
             
         post = get_object_or_404(Post, id=post_id)
         
-        # Check if user already liked the post
-        like, created = Like.objects.get_or_create(
-            post=post,
-            user=request.user
-        )
+        with transaction.atomic():
+            # Check if user already liked the post
+            like, created = Like.objects.get_or_create(
+                post=post,
+                user=request.user
+            )
+            
+            if not created:
+                # User already liked the post, so unlike it
+                like.delete()
+            Post.adjust_counters(post.id, likes_count=1 if created else -1)
+        if created:
+            trending_engine.record_like(post.id)
+        else:
+            trending_engine.record_unlike(post.id)
         
         if not created:
-            # User already liked the post, so unlike it
-            like.delete()
             return Response(
                 {"message": "Post unliked successfully"},
                 status=status.HTTP_200_OK
@@ -196,3 +294,43 @@ class LikeViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(like)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.adjust_counters(instance.post_id, likes_count=-1)
+        trending_engine.record_unlike(instance.post_id)
+    
+    @action(detail=False, methods=['post', 'put'])
+    def state(self, request):
+        """Idempotently set whether the current user likes one post or a batch of posts"""
+        serializer = LikeStateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        post_ids = serializer.validated_data['post_ids']
+        liked = serializer.validated_data['like']
+        
+        visible = set(
+            Post.objects.filter(Q(is_public=True) | Q(author=request.user), id__in=post_ids)
+            .values_list('id', flat=True)
+        )
+        missing = [post_id for post_id in post_ids if post_id not in visible]
+        if missing and 'post' in serializer.validated_data:
+            return Response(
+                {"error": "Post not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        found = [post_id for post_id in post_ids if post_id in visible]
+        changed = likes.set_like_state(request.user, found, liked)
+        for post_id in changed:
+            if liked:
+                trending_engine.record_like(post_id)
+            else:
+                trending_engine.record_unlike(post_id)
+        
+        return Response({
+            'like': liked,
+            'posts': found,
+            'changed': changed,
+            'missing': missing,
+        })
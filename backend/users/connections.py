@@ -0,0 +1,119 @@
+"""
+"Are these two users connected" checks.
+
+A connection is stored under its canonical ``(user_low, user_high)`` pair,
+so a check is one index-only lookup on ``users_connection_pair_idx``, which
+covers the pair and its status. Answers are kept
+in a process-local LRU for ``CONNECTION_CACHE_SECONDS``; the chat consumer
+asks on every message.
+
+The answer authorizes chat, so a removed connection must stop working in
+every process. ``users/signals.py`` drops a pair from this process's cache
+whenever its connection is saved or deleted and, once that commits, stamps
+the time in the shared ``CONNECTION_CACHE_SIGNAL_CACHE``. Every process
+reads the stamp at most every ``CONNECTION_CACHE_CHECK_SECONDS`` and stops
+trusting answers looked up before it, so other workers follow a change
+within about that long. Connection changes are rare next to checks, so
+dropping every older answer is cheap.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Connection
+
+CACHE_SECONDS = getattr(settings, 'CONNECTION_CACHE_SECONDS', 60)
+CACHE_SIZE = getattr(settings, 'CONNECTION_CACHE_SIZE', 50000)
+CHECK_SECONDS = getattr(settings, 'CONNECTION_CACHE_CHECK_SECONDS', 1)
+CHANGED_KEY = 'users:connections:changed_at'
+
+
+def _signal_cache():
+    return caches[getattr(settings, 'CONNECTION_CACHE_SIGNAL_CACHE', 'default')]
+
+
+def _key(user_id, other_id):
+    pair = Connection.pair(user_id, other_id)
+    return pair['user_low_id'], pair['user_high_id']
+
+
+class ConnectionCache:
+    def __init__(self, ttl=CACHE_SECONDS, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        # (user_low, user_high) -> (connected, expires_at, time.time() of the lookup)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed_at = 0.0  # newest change stamp seen
+        self._checked_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_changes(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at <= CHECK_SECONDS:
+            return
+        self._checked_at = now
+        changed_at = _signal_cache().get(CHANGED_KEY)
+        if changed_at is not None and changed_at > self._changed_at:
+            with self._lock:
+                self._changed_at = changed_at
+
+    def peek(self, user_id, other_id):
+        """The cached answer, or None if it has to be looked up"""
+        try:
+            key = _key(user_id, other_id)
+        except (TypeError, ValueError):
+            return False
+        self._check_changes()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic() and entry[2] > self._changed_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        return None
+
+    def are_connected(self, user_id, other_id):
+        connected = self.peek(user_id, other_id)
+        if connected is not None:
+            return connected
+
+        key = _key(user_id, other_id)
+        looked_up_at = time.time()
+        connected = Connection.objects.filter(
+            user_low_id=key[0], user_high_id=key[1], status='ACCEPTED'
+        ).exists()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (connected, time.monotonic() + self.ttl, looked_up_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return connected
+
+    def invalidate(self, user_id, other_id):
+        """Forget a pair here now, and in every process once the change commits"""
+        with self._lock:
+            self._entries.pop(_key(user_id, other_id), None)
+        transaction.on_commit(lambda: _signal_cache().set(CHANGED_KEY, time.time(), None))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+connection_cache = ConnectionCache()
+
+
+def are_connected(user_id, other_id):
+    """Whether two users have an accepted connection"""
+    return connection_cache.are_connected(user_id, other_id)
@@ -0,0 +1,132 @@
+"""
+Alumni directory queries behind ``AuthViewSet.network``.
+
+The "all matching users" section and one section per department are read
+with a single windowed query: every row is numbered within the whole result
+and within its department, and only the first ``limit + 1`` of either
+numbering are fetched. Facet counts by department and graduation year come
+from one ``GROUP BY`` over the same filters.
+
+Batch mates are served from a per-cohort snapshot keyed by ``(department,
+graduation_year)`` in the ``NETWORK_COHORT_CACHE`` cache, which is shared by
+all workers. ``users/signals.py`` drops a snapshot whenever one of its
+members changes, so every worker sees the change on its next read.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .serializers import UserSerializer
+
+User = get_user_model()
+
+COHORT_CACHE_TIMEOUT = getattr(settings, 'NETWORK_COHORT_CACHE_TIMEOUT', 600)
+
+# User fields that end up in a cohort snapshot
+SNAPSHOT_FIELDS = set(UserSerializer.Meta.fields)
+
+
+def _cache():
+    return caches[getattr(settings, 'NETWORK_COHORT_CACHE', 'default')]
+
+
+def cohort_cache_key(department, graduation_year):
+    return f'users:cohort:{department}:{graduation_year}'
+
+
+def cohort_snapshot(department, graduation_year):
+    """Serialized members of a cohort ordered by id, from cache when possible"""
+    if not department or graduation_year is None:
+        return []
+    key = cohort_cache_key(department, graduation_year)
+    snapshot = _cache().get(key)
+    if snapshot is None:
+        members = User.objects.filter(
+            department=department, graduation_year=graduation_year
+        ).order_by('id')
+        snapshot = [dict(data) for data in UserSerializer(members, many=True).data]
+        _cache().set(key, snapshot, COHORT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_cohort(department, graduation_year):
+    if department and graduation_year is not None:
+        key = cohort_cache_key(department, graduation_year)
+        _cache().delete(key)
+        # Another worker may re-read the old rows before the change commits
+        transaction.on_commit(lambda: _cache().delete(key))
+
+
+def batch_mates(user, limit, after_id=None):
+    """
+    Up to ``limit + 1`` members of ``user``'s cohort other than ``user``
+    with an id greater than ``after_id``.
+    """
+    members = [
+        member for member in cohort_snapshot(user.department, user.graduation_year)
+        if member['id'] != user.id and (after_id is None or member['id'] > after_id)
+    ]
+    return members[:limit + 1]
+
+
+def split_page(users, limit):
+    """Return a fetched ``limit + 1`` slice as ``(page, next_after_id)``"""
+    if len(users) <= limit:
+        return users, None
+    page = users[:limit]
+    last = page[-1]
+    return page, last['id'] if isinstance(last, dict) else last.id
+
+
+def sections(queryset, limit):
+    """
+    The first ``limit + 1`` users of ``queryset`` overall and per department,
+    ordered by id, in one query.
+
+    Returns ``(overall, {department: users})``.
+    """
+    rows = queryset.annotate(
+        overall_rank=Window(RowNumber(), order_by=F('id').asc()),
+        department_rank=Window(RowNumber(), partition_by=[F('department')], order_by=F('id').asc()),
+    ).filter(
+        Q(overall_rank__lte=limit + 1) | Q(department_rank__lte=limit + 1)
+    ).order_by('id')
+
+    overall, by_department = [], {}
+    for user in rows:
+        if user.overall_rank <= limit + 1:
+            overall.append(user)
+        if user.department and user.department_rank <= limit + 1:
+            by_department.setdefault(user.department, []).append(user)
+    return overall, by_department
+
+
+def section_page(queryset, limit, after_id=None):
+    """Up to ``limit + 1`` users of a single section after ``after_id``"""
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    return list(queryset.order_by('id')[:limit + 1])
+
+
+def facet_counts(queryset, graduation_year=None):
+    """
+    Matching users per department and per graduation year.
+
+    ``queryset`` must not be filtered by graduation year yet: the year facet
+    counts every year, while the department facet honours ``graduation_year``.
+    """
+    departments, years = {}, {}
+    rows = queryset.order_by().values('department', 'graduation_year').annotate(count=Count('id'))
+    for row in rows:
+        department, year, count = row['department'], row['graduation_year'], row['count']
+        if year is not None:
+            years[year] = years.get(year, 0) + count
+        if department and (graduation_year is None or year == graduation_year):
+            departments[department] = departments.get(department, 0) + count
+    return {
+        'department': dict(sorted(departments.items())),
+        'graduation_year': dict(sorted(years.items())),
+    }
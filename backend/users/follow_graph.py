@@ -0,0 +1,258 @@
+"""
+In-memory follow graph.
+
+Every user's followees and followers are kept as sorted ``array('q')`` of
+user IDs (8 bytes per edge and direction), so "is A following B" is a
+binary search and follower/following counts are array lengths. The graph is
+loaded from ``User.following`` on first use, updated incrementally by the
+``m2m_changed`` handlers in ``users/signals.py`` and reloaded every
+``FOLLOW_GRAPH_RELOAD_SECONDS``.
+
+Other workers' changes arrive through the shared ``FOLLOW_GRAPH_CACHE``.
+The same handlers call ``notify_changed()``, which stamps the time under
+both users' keys once the change commits. Before answering for a user, a process reads that user's
+stamp (at most every ``FOLLOW_GRAPH_CHECK_SECONDS``, or always when asked
+for a ``fresh`` answer) and, if the stamp is newer than its copy of the
+user, reloads just that user's edges. Every change stamps both of its ends,
+so checking the user a question is about is enough.
+
+``request_reload()`` (``manage.py rebuild_follow_graph``) leaves a marker in
+the same cache; every process checks for it at most every
+``FOLLOW_GRAPH_RELOAD_CHECK_SECONDS`` and reloads if it is newer than its
+graph.
+"""
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+
+User = get_user_model()
+Follow = User.following.through
+
+RELOAD_SECONDS = getattr(settings, 'FOLLOW_GRAPH_RELOAD_SECONDS', 600)
+RELOAD_CHECK_SECONDS = getattr(settings, 'FOLLOW_GRAPH_RELOAD_CHECK_SECONDS', 5)
+CHECK_SECONDS = getattr(settings, 'FOLLOW_GRAPH_CHECK_SECONDS', 1)
+RELOAD_KEY = 'users:follow_graph:reload_requested'
+# Stamps older than any process's last full load are no longer needed
+CHANGE_STAMP_TIMEOUT = 2 * RELOAD_SECONDS
+
+_EMPTY = array('q')
+
+
+def _signal_cache():
+    return caches[getattr(settings, 'FOLLOW_GRAPH_CACHE', 'default')]
+
+
+def _change_key(user_id):
+    return f'users:follow_graph:changed:{user_id}'
+
+
+def request_reload():
+    """Make every process reload its graph at its next reload check"""
+    _signal_cache().set(RELOAD_KEY, time.time(), None)
+
+
+def notify_changed(user_ids):
+    """Make every process re-read these users' edges once the change commits"""
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: follow_graph.publish(user_ids))
+
+
+def _contains(ids, value):
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
+
+
+def _insert(ids, value):
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        return False
+    ids.insert(position, value)
+    return True
+
+
+def _remove(ids, value):
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        del ids[position]
+        return True
+    return False
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._following = {}  # user_id -> sorted array of followee IDs
+        self._followers = {}  # user_id -> sorted array of follower IDs
+        self._edges = 0
+        self._loaded_at = None
+        self._loaded_wall = None  # time.time() when the last load started
+        self._checked_at = None
+        self._synced_wall = {}  # user_id -> time.time() when its edges were last re-read
+        self._user_checked_at = {}  # user_id -> time.monotonic() of its last stamp check
+        self.load_seconds = None
+        self.resyncs = 0
+
+    def load(self):
+        """Rebuild the whole graph from the database"""
+        started, started_wall = time.monotonic(), time.time()
+        following, followers = {}, {}
+        edges = 0
+        rows = Follow.objects.order_by('from_user_id', 'to_user_id').values_list('from_user_id', 'to_user_id')
+        for follower_id, followee_id in rows.iterator(chunk_size=10000):
+            following.setdefault(follower_id, array('q')).append(followee_id)
+            followers.setdefault(followee_id, array('q')).append(follower_id)
+            edges += 1
+        # Followers were appended in follower order, so they are sorted too
+        with self._lock:
+            self._following, self._followers, self._edges = following, followers, edges
+            self._loaded_at = self._checked_at = time.monotonic()
+            self._loaded_wall = started_wall
+            self._synced_wall, self._user_checked_at = {}, {}
+            self.load_seconds = self._loaded_at - started
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > RELOAD_SECONDS:
+            self.load()
+        elif now - self._checked_at > RELOAD_CHECK_SECONDS:
+            self._checked_at = now
+            requested = _signal_cache().get(RELOAD_KEY)
+            if requested is not None and requested > self._loaded_wall:
+                self.load()
+
+    def _ensure_current(self, user_id, fresh=False):
+        """Load the graph and pick up other processes' changes to ``user_id``"""
+        self._ensure_loaded()
+        now = time.monotonic()
+        checked_at = self._user_checked_at.get(user_id)
+        if not fresh and checked_at is not None and now - checked_at <= CHECK_SECONDS:
+            return
+        self._user_checked_at[user_id] = now
+        changed_at = _signal_cache().get(_change_key(user_id))
+        if changed_at is not None and changed_at > self._synced_wall.get(user_id, self._loaded_wall):
+            self._resync(user_id)
+
+    def _resync(self, user_id):
+        """Re-read one user's edges in both directions from the database"""
+        self._synced_wall[user_id] = time.time()
+        following = array('q', Follow.objects.filter(from_user_id=user_id).order_by('to_user_id')
+                           .values_list('to_user_id', flat=True))
+        followers = array('q', Follow.objects.filter(to_user_id=user_id).order_by('from_user_id')
+                          .values_list('from_user_id', flat=True))
+        for adjacency, reverse, ids in (
+            (self._following, self._followers, following),
+            (self._followers, self._following, followers),
+        ):
+            old, new = set(adjacency.get(user_id, _EMPTY)), set(ids)
+            for other_id in old - new:
+                _remove(reverse.get(other_id, array('q')), user_id)
+            for other_id in new - old:
+                _insert(reverse.setdefault(other_id, array('q')), user_id)
+            self._edges += len(new) - len(old)
+            adjacency[user_id] = ids
+        self.resyncs += 1
+
+    def publish(self, user_ids):
+        """Stamp a committed change to these users for every process"""
+        keys = {user_id: _change_key(user_id) for user_id in user_ids}
+        previous = _signal_cache().get_many(list(keys.values()))
+        stamp = time.time()
+        _signal_cache().set_many(dict.fromkeys(keys.values(), stamp), CHANGE_STAMP_TIMEOUT)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for user_id, key in keys.items():
+                # This process already applied its own change; a newer change
+                # from elsewhere that it has not read yet still needs a resync
+                if previous.get(key, 0) <= self._synced_wall.get(user_id, self._loaded_wall):
+                    self._synced_wall[user_id] = stamp
+
+    def is_following(self, follower_id, followee_id, fresh=False):
+        with self._lock:
+            self._ensure_current(follower_id, fresh)
+            return _contains(self._following.get(follower_id, _EMPTY), followee_id)
+
+    def following_count(self, user_id, fresh=False):
+        with self._lock:
+            self._ensure_current(user_id, fresh)
+            return len(self._following.get(user_id, _EMPTY))
+
+    def followers_count(self, user_id, fresh=False):
+        with self._lock:
+            self._ensure_current(user_id, fresh)
+            return len(self._followers.get(user_id, _EMPTY))
+
+    def following_ids(self, user_id):
+        with self._lock:
+            self._ensure_current(user_id)
+            return list(self._following.get(user_id, _EMPTY))
+
+    def follower_ids(self, user_id):
+        with self._lock:
+            self._ensure_current(user_id)
+            return list(self._followers.get(user_id, _EMPTY))
+
+    def add(self, follower_id, followee_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if _insert(self._following.setdefault(follower_id, array('q')), followee_id):
+                _insert(self._followers.setdefault(followee_id, array('q')), follower_id)
+                self._edges += 1
+
+    def remove(self, follower_id, followee_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if _remove(self._following.get(follower_id, array('q')), followee_id):
+                _remove(self._followers.get(followee_id, array('q')), follower_id)
+                self._edges -= 1
+
+    def forget_user(self, user_id):
+        """Drop every edge of a deleted user"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for followee_id in self._following.pop(user_id, _EMPTY):
+                _remove(self._followers.get(followee_id, array('q')), user_id)
+                self._edges -= 1
+            for follower_id in self._followers.pop(user_id, _EMPTY):
+                _remove(self._following.get(follower_id, array('q')), user_id)
+                self._edges -= 1
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            array_bytes = sum(
+                sys.getsizeof(ids)
+                for adjacency in (self._following, self._followers)
+                for ids in adjacency.values()
+            )
+            dict_bytes = sys.getsizeof(self._following) + sys.getsizeof(self._followers)
+            return {
+                'users': len(
+                    {user_id for user_id, ids in self._following.items() if ids}
+                    | {user_id for user_id, ids in self._followers.items() if ids}
+                ),
+                'edges': self._edges,
+                'array_bytes': array_bytes,
+                'index_bytes': dict_bytes,
+                'total_bytes': array_bytes + dict_bytes,
+                'bytes_per_edge': round((array_bytes + dict_bytes) / self._edges, 1) if self._edges else None,
+                'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+                'resyncs': self.resyncs,
+                'reload_seconds': RELOAD_SECONDS,
+                'reload_check_seconds': RELOAD_CHECK_SECONDS,
+                'check_seconds': CHECK_SECONDS,
+            }
+
+
+follow_graph = FollowGraph()
@@ -0,0 +1,172 @@
+"""
+Google sign-in helpers.
+
+``GoogleTokenVerifier`` checks Google ID tokens locally. Signatures are
+verified against Google's published key set, which is fetched once and
+reused for as long as the response's ``Cache-Control: max-age`` allows
+(``GOOGLE_CERTS_CACHE_SECONDS`` when it has none). A token signed with an
+unknown key id triggers one early refresh, at most every
+``MIN_REFRESH_SECONDS``, so key rotation is picked up without a fetch per
+login.
+
+Every HTTP call goes through one pooled ``requests.Session`` with timeouts
+and retries. The key set URL, accepted issuers and client IDs come from
+settings, so tests can point the verifier at a local stub issuer.
+"""
+import json
+import re
+import threading
+import time
+
+import requests
+import rsa
+from django.conf import settings
+from google.auth import jwt
+from google.auth._helpers import padded_urlsafe_b64decode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CERTS_URL = getattr(settings, 'GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+USERINFO_URL = getattr(settings, 'GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v3/userinfo')
+ISSUERS = tuple(getattr(settings, 'GOOGLE_ISSUERS', ('accounts.google.com', 'https://accounts.google.com')))
+CLIENT_IDS = tuple(getattr(settings, 'GOOGLE_CLIENT_IDS', ()))
+
+CERTS_CACHE_SECONDS = getattr(settings, 'GOOGLE_CERTS_CACHE_SECONDS', 3600)
+MIN_REFRESH_SECONDS = 60
+CLOCK_SKEW_SECONDS = 10
+
+# (connect, read) timeouts for calls to Google
+HTTP_TIMEOUT = getattr(settings, 'GOOGLE_HTTP_TIMEOUT', (3.05, 5))
+HTTP_RETRIES = getattr(settings, 'GOOGLE_HTTP_RETRIES', 2)
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def build_session(retries=HTTP_RETRIES, pool_size=10):
+    """A keep-alive session that retries idempotent calls on connection errors and 5xx"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+http_session = build_session()
+
+
+def _jwk_to_pem(key):
+    """PEM for an RSA key from a JWK set"""
+    n = int.from_bytes(padded_urlsafe_b64decode(key['n']), 'big')
+    e = int.from_bytes(padded_urlsafe_b64decode(key['e']), 'big')
+    return rsa.PublicKey(n, e).save_pkcs1().decode()
+
+
+def parse_certs(payload):
+    """Map key id to PEM from a JWK set or a ``{kid: certificate}`` document"""
+    if 'keys' in payload:
+        return {
+            key['kid']: _jwk_to_pem(key)
+            for key in payload['keys']
+            if key.get('kty') == 'RSA' and 'kid' in key
+        }
+    return dict(payload)
+
+
+class GoogleTokenVerifier:
+    def __init__(self, certs_url=CERTS_URL, audiences=CLIENT_IDS, issuers=ISSUERS, session=None):
+        self.certs_url = certs_url
+        self.audiences = tuple(audiences)
+        self.issuers = tuple(issuers)
+        self.session = session or http_session
+        self._certs = {}
+        self._expires_at = 0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.cache_hits = 0
+
+    def _fetch(self):
+        response = self.session.get(self.certs_url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else CERTS_CACHE_SECONDS
+
+        self._certs = parse_certs(response.json())
+        self._fetched_at = time.monotonic()
+        self._expires_at = self._fetched_at + max_age
+        self.fetches += 1
+
+    def certs(self, kid=None):
+        """The cached key set, refreshed when stale or missing ``kid``"""
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at:
+                self._fetch()
+            elif kid is not None and kid not in self._certs and now - self._fetched_at >= MIN_REFRESH_SECONDS:
+                # Google may have rotated its keys
+                self._fetch()
+            else:
+                self.cache_hits += 1
+            return self._certs
+
+    def verify(self, token):
+        """Return the claims of a valid ID token; raises ValueError otherwise"""
+        if not self.audiences:
+            raise ValueError('GOOGLE_CLIENT_IDS is not configured')
+        try:
+            header = json.loads(padded_urlsafe_b64decode(token.split('.')[0]))
+        except (ValueError, IndexError):
+            raise ValueError('Malformed ID token')
+
+        claims = jwt.decode(
+            token,
+            certs=self.certs(header.get('kid')),
+            audience=list(self.audiences),
+            clock_skew_in_seconds=CLOCK_SKEW_SECONDS,
+        )
+        if claims.get('iss') not in self.issuers:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._certs),
+                'fetches': self.fetches,
+                'cache_hits': self.cache_hits,
+                'expires_in': round(max(self._expires_at - time.monotonic(), 0), 1) if self._fetched_at else None,
+            }
+
+
+google_verifier = GoogleTokenVerifier()
+
+
+def looks_like_id_token(token):
+    # ID tokens are JWTs; OAuth access tokens are opaque strings
+    return token.count('.') == 2
+
+
+def fetch_userinfo(access_token):
+    """Claims for an OAuth access token from Google's userinfo endpoint"""
+    response = http_session.get(
+        USERINFO_URL,
+        headers={'Authorization': f'Bearer {access_token}'},
+        timeout=HTTP_TIMEOUT,
+    )
+    if response.status_code != 200:
+        raise ValueError('Failed to get user info from Google')
+    return response.json()
+
+
+def verify(token):
+    """Google's claims about the user for an ID token or an access token"""
+    if looks_like_id_token(token):
+        return google_verifier.verify(token)
+    return fetch_userinfo(token)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from users.follow_graph import RELOAD_CHECK_SECONDS, follow_graph, request_reload
+
+
+class Command(BaseCommand):
+    help = 'Make running servers reload their in-memory follow graphs and report the graph size'
+
+    def handle(self, *args, **options):
+        request_reload()
+        # Loaded here only to measure it; the servers load their own copies
+        follow_graph.load()
+        stats = follow_graph.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Requested a reload; running servers reload within {RELOAD_CHECK_SECONDS}s. "
+            f"The graph has {stats['edges']} follow edges for {stats['users']} users "
+            f"and loaded in {stats['load_seconds']}s ({stats['total_bytes']} bytes)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 index used by people search and autocomplete'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} users'))
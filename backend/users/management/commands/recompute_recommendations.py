@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users import recommendations
+from users.models import RecommendationRefresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute "people you may know" for users whose connections or follows changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every user instead')
+
+    def handle(self, *args, **options):
+        if options['full']:
+            started = timezone.now()
+            recomputed = recommendations.recompute()
+            RecommendationRefresh.objects.filter(requested_at__lte=started).delete()
+        else:
+            recomputed = recommendations.refresh_stale()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed recommendations for {recomputed} users'))
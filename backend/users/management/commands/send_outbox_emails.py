@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no messages are due')
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        sender = outbox.OutboxSender(batch_size=options['batch_size'])
+        try:
+            sender.run(interval=options['interval'], once=options['once'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Outbox sender stopped: {sender.stats()}'))
+        self.stdout.write(f'Queue: {outbox.queue_stats()}')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users import tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired activation and password reset tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=tokens.SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = tokens.sweep_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired tokens'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0007_connection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['department', 'graduation_year', 'id'], name='users_user_cohort_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_cohort_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE users_user_search USING fts5("
+                "name, email_local, department, graduation_year, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')",
+                "INSERT INTO users_user_search (rowid, name, email_local, department, graduation_year) "
+                "SELECT id, TRIM(first_name || ' ' || last_name || ' ' || username), "
+                "CASE WHEN instr(email, '@') > 0 THEN substr(email, 1, instr(email, '@') - 1) ELSE email END, "
+                "COALESCE(department, ''), COALESCE(CAST(graduation_year AS TEXT), '') "
+                "FROM users_user",
+            ],
+            reverse_sql="DROP TABLE users_user_search",
+        ),
+    ]
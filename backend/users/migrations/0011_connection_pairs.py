@@ -0,0 +1,64 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+STATUS_PRIORITY = {'ACCEPTED': 0, 'PENDING': 1, 'REJECTED': 2}
+
+
+def backfill_pairs(apps, schema_editor):
+    Connection = apps.get_model('users', 'Connection')
+    # When both users sent a request, keep the most advanced one (accepted
+    # first), then the oldest
+    kept, duplicates = {}, []
+    for connection in Connection.objects.order_by('created_at', 'id'):
+        pair = (min(connection.sender_id, connection.receiver_id), max(connection.sender_id, connection.receiver_id))
+        current = kept.get(pair)
+        if current is None:
+            kept[pair] = connection
+        elif STATUS_PRIORITY.get(connection.status, 3) < STATUS_PRIORITY.get(current.status, 3):
+            duplicates.append(current.id)
+            kept[pair] = connection
+        else:
+            duplicates.append(connection.id)
+
+    Connection.objects.filter(id__in=duplicates).delete()
+    for (user_low_id, user_high_id), connection in kept.items():
+        connection.user_low_id, connection.user_high_id = user_low_id, user_high_id
+    Connection.objects.bulk_update(kept.values(), ['user_low', 'user_high'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='user_high',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='user_low',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_pairs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='connection',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='user_low',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='connection',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='users_connection_unique_pair'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_connection_pairs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['receiver', 'status', '-created_at'], name='users_connection_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['sender', 'status', '-created_at'], name='users_connection_sent_idx'),
+        ),
+    ]
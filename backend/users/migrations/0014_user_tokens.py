@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_email_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='reset_password_expires',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='reset_password_token',
+        ),
+        migrations.CreateModel(
+            name='UserToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('ACTIVATION', 'Account activation'), ('PASSWORD_RESET', 'Password reset')], max_length=20)),
+                ('token_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
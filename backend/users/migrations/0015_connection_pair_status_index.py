@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_user_tokens'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='connection',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high', 'status'), name='users_connection_pair_idx'),
+        ),
+    ]
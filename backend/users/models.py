@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class User(AbstractUser):
@@ -14,8 +15,6 @@ class User(AbstractUser):
     department = models.CharField(max_length=50, null=True, blank=True)
     graduation_year = models.IntegerField(null=True, blank=True)
     google_id = models.CharField(max_length=255, null=True, blank=True, default='')
-    reset_password_token = models.CharField(max_length=255, null=True, blank=True, default='')
-    reset_password_expires = models.DateTimeField(null=True, blank=True)
     
     # Profile fields
     about = models.TextField(blank=True, default='')
@@ -36,6 +35,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # Cohort (batch mates) lookups and per-department directory sections
+            models.Index(fields=['department', 'graduation_year', 'id'], name='users_user_cohort_idx'),
+        ]
 
     def __str__(self):
         return self.email
@@ -52,12 +55,108 @@ class Connection(models.Model):
     
     sender = models.ForeignKey(User, related_name='sent_connections', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, related_name='received_connections', on_delete=models.CASCADE)
+    # The pair in canonical order, whoever sent the request
+    user_low = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['sender', 'receiver']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='users_connection_unique_pair'),
+            # Covers "are these two users connected" checks, status included. Unique
+            # like the pair itself, so SQLite prefers it to the pair's index,
+            # which would need a table lookup for the status
+            models.UniqueConstraint(fields=['user_low', 'user_high', 'status'], name='users_connection_pair_idx'),
+        ]
+        indexes = [
+            # Connection and request lists, newest first, and the pending count
+            models.Index(fields=['receiver', 'status', '-created_at'], name='users_connection_received_idx'),
+            models.Index(fields=['sender', 'status', '-created_at'], name='users_connection_sent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.email} -> {self.receiver.email} ({self.status})"
+
+    @staticmethod
+    def pair(user_id, other_id):
+        """Lookup kwargs for the connection between two users, in either direction"""
+        user_id, other_id = int(user_id), int(other_id)
+        return {'user_low_id': min(user_id, other_id), 'user_high_id': max(user_id, other_id)}
+
+    def save(self, *args, **kwargs):
+        pair = self.pair(self.sender_id, self.receiver_id)
+        self.user_low_id, self.user_high_id = pair['user_low_id'], pair['user_high_id']
+        super().save(*args, **kwargs)
+
+class Recommendation(models.Model):
+    """A precomputed "people you may know" candidate, see users/recommendations.py"""
+    user = models.ForeignKey(User, related_name='recommendations', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'candidate']
+        indexes = [
+            models.Index(fields=['user', '-score'], name='users_recommendation_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} for {self.user_id} ({self.score:.2f})"
+
+class RecommendationRefresh(models.Model):
+    """A user whose recommendations are stale because the graph around them changed"""
+    user = models.OneToOneField(User, primary_key=True, related_name='+', on_delete=models.CASCADE)
+    requested_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Refresh recommendations for {self.user_id}"
+
+class OutboxEmail(models.Model):
+    """An email waiting for the background sender, see users/outbox.py"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('DEAD', 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='users_outbox_due_idx'),
+            models.Index(fields=['status', 'sent_at'], name='users_outbox_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+class UserToken(models.Model):
+    """A single-use activation or password reset token, see users/tokens.py"""
+    PURPOSE_CHOICES = [
+        ('ACTIVATION', 'Account activation'),
+        ('PASSWORD_RESET', 'Password reset'),
+    ]
+
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    # SHA-256 of the secret half of the token; the token itself is never stored
+    token_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.purpose} token for {self.user_id}"
@@ -0,0 +1,212 @@
+"""
+Durable email outbox.
+
+Views call ``enqueue`` instead of talking SMTP inside the request: the
+message becomes an ``OutboxEmail`` row in the same transaction as whatever
+caused it. ``manage.py send_outbox_emails`` runs an ``OutboxSender``, which
+keeps one SMTP connection open while there is work and sends due messages
+in batches of ``EMAIL_OUTBOX_BATCH_SIZE``.
+
+Bodies can carry secrets such as password reset links, so a message's body
+is cleared as soon as it is sent or dead-lettered; only the subject,
+recipients and delivery record stay. Sent rows are purged after
+``EMAIL_OUTBOX_KEEP_SENT_DAYS`` and dead ones after
+``EMAIL_OUTBOX_KEEP_DEAD_DAYS``.
+
+A failed send is retried with exponential backoff (``EMAIL_OUTBOX_RETRY_SECONDS``
+doubling up to ``EMAIL_OUTBOX_MAX_BACKOFF_SECONDS``). After
+``EMAIL_OUTBOX_MAX_ATTEMPTS`` attempts, or on a permanent 5xx rejection, the
+message is marked ``DEAD`` and left in the table for inspection. Delivery is
+at least once: a sender that dies between handing a message to the server
+and recording it will send it again.
+"""
+import smtplib
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+BATCH_SIZE = getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+RETRY_SECONDS = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 30)
+MAX_BACKOFF_SECONDS = getattr(settings, 'EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', 3600)
+# Sent and dead messages are purged after this long
+KEEP_SENT_DAYS = getattr(settings, 'EMAIL_OUTBOX_KEEP_SENT_DAYS', 7)
+KEEP_DEAD_DAYS = getattr(settings, 'EMAIL_OUTBOX_KEEP_DEAD_DAYS', 30)
+# Close the SMTP connection after this long without work; servers drop idle clients
+IDLE_CLOSE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_IDLE_CLOSE_SECONDS', 30)
+
+# Sent messages kept in memory for latency percentiles
+LATENCY_SAMPLES = 1000
+
+
+def enqueue(subject, body, to, from_email=None):
+    """Queue an email for the background sender"""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def purge_finished(sent_days=KEEP_SENT_DAYS, dead_days=KEEP_DEAD_DAYS):
+    """Delete messages sent more than ``sent_days`` ago and dead ones older than ``dead_days``"""
+    now = timezone.now()
+    deleted, _ = OutboxEmail.objects.filter(
+        Q(status='SENT', sent_at__lt=now - timedelta(days=sent_days))
+        | Q(status='DEAD', created_at__lt=now - timedelta(days=dead_days))
+    ).delete()
+    return deleted
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a message that failed ``attempts`` times"""
+    return min(RETRY_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def _is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 3)
+
+
+class OutboxSender:
+    def __init__(self, batch_size=BATCH_SIZE, connection=None):
+        self.batch_size = batch_size
+        self.connection = connection or get_connection(fail_silently=False)
+        self.connections_opened = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds from enqueue to sent
+        self._smtp_seconds = deque(maxlen=LATENCY_SAMPLES)  # seconds spent in SMTP per message
+
+    def _open(self):
+        if self.connection.open():
+            self.connections_opened += 1
+
+    def close(self):
+        try:
+            self.connection.close()
+        except (smtplib.SMTPException, OSError):
+            # Already gone; close() has dropped it either way
+            pass
+
+    def send_due(self):
+        """Send one batch of due messages; returns how many were attempted"""
+        batch = list(
+            OutboxEmail.objects
+            .filter(status='PENDING', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:self.batch_size]
+        )
+        for email in batch:
+            self._send(email)
+        return len(batch)
+
+    def _send(self, email):
+        message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=self.connection)
+        started = time.monotonic()
+        try:
+            self._open()
+            if not self.connection.send_messages([message]):
+                raise smtplib.SMTPException('Message has no recipients')
+        except (smtplib.SMTPException, OSError) as error:
+            if isinstance(error, smtplib.SMTPServerDisconnected) or not isinstance(error, smtplib.SMTPException):
+                # The connection is gone; reconnect for the next message
+                self.close()
+            self._failed(email, error)
+            return
+
+        now = timezone.now()
+        self._smtp_seconds.append(time.monotonic() - started)
+        self._latencies.append((now - email.created_at).total_seconds())
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            status='SENT', sent_at=now, attempts=F('attempts') + 1, last_error='', body=''
+        )
+        self.sent += 1
+
+    def _failed(self, email, error):
+        attempts = email.attempts + 1
+        if attempts >= MAX_ATTEMPTS or _is_permanent(error):
+            OutboxEmail.objects.filter(pk=email.pk).update(
+                status='DEAD', attempts=attempts, last_error=repr(error), body=''
+            )
+            self.dead += 1
+        else:
+            OutboxEmail.objects.filter(pk=email.pk).update(
+                attempts=attempts,
+                next_attempt_at=timezone.now() + timedelta(seconds=backoff(attempts)),
+                last_error=repr(error),
+            )
+            self.retried += 1
+
+    def run(self, interval=1.0, once=False):
+        """Send until the queue is drained (``once``) or forever, polling every ``interval``"""
+        idle_since = time.monotonic()
+        purged_at = None
+        try:
+            while True:
+                if purged_at is None or time.monotonic() - purged_at > 3600:
+                    purge_finished()
+                    purged_at = time.monotonic()
+                attempted = self.send_due()
+                if attempted:
+                    idle_since = time.monotonic()
+                if attempted >= self.batch_size:
+                    continue
+                if once:
+                    return
+                if self.connection.connection is not None and time.monotonic() - idle_since > IDLE_CLOSE_SECONDS:
+                    self.close()
+                time.sleep(interval)
+        finally:
+            self.close()
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'dead': self.dead,
+            'connections_opened': self.connections_opened,
+            'latency_p50_seconds': _percentile(self._latencies, 0.5) if self._latencies else None,
+            'latency_p95_seconds': _percentile(self._latencies, 0.95) if self._latencies else None,
+            'smtp_p50_seconds': _percentile(self._smtp_seconds, 0.5) if self._smtp_seconds else None,
+        }
+
+
+def queue_stats():
+    """Queue depth and the age of the oldest waiting message, from the table"""
+    now = timezone.now()
+    counts = OutboxEmail.objects.aggregate(
+        pending=Count('id', filter=Q(status='PENDING')),
+        due=Count('id', filter=Q(status='PENDING', next_attempt_at__lte=now)),
+        retrying=Count('id', filter=Q(status='PENDING', attempts__gt=0)),
+        dead=Count('id', filter=Q(status='DEAD')),
+        oldest_pending=Min('created_at', filter=Q(status='PENDING')),
+    )
+    oldest = counts.pop('oldest_pending')
+    counts['oldest_pending_seconds'] = round((now - oldest).total_seconds(), 1) if oldest else None
+
+    recent = list(
+        OutboxEmail.objects.filter(status='SENT', sent_at__gte=now - timedelta(hours=1))
+        .order_by('-sent_at').values_list('created_at', 'sent_at')[:LATENCY_SAMPLES]
+    )
+    latencies = [(sent_at - created_at).total_seconds() for created_at, sent_at in recent]
+    counts['latency_samples'] = len(latencies)
+    counts['latency_p50_seconds'] = _percentile(latencies, 0.5) if latencies else None
+    counts['latency_p95_seconds'] = _percentile(latencies, 0.95) if latencies else None
+    return counts
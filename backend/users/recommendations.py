@@ -0,0 +1,216 @@
+"""
+"People you may know" recommendations.
+
+The social graph is loaded into a sparse symmetric ``n x n`` matrix ``A``:
+an accepted ``Connection`` weighs ``CONNECTION_WEIGHT`` and a follow
+``FOLLOW_WEIGHT`` (mutual follows add up). For a batch of users ``R``,
+``A[R] @ A`` scores every friend-of-friend by the weight of the paths
+through shared contacts and ``B[R] @ B`` over the 0/1 matrix counts the
+mutual contacts. Scores are boosted for a shared department and graduation
+year, and the top ``RECOMMENDATIONS_PER_USER`` candidates that are not
+already contacts are stored as ``Recommendation`` rows.
+
+Edge changes mark the users around them in ``RecommendationRefresh`` (see
+``users/signals.py``); ``manage.py recompute_recommendations`` recomputes
+only those users, or everyone with ``--full``. An incremental run loads
+only the part of the graph within two steps of the marked users, which is
+all their scores depend on.
+"""
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Connection, Recommendation, RecommendationRefresh
+
+User = get_user_model()
+Follow = User.following.through
+
+TOP_K = getattr(settings, 'RECOMMENDATIONS_PER_USER', 20)
+# Users scored per sparse product; bounds the size of the intermediate matrices
+BATCH_SIZE = getattr(settings, 'RECOMMENDATIONS_BATCH_SIZE', 1000)
+
+CONNECTION_WEIGHT = 1.0
+FOLLOW_WEIGHT = 0.5
+DEPARTMENT_BOOST = 0.5
+GRADUATION_YEAR_BOOST = 0.25
+
+# User IDs per IN (...) filter when loading part of the graph
+ID_CHUNK_SIZE = 500
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
+
+def _edges(user_ids=None):
+    """
+    ``(weight, source, target)`` for every accepted connection and follow,
+    or only those touching ``user_ids``
+    """
+    connections = Connection.objects.filter(status='ACCEPTED').values_list('sender_id', 'receiver_id')
+    follows = Follow.objects.values_list('from_user_id', 'to_user_id')
+    if user_ids is None:
+        for queryset, weight in ((connections, CONNECTION_WEIGHT), (follows, FOLLOW_WEIGHT)):
+            for source, target in queryset.iterator(chunk_size=10000):
+                yield weight, source, target
+        return
+
+    # A set, because an edge between two chunks is found twice
+    edges = set()
+    for chunk in _chunks(user_ids):
+        edges.update(
+            ('connection', source, target)
+            for source, target in connections.filter(Q(sender_id__in=chunk) | Q(receiver_id__in=chunk))
+        )
+        edges.update(
+            ('follow', source, target)
+            for source, target in follows.filter(Q(from_user_id__in=chunk) | Q(to_user_id__in=chunk))
+        )
+    for kind, source, target in edges:
+        yield (CONNECTION_WEIGHT if kind == 'connection' else FOLLOW_WEIGHT), source, target
+
+
+class SocialGraph:
+    """
+    Connections and follows as sparse matrices: of every user, or with
+    ``around``, of the users within two steps of ``around``
+    """
+
+    def __init__(self, around=None):
+        # One transaction, so users and edges come from the same snapshot
+        with transaction.atomic():
+            users = User.objects.order_by('id').values_list('id', 'department', 'graduation_year')
+            if around is None:
+                rows = list(users)
+                edges = list(_edges())
+            else:
+                around = set(around)
+                neighbours = around.union(*({source, target} for _, source, target in _edges(around)))
+                edges = list(_edges(neighbours))
+                ids = around.union(*({source, target} for _, source, target in edges))
+                rows = sorted(row for chunk in _chunks(ids) for row in users.filter(id__in=chunk))
+
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.index = {user_id: position for position, user_id in enumerate(self.ids.tolist())}
+
+        # Departments as integer codes so they compare vectorized; -1 is unknown
+        codes = {}
+        self.departments = np.array(
+            [codes.setdefault(row[1], len(codes)) if row[1] else -1 for row in rows], dtype=np.int32
+        )
+        self.years = np.array([row[2] if row[2] is not None else -1 for row in rows], dtype=np.int32)
+
+        sources, targets, weights = [], [], []
+        for weight, source, target in edges:
+            if source not in self.index or target not in self.index:
+                continue
+            sources.append(self.index[source])
+            targets.append(self.index[target])
+            weights.append(weight)
+
+        size = len(self.ids)
+        directed = sparse.coo_matrix(
+            (np.array(weights, dtype=np.float32), (np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64))),
+            shape=(size, size),
+        ).tocsr()
+        self.adjacency = (directed + directed.T).tocsr()
+        self.binary = (self.adjacency > 0).astype(np.float32).tocsr()
+
+    def top_candidates(self, rows, k):
+        """
+        The best ``k`` candidates for each user at matrix position in ``rows``,
+        as ``(user_id, candidate_id, score, mutual_count)`` tuples.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        contacts = self.adjacency[rows]
+        paths = (contacts @ self.adjacency).tocoo()
+        mutual = (self.binary[rows] @ self.binary).tocsr()
+
+        batch_rows, candidates, weights = paths.row, paths.col, paths.data
+        users = rows[batch_rows]
+
+        # Drop the user themselves and people they are already in touch with
+        known = np.asarray(contacts[batch_rows, candidates]).ravel() != 0
+        keep = (candidates != users) & ~known
+        batch_rows, candidates, weights, users = batch_rows[keep], candidates[keep], weights[keep], users[keep]
+        if not len(candidates):
+            return []
+
+        same_department = (self.departments[users] == self.departments[candidates]) & (self.departments[candidates] >= 0)
+        same_year = (self.years[users] == self.years[candidates]) & (self.years[candidates] >= 0)
+        scores = weights * (1 + DEPARTMENT_BOOST * same_department + GRADUATION_YEAR_BOOST * same_year)
+        mutual_counts = np.asarray(mutual[batch_rows, candidates]).ravel()
+
+        # Best first within each user, then keep the first k of every user
+        order = np.lexsort((candidates, -scores, batch_rows))
+        batch_rows, candidates, scores, mutual_counts = (
+            batch_rows[order], candidates[order], scores[order], mutual_counts[order]
+        )
+        rank = np.arange(len(batch_rows)) - np.searchsorted(batch_rows, batch_rows, side='left')
+        top = rank < k
+
+        return list(zip(
+            self.ids[rows[batch_rows[top]]].tolist(),
+            self.ids[candidates[top]].tolist(),
+            scores[top].astype(float).tolist(),
+            mutual_counts[top].astype(int).tolist(),
+        ))
+
+
+def recompute(user_ids=None):
+    """Recompute recommendations for ``user_ids``, or everyone; returns the number of users"""
+    graph = SocialGraph(around=user_ids)
+    if user_ids is None:
+        targets = graph.ids.tolist()
+    else:
+        targets = [user_id for user_id in user_ids if user_id in graph.index]
+
+    for start in range(0, len(targets), BATCH_SIZE):
+        batch = targets[start:start + BATCH_SIZE]
+        candidates = graph.top_candidates([graph.index[user_id] for user_id in batch], TOP_K)
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=batch).delete()
+            Recommendation.objects.bulk_create([
+                Recommendation(user_id=user_id, candidate_id=candidate_id, score=score, mutual_count=mutual_count)
+                for user_id, candidate_id, score, mutual_count in candidates
+            ])
+    return len(targets)
+
+
+def mark_stale(user_ids):
+    """
+    Queue ``user_ids`` and their contacts for recomputation: a changed edge
+    also changes which people are two steps away from their neighbours.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    affected = set(user_ids)
+    for _, source, target in _edges(user_ids):
+        affected.update((source, target))
+
+    now = timezone.now()
+    RecommendationRefresh.objects.bulk_create(
+        [RecommendationRefresh(user_id=user_id, requested_at=now) for user_id in affected],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['requested_at'],
+    )
+
+
+def refresh_stale():
+    """Recompute every user marked stale; returns the number of users recomputed"""
+    started = timezone.now()
+    user_ids = list(RecommendationRefresh.objects.values_list('user_id', flat=True))
+    if not user_ids:
+        return 0
+    recomputed = recompute(user_ids)
+    # Users marked again while we were computing stay queued
+    RecommendationRefresh.objects.filter(user_id__in=user_ids, requested_at__lte=started).delete()
+    return recomputed
@@ -0,0 +1,94 @@
+"""
+Typeahead people search backed by an SQLite FTS5 table.
+
+``users_user_search`` holds each user's name, the local part of their email,
+their department and graduation year, keyed by the user's id as rowid. It
+has prefix indexes for one to three characters so every keystroke of the
+Networking page is a single index lookup. It is kept in sync by the signal
+handlers in ``users/signals.py`` and can be rebuilt with
+``manage.py rebuild_user_search_index``.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from posts.search import build_match_expression
+
+User = get_user_model()
+
+SEARCH_TABLE = 'users_user_search'
+
+# BM25 column weights: name, email_local, department, graduation_year
+RANK_FUNCTION = 'bm25(10.0, 5.0, 2.0, 1.0)'
+
+INDEXED_FIELDS = {'first_name', 'last_name', 'username', 'email', 'department', 'graduation_year'}
+
+SOURCE_SQL = (
+    "SELECT id, TRIM(first_name || ' ' || last_name || ' ' || username), "
+    "CASE WHEN instr(email, '@') > 0 THEN substr(email, 1, instr(email, '@') - 1) ELSE email END, "
+    "COALESCE(department, ''), COALESCE(CAST(graduation_year AS TEXT), '') "
+    "FROM users_user"
+)
+
+INSERT_SQL = f'INSERT INTO {SEARCH_TABLE} (rowid, name, email_local, department, graduation_year) {SOURCE_SQL}'
+
+
+def index_users(user_ids):
+    """(Re)index the given users"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', user_ids)
+        cursor.execute(f'{INSERT_SQL} WHERE id IN ({placeholders})', user_ids)
+
+
+def unindex_user(user_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [user_id])
+
+
+def rebuild_index():
+    """Drop and repopulate the whole index; returns the number of users indexed"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(INSERT_SQL)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def matching_ids(query):
+    """
+    A subquery of the ids of users matching ``query``, for ``id__in=``
+    filters, or None if the query has no searchable words.
+    """
+    match = build_match_expression(query)
+    if not match:
+        return None
+    return RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match])
+
+
+def autocomplete(query, limit, exclude_id=None):
+    """
+    Up to ``limit`` users matching ``query``, best match first.
+
+    FTS5 scores every match and keeps the best ``limit`` (``ORDER BY rank``),
+    so these are the true top matches. On 100k users a one-letter prefix
+    takes tens of milliseconds; longer prefixes take about one.
+    """
+    match = build_match_expression(query)
+    if not match:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rank MATCH %s '
+            f'ORDER BY rank LIMIT %s',
+            [match, RANK_FUNCTION, limit + 1],
+        )
+        ids = [row[0] for row in cursor.fetchall() if row[0] != exclude_id][:limit]
+
+    found = User.objects.in_bulk(ids)
+    return [found[user_id] for user_id in ids if user_id in found]
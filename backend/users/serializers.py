@@ -84,6 +84,17 @@ class GoogleAuthSerializer(serializers.Serializer):
 
         return value
 
+def user_brief(user):
+    """Compact projection of a user for connection lists"""
+    return {
+        'id': user.id,
+        'email': user.email,
+        'full_name': user.get_full_name(),
+        'department': user.department,
+        'graduation_year': user.graduation_year,
+        'profile_pic': user.profile_pic.url if user.profile_pic else None
+    }
+
 class ConnectionSerializer(serializers.ModelSerializer):
     sender_details = serializers.SerializerMethodField()
     receiver_details = serializers.SerializerMethodField()
@@ -94,17 +105,22 @@ class ConnectionSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_sender_details(self, obj):
-        return {
-            'id': obj.sender.id,
-            'email': obj.sender.email,
-            'full_name': obj.sender.get_full_name(),
-            'profile_pic': obj.sender.profile_pic.url if obj.sender.profile_pic else None
-        }
+        return user_brief(obj.sender)
 
     def get_receiver_details(self, obj):
-        return {
-            'id': obj.receiver.id,
-            'email': obj.receiver.email,
-            'full_name': obj.receiver.get_full_name(),
-            'profile_pic': obj.receiver.profile_pic.url if obj.receiver.profile_pic else None
-        } 
\ No newline at end of file
+        return user_brief(obj.receiver)
+
+class ConnectionListSerializer(serializers.ModelSerializer):
+    """
+    A connection list row: only the party that is not the requesting user.
+    Expects that party to be loaded with select_related.
+    """
+    other_user = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Connection
+        fields = ['id', 'status', 'created_at', 'other_user']
+
+    def get_other_user(self, obj):
+        user_id = self.context['request'].user.id
+        return user_brief(obj.receiver if obj.sender_id == user_id else obj.sender)
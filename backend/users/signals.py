@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import directory, recommendations, search
+from .authentication import user_cache
+from .connections import connection_cache
+from .follow_graph import follow_graph, notify_changed
+from .models import Connection
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_init, sender=User)
+def remember_cohort(sender, instance, **kwargs):
+    # Read __dict__ so deferred fields are not loaded
+    instance._loaded_cohort = (instance.__dict__.get('department'), instance.__dict__.get('graduation_year'))
+
+
+@receiver(post_save, sender=User)
+def queue_recommendations_on_cohort_change(sender, instance, created, raw=False, **kwargs):
+    # Runs before invalidate_cohort_snapshots resets _loaded_cohort
+    if created or raw:
+        return
+    if instance._loaded_cohort != (instance.department, instance.graduation_year):
+        recommendations.mark_stale([instance.id])
+
+
+@receiver(post_save, sender=User)
+def invalidate_cohort_snapshots(sender, instance, update_fields=None, **kwargs):
+    # e.g. last_login updates do not change any snapshot
+    if update_fields is not None and not directory.SNAPSHOT_FIELDS & set(update_fields):
+        return
+    cohort = (instance.department, instance.graduation_year)
+    directory.invalidate_cohort(*cohort)
+    if instance._loaded_cohort != cohort:
+        directory.invalidate_cohort(*instance._loaded_cohort)
+        instance._loaded_cohort = cohort
+
+
+@receiver(post_delete, sender=User)
+def drop_from_cohort_snapshot(sender, instance, **kwargs):
+    directory.invalidate_cohort(*instance._loaded_cohort)
+    directory.invalidate_cohort(instance.department, instance.graduation_year)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not search.INDEXED_FIELDS & set(update_fields):
+        return
+    search.index_users([instance.id])
+
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    search.unindex_user(instance.id)
+
+
+@receiver(m2m_changed, sender=User.following.through)
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse means the change came through ``user.followers``
+    if action == 'pre_clear':
+        # Remember the edges while they are still in the database
+        related = instance.followers if reverse else instance.following
+        instance._cleared_follow_ids = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_follow_ids', ())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    update = follow_graph.remove if action in ('post_remove', 'post_clear') else follow_graph.add
+    for other_id in pk_set:
+        if reverse:
+            update(other_id, instance.id)
+        else:
+            update(instance.id, other_id)
+    notify_changed({instance.id, *pk_set})
+    recommendations.mark_stale({instance.id, *pk_set})
+
+
+@receiver(pre_delete, sender=User)
+def remember_follow_edges(sender, instance, **kwargs):
+    # The follow rows are deleted with the user, without m2m_changed
+    Follow = User.following.through
+    instance._follow_neighbor_ids = set(
+        Follow.objects.filter(from_user_id=instance.id).values_list('to_user_id', flat=True)
+    ) | set(Follow.objects.filter(to_user_id=instance.id).values_list('from_user_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def drop_from_follow_graph(sender, instance, **kwargs):
+    follow_graph.forget_user(instance.id)
+    notify_changed({instance.id, *instance.__dict__.pop('_follow_neighbor_ids', ())})
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def queue_recommendations_for_connection(sender, instance, raw=False, **kwargs):
+    # Only accepted connections are graph edges
+    if not raw and instance.status == 'ACCEPTED':
+        recommendations.mark_stale([instance.sender_id, instance.receiver_id])
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def invalidate_connection_cache(sender, instance, **kwargs):
+    connection_cache.invalidate(instance.sender_id, instance.receiver_id)
@@ -1,3 +1,649 @@
-from django.test import TestCase
+import base64
+import json
+import socketserver
+import threading
+import time
+from datetime import timedelta
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import rsa
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from google.auth import crypt, jwt
+from rest_framework.test import APIClient
+
+from backend.testing import isolated_caches
+from . import directory, google, outbox, recommendations, search, tokens
+from .connections import ConnectionCache
+from .follow_graph import FollowGraph, follow_graph, request_reload
+from .models import Connection, OutboxEmail, Recommendation, RecommendationRefresh, UserToken
+
+User = get_user_model()
+
+CLIENT_ID = 'test-client.apps.googleusercontent.com'
+ISSUER = 'https://accounts.google.com'
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+class StubIssuer:
+    """A local stand-in for Google's key set endpoint"""
+
+    def __init__(self):
+        self.keys = {}
+        self.requests = 0
+        self.max_age = 300
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                issuer.requests += 1
+                body = json.dumps({'keys': [
+                    {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': kid, 'n': _b64(public.n), 'e': _b64(public.e)}
+                    for kid, (public, _) in issuer.keys.items()
+                ]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', f'public, max-age={issuer.max_age}')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/certs'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add_key(self, kid):
+        public, private = rsa.newkeys(1024)
+        self.keys[kid] = (public, private)
+
+    def sign(self, kid, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': ISSUER, 'aud': CLIENT_ID, 'sub': '1234', 'email': 'ada@example.com',
+            'email_verified': True, 'iat': now, 'exp': now + 600, **claims,
+        }
+        private = self.keys[kid][1]
+        signer = crypt.RSASigner.from_string(private.save_pkcs1().decode(), key_id=kid)
+        return jwt.encode(signer, payload).decode()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@isolated_caches
+class GoogleTokenVerifierTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issuer = StubIssuer()
+        cls.issuer.add_key('key-1')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.issuer.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.issuer.requests = 0
+        self.verifier = google.GoogleTokenVerifier(
+            certs_url=self.issuer.url, audiences=[CLIENT_ID], issuers=[ISSUER], session=google.build_session(retries=0)
+        )
+
+    def test_key_set_is_fetched_once_and_cached(self):
+        for _ in range(3):
+            claims = self.verifier.verify(self.issuer.sign('key-1'))
+            self.assertEqual(claims['email'], 'ada@example.com')
+        self.assertEqual(self.issuer.requests, 1)
+        self.assertEqual(self.verifier.stats()['cache_hits'], 2)
+
+    def test_unknown_key_id_refreshes_key_set(self):
+        self.verifier.verify(self.issuer.sign('key-1'))
+        self.issuer.add_key('key-2')
+        with mock.patch.object(google, 'MIN_REFRESH_SECONDS', 0):
+            self.verifier.verify(self.issuer.sign('key-2'))
+        self.assertEqual(self.issuer.requests, 2)
+
+    def test_refresh_on_unknown_key_id_is_rate_limited(self):
+        self.verifier.verify(self.issuer.sign('key-1'))
+        with self.assertRaises(ValueError):
+            self.verifier.verify(self._foreign_token())
+        self.assertEqual(self.issuer.requests, 1)
+
+    def _foreign_token(self):
+        public, private = rsa.newkeys(1024)
+        signer = crypt.RSASigner.from_string(private.save_pkcs1().decode(), key_id='missing')
+        now = int(time.time())
+        return jwt.encode(signer, {'iss': ISSUER, 'aud': CLIENT_ID, 'iat': now, 'exp': now + 600}).decode()
+
+    def test_key_set_expires_after_max_age(self):
+        self.verifier.verify(self.issuer.sign('key-1'))
+        self.verifier._expires_at = time.monotonic() - 1
+        self.verifier.verify(self.issuer.sign('key-1'))
+        self.assertEqual(self.issuer.requests, 2)
+
+    def test_rejects_wrong_audience_issuer_and_expired_tokens(self):
+        now = int(time.time())
+        for claims in ({'aud': 'someone-else'}, {'iss': 'https://evil.example.com'}, {'iat': now - 7200, 'exp': now - 3600}):
+            with self.subTest(claims=claims), self.assertRaises(ValueError):
+                self.verifier.verify(self.issuer.sign('key-1', **claims))
+
+
+@isolated_caches
+class GoogleAuthViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issuer = StubIssuer()
+        cls.issuer.add_key('key-1')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.issuer.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        verifier = google.GoogleTokenVerifier(certs_url=self.issuer.url, audiences=[CLIENT_ID], issuers=[ISSUER])
+        patcher = mock.patch.object(google, 'google_verifier', verifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_id_token_signs_in_existing_user(self):
+        user = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+        response = self.client.post('/api/auth/google_auth/', {'token': self.issuer.sign('key-1')}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        user.refresh_from_db()
+        self.assertEqual(user.google_id, '1234')
+
+    def test_invalid_id_token_is_rejected(self):
+        token = self.issuer.sign('key-1', aud='someone-else')
+        response = self.client.post('/api/auth/google_auth/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class StubSMTPServer:
+    """A local SMTP stand-in that records messages and refuses ``rejected`` recipients"""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.rejected = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                with stub.lock:
+                    stub.connections += 1
+                self.reply('220 stub ready')
+                recipients = []
+                while True:
+                    line = self.rfile.readline().decode().strip()
+                    if not line:
+                        return
+                    command = line.split(' ', 1)[0].upper()
+                    if command in ('EHLO', 'HELO'):
+                        self.reply('250 stub')
+                    elif command == 'MAIL':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif command == 'RCPT':
+                        address = line.split(':', 1)[1].strip(' <>')
+                        if address in stub.rejected:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif command == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = b''
+                        while True:
+                            chunk = self.rfile.readline()
+                            if chunk == b'.\r\n':
+                                break
+                            data += chunk
+                        with stub.lock:
+                            stub.messages.append((recipients, message_from_bytes(data)))
+                        self.reply('250 OK queued')
+                    elif command == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('250 OK')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@isolated_caches
+class EmailOutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.smtp = StubSMTPServer()
+        cls.smtp_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=cls.smtp.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        cls.smtp_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp_settings.disable()
+        cls.smtp.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.smtp.messages.clear()
+        self.smtp.connections = 0
+        self.smtp.rejected.clear()
+
+    def test_forgot_password_only_enqueues(self):
+        user = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/auth/forgot_password/', {'email': 'ada@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.smtp.connections, 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.to, ['ada@example.com'])
+        self.assertEqual(email.status, 'PENDING')
+
+        # The reset link leaves the table with the email
+        outbox.OutboxSender().run(once=True)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.body), ('SENT', ''))
+        self.assertIn('/reset-password/', self.smtp.messages[0][1].get_payload(decode=True).decode())
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(5):
+            outbox.enqueue(f'Hello {i}', 'Body', [f'user{i}@example.com'], from_email='noreply@example.com')
+        sender = outbox.OutboxSender(batch_size=2)
+        sender.run(once=True)
+
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(OutboxEmail.objects.filter(status='SENT').count(), 5)
+        self.assertEqual(sender.stats()['sent'], 5)
+        self.assertEqual(outbox.queue_stats()['pending'], 0)
+
+    def test_rejected_message_is_dead_lettered_without_blocking_others(self):
+        self.smtp.rejected.add('gone@example.com')
+        dead = outbox.enqueue('Hello', 'Body', ['gone@example.com'])
+        sent = outbox.enqueue('Hello', 'Body', ['here@example.com'])
+        outbox.OutboxSender().run(once=True)
+
+        dead.refresh_from_db()
+        sent.refresh_from_db()
+        self.assertEqual(dead.status, 'DEAD')
+        self.assertEqual(dead.body, '')
+        self.assertIn('550', dead.last_error)
+        self.assertEqual(sent.status, 'SENT')
+        self.assertEqual(outbox.queue_stats()['dead'], 1)
+
+    def test_purge_deletes_old_sent_and_dead_messages(self):
+        old = timezone.now() - timedelta(days=outbox.KEEP_DEAD_DAYS + 1)
+        for status in ('SENT', 'DEAD', 'PENDING'):
+            outbox.enqueue(status, 'Body', ['ada@example.com'])
+        OutboxEmail.objects.update(created_at=old)
+        OutboxEmail.objects.filter(subject='SENT').update(status='SENT', sent_at=old)
+        OutboxEmail.objects.filter(subject='DEAD').update(status='DEAD')
+        outbox.enqueue('Recent', 'Body', ['ada@example.com'])
+        OutboxEmail.objects.filter(subject='Recent').update(status='DEAD')
+
+        self.assertEqual(outbox.purge_finished(), 2)
+        self.assertEqual(sorted(OutboxEmail.objects.values_list('subject', flat=True)), ['PENDING', 'Recent'])
+
+    def test_unreachable_server_backs_off_then_dead_letters(self):
+        email = outbox.enqueue('Hello', 'Body', ['ada@example.com'])
+        with override_settings(EMAIL_PORT=1):
+            sender = outbox.OutboxSender()
+            for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+                OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+                sender.run(once=True)
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempt)
+                if attempt < outbox.MAX_ATTEMPTS:
+                    self.assertEqual(email.status, 'PENDING')
+                    self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(email.status, 'DEAD')
+        self.assertEqual(self.smtp.messages, [])
+
+
+@isolated_caches
+class UserTokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+
+    def test_token_is_checked_with_one_query_and_used_once(self):
+        token = tokens.issue(self.user, tokens.PASSWORD_RESET)
+        self.assertNotIn(token.split('.', 1)[1], UserToken.objects.get().token_hash)
+        with self.assertNumQueries(1):
+            self.assertEqual(tokens.check(token, tokens.PASSWORD_RESET), self.user)
+        self.assertEqual(tokens.consume(token, tokens.PASSWORD_RESET), self.user)
+        self.assertIsNone(tokens.consume(token, tokens.PASSWORD_RESET))
+
+    def test_wrong_secret_purpose_or_new_token_rejects(self):
+        token = tokens.issue(self.user, tokens.PASSWORD_RESET)
+        token_id = token.split('.', 1)[0]
+        for candidate, purpose in ((f'{token_id}.wrong', tokens.PASSWORD_RESET), (token, tokens.ACTIVATION), ('garbage', tokens.PASSWORD_RESET)):
+            with self.subTest(token=candidate, purpose=purpose):
+                self.assertIsNone(tokens.check(candidate, purpose))
+        tokens.issue(self.user, tokens.PASSWORD_RESET)
+        self.assertIsNone(tokens.check(token, tokens.PASSWORD_RESET))
+
+    def test_sweep_deletes_only_expired_tokens(self):
+        expired = tokens.issue(self.user, tokens.PASSWORD_RESET)
+        UserToken.objects.update(expires_at=timezone.now())
+        valid = tokens.issue(self.user, tokens.ACTIVATION)
+        self.assertIsNone(tokens.check(expired, tokens.PASSWORD_RESET))
+        self.assertEqual(tokens.sweep_expired(batch_size=1), 1)
+        self.assertEqual(tokens.check(valid, tokens.ACTIVATION), self.user)
+
+
+@isolated_caches
+class PeopleSearchTests(TestCase):
+    def test_autocomplete_returns_best_ranked_matches(self):
+        User.objects.bulk_create(
+            [User(username=f'user{i}', email=f'patron{i}@example.com') for i in range(30)]
+            # Matched on the name, which outweighs an email match, but indexed last
+            + [User(username='pat', email='someone@example.com', first_name='Pat'),
+               User(username='searcher', email='searcher@example.com')]
+        )
+        search.index_users(User.objects.values_list('id', flat=True))
+        best, searcher = User.objects.get(username='pat'), User.objects.get(username='searcher')
+
+        results = search.autocomplete('pat', 3, exclude_id=searcher.id)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], best)
+        self.assertEqual(search.autocomplete('zzz', 3), [])
+
+
+@isolated_caches
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        caches[settings.FOLLOW_GRAPH_CACHE].clear()
+        self.ada = User.objects.create_user(username='ada', email='ada@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ada)
+        # The process-wide graph may hold edges from earlier tests
+        follow_graph.load()
+
+    def follow_behind_the_graphs_back(self):
+        # As if another worker had written the edge
+        User.following.through.objects.bulk_create([
+            User.following.through(from_user_id=self.ada.id, to_user_id=self.bob.id)
+        ])
+
+    def follow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/users/{self.bob.id}/follow/').data
+
+    def test_follow_toggle_updates_graph_and_counts(self):
+        resyncs = follow_graph.resyncs
+        self.assertEqual(self.follow(), {'is_following': True, 'follower_count': 1, 'following_count': 0})
+        self.assertTrue(follow_graph.is_following(self.ada.id, self.bob.id))
+        self.assertEqual((follow_graph.following_count(self.ada.id), follow_graph.followers_count(self.bob.id)), (1, 1))
+
+        self.assertEqual(self.follow(), {'is_following': False, 'follower_count': 0, 'following_count': 0})
+        self.assertFalse(follow_graph.is_following(self.ada.id, self.bob.id))
+        self.assertEqual(follow_graph.follower_ids(self.bob.id), [])
+        # This process's own changes are not read back from the database
+        self.assertEqual(follow_graph.resyncs, resyncs)
+
+    def test_other_workers_changes_are_picked_up(self):
+        self.assertFalse(follow_graph.is_following(self.ada.id, self.bob.id))
+        self.follow_behind_the_graphs_back()
+        # Stamped by the worker that made the change, which never loaded a graph
+        FollowGraph().publish([self.ada.id, self.bob.id])
+
+        with mock.patch('users.follow_graph.CHECK_SECONDS', 0):
+            profile = self.client.get(f'/api/users/{self.bob.id}/profile/').data
+        self.assertTrue(profile['is_followed_by_current_user'])
+        self.assertEqual(profile['follower_count'], 1)
+
+    def test_toggle_checks_for_changes_made_elsewhere(self):
+        self.assertFalse(follow_graph.is_following(self.ada.id, self.bob.id))
+        self.follow_behind_the_graphs_back()
+        FollowGraph().publish([self.ada.id, self.bob.id])
+        # Still within the check interval for plain reads
+        self.assertFalse(follow_graph.is_following(self.ada.id, self.bob.id))
+        self.assertEqual(self.follow(), {'is_following': False, 'follower_count': 0, 'following_count': 0})
+        self.assertFalse(self.ada.following.exists())
+
+    def test_reload_request_reaches_loaded_graphs(self):
+        graph = FollowGraph()
+        graph.load()
+        self.follow_behind_the_graphs_back()
+        request_reload()
+        with mock.patch('users.follow_graph.RELOAD_CHECK_SECONDS', 0):
+            self.assertTrue(graph.is_following(self.ada.id, self.bob.id))
+            self.assertEqual(graph.stats()['edges'], 1)
+
+
+@isolated_caches
+class RecommendationTests(TestCase):
+    def setUp(self):
+        User.objects.bulk_create([
+            User(username=name, email=f'{name}@example.com', department=department, graduation_year=2020)
+            for name, department in (
+                ('ada', 'CS'), ('bob', 'CS'), ('cy', 'EE'), ('dee', 'CS'), ('eve', 'CS'), ('fay', 'CS'),
+            )
+        ])
+        self.users = {user.username: user for user in User.objects.all()}
+
+    def connect(self, sender, receiver):
+        Connection.objects.create(sender=self.users[sender], receiver=self.users[receiver], status='ACCEPTED')
+
+    def recommended(self, name):
+        return [
+            (recommendation.candidate.username, recommendation.mutual_count)
+            for recommendation in Recommendation.objects.filter(user=self.users[name]).order_by('-score', 'candidate_id')
+        ]
+
+    def snapshot(self):
+        return sorted(Recommendation.objects.values_list('user_id', 'candidate_id', 'score', 'mutual_count'))
+
+    def test_friends_of_friends_ranked_by_paths_and_cohort(self):
+        self.connect('ada', 'bob')
+        self.connect('bob', 'cy')
+        self.connect('bob', 'dee')
+        self.connect('ada', 'eve')
+        self.connect('eve', 'dee')
+        self.users['ada'].following.add(self.users['fay'])
+        self.users['fay'].following.add(self.users['cy'])
+
+        recommendations.recompute()
+        # dee: two connection paths; cy: one connection and one follow path;
+        # bob and eve are contacts already and fay is followed
+        self.assertEqual(self.recommended('ada'), [('dee', 2), ('cy', 2)])
+        # Follows count in both directions, with less weight
+        self.assertEqual(self.recommended('fay'), [('bob', 2), ('eve', 1)])
+
+    def test_incremental_refresh_matches_full_recompute(self):
+        self.connect('ada', 'bob')
+        self.connect('bob', 'cy')
+        self.connect('dee', 'eve')
+        recommendations.recompute()
+        RecommendationRefresh.objects.all().delete()
+
+        # Marks the users around the new edge through the signals
+        self.connect('cy', 'dee')
+        self.users['eve'].following.add(self.users['fay'])
+        stale = set(RecommendationRefresh.objects.values_list('user_id', flat=True))
+        self.assertEqual(stale, {self.users[name].id for name in ('bob', 'cy', 'dee', 'eve', 'fay')})
+
+        self.assertEqual(recommendations.refresh_stale(), 5)
+        self.assertFalse(RecommendationRefresh.objects.exists())
+        incremental = self.snapshot()
+        recommendations.recompute()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertIn(('dee', 1), self.recommended('bob'))
+
+    def test_partial_graph_ignores_edges_to_unloaded_users(self):
+        self.connect('ada', 'bob')
+        self.connect('bob', 'cy')
+        with mock.patch.object(User.objects, 'order_by', return_value=User.objects.exclude(username='cy').order_by('id')):
+            recommendations.recompute()
+        self.assertEqual(self.recommended('ada'), [])
+
+
+@isolated_caches
+class ConnectionTests(TestCase):
+    def setUp(self):
+        caches[settings.CONNECTION_CACHE_SIGNAL_CACHE].clear()
+        User.objects.bulk_create([User(username=name, email=f'{name}@example.com') for name in ('ada', 'bob')])
+        self.ada, self.bob = User.objects.get(username='ada'), User.objects.get(username='bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ada)
+
+    def test_request_exists_in_either_direction(self):
+        response = self.client.post(f'/api/users/connections/send/{self.bob.id}/')
+        self.assertEqual(response.status_code, 201)
+        bob_client = APIClient()
+        bob_client.force_authenticate(self.bob)
+        response = bob_client.post(f'/api/users/connections/send/{self.ada.id}/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_duplicate_request_is_rejected(self):
+        # The other request commits the pair between our check and our insert
+        Connection.objects.create(sender=self.bob, receiver=self.ada)
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            response = self.client.post(f'/api/users/connections/send/{self.bob.id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Connection.objects.count(), 1)
+
+    def test_lists_return_only_the_other_party(self):
+        Connection.objects.create(sender=self.bob, receiver=self.ada)
+        response = self.client.get('/api/users/connections/requests/')
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(set(response.data[0]), {'id', 'status', 'created_at', 'other_user'})
+        self.assertEqual(response.data[0]['other_user']['id'], self.bob.id)
+
+        Connection.objects.update(status='ACCEPTED')
+        bob_client = APIClient()
+        bob_client.force_authenticate(self.bob)
+        for client, other in ((self.client, self.bob), (bob_client, self.ada)):
+            response = client.get('/api/users/connections/')
+            self.assertEqual([row['other_user']['id'] for row in response.data], [other.id])
+
+    def test_check_is_answered_from_the_pair_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(ConnectionCache().are_connected(self.ada.id, self.bob.id))
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[-1]['sql']}")
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        # SQLite reports unique constraints under their autoindex names
+        self.assertIn('USING COVERING INDEX', plan)
+        self.assertIn('(user_low_id=? AND user_high_id=? AND status=?)', plan)
+
+    def test_removal_reaches_other_processes(self):
+        connection = Connection.objects.create(sender=self.ada, receiver=self.bob, status='ACCEPTED')
+        # Another worker's cache, which the signals of this process do not touch
+        other = ConnectionCache()
+        self.assertTrue(other.are_connected(self.ada.id, self.bob.id))
+        self.assertTrue(other.are_connected(self.bob.id, self.ada.id))
+        self.assertEqual(other.stats(), {'entries': 1, 'hits': 1, 'misses': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            connection.delete()
+        with mock.patch('users.connections.CHECK_SECONDS', 0):
+            self.assertIsNone(other.peek(self.ada.id, self.bob.id))
+            self.assertFalse(other.are_connected(self.ada.id, self.bob.id))
+
+
+@isolated_caches
+class DirectoryTests(TestCase):
+    def setUp(self):
+        caches[settings.NETWORK_COHORT_CACHE].clear()
+        self.me, self.ada, self.bob, self.cy, self.dan, self.eve = User.objects.bulk_create([
+            User(username=name, email=f'{name}@example.com', department=department, graduation_year=year)
+            for name, department, year in [
+                ('me', 'CSE', 2020), ('ada', 'CSE', 2020), ('bob', 'CSE', 2020),
+                ('cy', 'EEE', 2020), ('dan', 'EEE', 2021), ('eve', None, 2021),
+            ]
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def network(self, **params):
+        response = self.client.get('/api/users/network/', {'page_size': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, users):
+        return [user['id'] for user in users]
+
+    def test_sections_cursors_and_facets(self):
+        data = self.network()
+        self.assertEqual(self.ids(data['batch_mates']), [self.ada.id])
+        self.assertEqual(self.ids(data['filtered_users']), [self.ada.id])
+        self.assertEqual(
+            {department: self.ids(users) for department, users in data['department_users'].items()},
+            {'CSE': [self.ada.id], 'EEE': [self.cy.id]},
+        )
+        self.assertEqual(data['facets'], {
+            'department': {'CSE': 2, 'EEE': 2},
+            'graduation_year': {2020: 3, 2021: 2},
+        })
+
+        page = self.network(section='EEE', cursor=data['cursors']['department_users']['EEE'])
+        self.assertEqual(self.ids(page['users']), [self.dan.id])
+        self.assertIsNone(page['next_cursor'])
+        page = self.network(section='batch_mates', cursor=data['cursors']['batch_mates'])
+        self.assertEqual(self.ids(page['users']), [self.bob.id])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_graduation_year_filter_keeps_year_facet(self):
+        data = self.network(graduation_year=2021)
+        self.assertEqual(self.ids(data['filtered_users']), [self.dan.id])
+        self.assertEqual(data['facets'], {
+            'department': {'EEE': 1},
+            'graduation_year': {2020: 3, 2021: 2},
+        })
+
+    def test_cohort_snapshot_is_dropped_when_a_member_moves(self):
+        self.assertEqual(self.ids(self.network(page_size=10)['batch_mates']), [self.ada.id, self.bob.id])
+        # Snapshots live in the cache shared by all workers
+        shared = caches[settings.NETWORK_COHORT_CACHE]
+        key = directory.cohort_cache_key('CSE', 2020)
+        self.assertIsNotNone(shared.get(key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada.department = 'EEE'
+            self.ada.save()
+            self.assertIsNone(shared.get(key))
+            # Re-read by another worker before the save commits
+            shared.set(key, [{'id': self.ada.id}, {'id': self.bob.id}])
+        self.assertIsNone(shared.get(key))
+        self.assertEqual(self.ids(self.network(page_size=10)['batch_mates']), [self.bob.id])
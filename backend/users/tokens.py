@@ -0,0 +1,97 @@
+"""
+Single-use account tokens (activation, password reset).
+
+A token is ``"<row id>.<secret>"``. Only the SHA-256 of the secret is stored
+in ``UserToken``, so checking a token is one primary key lookup and a
+constant-time compare of the hashes. A leaked table does not leak usable
+tokens. Issuing a token replaces the user's earlier tokens for the same
+purpose, and consuming one deletes it.
+
+Expired rows are deleted in bulk by ``manage.py sweep_expired_tokens``;
+lookups ignore them in the meantime.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UserToken
+
+ACTIVATION = 'ACTIVATION'
+PASSWORD_RESET = 'PASSWORD_RESET'
+
+LIFETIMES = {
+    ACTIVATION: timedelta(seconds=getattr(settings, 'ACTIVATION_TOKEN_SECONDS', 3 * 24 * 3600)),
+    PASSWORD_RESET: timedelta(seconds=getattr(settings, 'PASSWORD_RESET_TOKEN_SECONDS', 3600)),
+}
+SWEEP_BATCH_SIZE = 1000
+
+
+def _hash(secret):
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def _parse(token):
+    token_id, _, secret = (token or '').partition('.')
+    if not token_id.isdigit() or not secret:
+        return None, None
+    return int(token_id), secret
+
+
+def issue(user, purpose):
+    """A new token for ``user``; earlier tokens for the same purpose stop working"""
+    secret = secrets.token_urlsafe(32)
+    with transaction.atomic():
+        UserToken.objects.filter(user=user, purpose=purpose).delete()
+        row = UserToken.objects.create(
+            user=user,
+            purpose=purpose,
+            token_hash=_hash(secret),
+            expires_at=timezone.now() + LIFETIMES[purpose],
+        )
+    return f'{row.pk}.{secret}'
+
+
+def _lookup(token, purpose):
+    token_id, secret = _parse(token)
+    if token_id is None:
+        return None
+    row = (
+        UserToken.objects.select_related('user')
+        .filter(pk=token_id, purpose=purpose, expires_at__gt=timezone.now())
+        .first()
+    )
+    if row is None or not hmac.compare_digest(row.token_hash, _hash(secret)):
+        return None
+    return row
+
+
+def check(token, purpose):
+    """The user a valid token belongs to, or None"""
+    row = _lookup(token, purpose)
+    return row.user if row else None
+
+
+def consume(token, purpose):
+    """Like ``check``, but the token is used up; only one caller gets the user"""
+    row = _lookup(token, purpose)
+    if row is None:
+        return None
+    deleted, _ = UserToken.objects.filter(pk=row.pk).delete()
+    return row.user if deleted else None
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE):
+    """Delete expired tokens in batches; returns how many were deleted"""
+    now = timezone.now()
+    total = 0
+    while True:
+        ids = list(UserToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        deleted, _ = UserToken.objects.filter(id__in=ids).delete()
+        total += deleted
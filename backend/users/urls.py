@@ -14,5 +14,6 @@ urlpatterns = [
     path('connections/handle/<int:connection_id>/', views.handle_connection_request, name='handle_connection_request'),
     path('connections/remove/<int:connection_id>/', views.remove_connection, name='remove_connection'),
     path('connections/requests/', views.get_connection_requests, name='get_connection_requests'),
+    path('connections/requests/count/', views.get_connection_request_count, name='get_connection_request_count'),
     path('connections/', views.get_connections, name='get_connections'),
 ] 
\ No newline at end of file
@@ -1,19 +1,21 @@
-class AccountActivationTokenGenerator(PasswordResetTokenGenerator):
+from . import tokens
+
+
+class AccountActivationTokenGenerator:
+    """Activation tokens stored hashed in ``UserToken``, see users/tokens.py"""
+
     def make_token(self, user):
-        return super().make_token(user)
+        return tokens.issue(user, tokens.ACTIVATION)
+
+    def check_token(self, user, token):
+        owner = tokens.check(token, tokens.ACTIVATION)
+        return owner is not None and owner.pk == user.pk
 
     def decode_token(self, token):
-        try:
-            # Split the token to get the user id part
-            ts_b36, hash = token.split("-")
-            ts = base36_to_int(ts_b36)
-            
-            # Get user ID from timestamp
-            for user in User.objects.filter(is_active=False):
-                if self._make_token_with_timestamp(user, ts) == token:
-                    return user.id
+        # One primary key lookup; the token carries its row id
+        owner = tokens.check(token, tokens.ACTIVATION)
+        if owner is None:
             raise ValueError("Invalid token")
-        except Exception as e:
-            raise ValueError(f"Token decode error: {str(e)}")
+        return owner.id
 
-account_activation_token = AccountActivationTokenGenerator() 
\ No newline at end of file
+account_activation_token = AccountActivationTokenGenerator()
@@ -2,22 +2,29 @@ from django.shortcuts import render
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, authentication_classes, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model, authenticate
-from django.core.mail import send_mail
 from django.conf import settings
-from django.utils import timezone
-from datetime import timedelta
-import uuid
-import requests as http_requests
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 
-from .serializers import UserSerializer, RegisterSerializer, GoogleAuthSerializer, ConnectionSerializer
-from .models import Connection
+from .serializers import (
+    UserSerializer, RegisterSerializer, GoogleAuthSerializer, ConnectionSerializer, ConnectionListSerializer
+)
+from .models import Connection, Recommendation
+from . import directory, google, outbox, recommendations, search, tokens
+from .authentication import user_cache
+from .follow_graph import follow_graph
+from backend.pagination import DirectoryKeysetPagination, KeysetPagination
+from posts import timeline
 
 User = get_user_model()
 
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+RECOMMENDATIONS_LIMIT = 10
+
 class AuthViewSet(viewsets.GenericViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -26,6 +33,8 @@ class AuthViewSet(viewsets.GenericViewSet):
     def get_permissions(self):
         if self.action in ['register', 'login', 'google_auth']:
             return [AllowAny()]
+        if self.action in ['follow_graph_stats', 'auth_cache_stats', 'google_verifier_stats', 'email_outbox_stats']:
+            return [IsAdminUser()]
         return [IsAuthenticated()]
 
     def get_serializer_class(self):
@@ -65,25 +74,23 @@ class AuthViewSet(viewsets.GenericViewSet):
         email = request.data.get('email')
         password = request.data.get('password')
         
-        try:
-            user = User.objects.get(email=email)
-            user = authenticate(email=email, password=password)
-            if user:
-                refresh = RefreshToken.for_user(user)
-                return Response({
-                    'user': UserSerializer(user).data,
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                })
-            else:
-                return Response({
-                    'error': 'Invalid credentials'
-                }, status=status.HTTP_401_UNAUTHORIZED)
-                
-        except User.DoesNotExist:
+        # One lookup; the password is checked on the row we already have
+        user = User.objects.filter(email=email).first() if email else None
+        if user is None:
             return Response({
                 'error': 'No account found with this email'
             }, status=status.HTTP_404_NOT_FOUND)
+        
+        if password and user.check_password(password) and user.is_active:
+            refresh = RefreshToken.for_user(user)
+            return Response({
+                'user': UserSerializer(user).data,
+                'refresh': str(refresh),
+                'access': str(refresh.access_token),
+            })
+        return Response({
+            'error': 'Invalid credentials'
+        }, status=status.HTTP_401_UNAUTHORIZED)
 
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -97,19 +104,9 @@ class AuthViewSet(viewsets.GenericViewSet):
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             
-            # Get user info using the access token
-            access_token = serializer.validated_data['token']
-            userinfo_url = 'https://www.googleapis.com/oauth2/v3/userinfo'
-            headers = {'Authorization': f'Bearer {access_token}'}
-            
-            response = http_requests.get(userinfo_url, headers=headers)
-            
-            if response.status_code != 200:
-                raise ValueError('Failed to get user info from Google')
-            
-            userinfo = response.json()
-            print("Google userinfo:", userinfo)  # Debug print
-            
+            # ID tokens are verified locally; access tokens go to Google's userinfo endpoint
+            userinfo = google.verify(serializer.validated_data['token'])
+
             # Verify the user's email
             if not userinfo.get('email') or not userinfo.get('email_verified'):
                 raise ValueError('Email not verified with Google')
@@ -177,19 +174,16 @@ class AuthViewSet(viewsets.GenericViewSet):
         email = request.data.get('email')
         try:
             user = User.objects.get(email=email)
-            token = str(uuid.uuid4())
-            user.reset_password_token = token
-            user.reset_password_expires = timezone.now() + timedelta(hours=1)
-            user.save()
-
-            reset_link = f"http://localhost:5173/reset-password/{token}"
-            send_mail(
-                'Reset your LinkUp password',
-                f'Click this link to reset your password: {reset_link}',
-                settings.EMAIL_HOST_USER,
-                [email],
-                fail_silently=False,
-            )
+            # Sent by manage.py send_outbox_emails, see users/outbox.py
+            with transaction.atomic():
+                token = tokens.issue(user, tokens.PASSWORD_RESET)
+                reset_link = f"http://localhost:5173/reset-password/{token}"
+                outbox.enqueue(
+                    'Reset your LinkUp password',
+                    f'Click this link to reset your password: {reset_link}',
+                    [email],
+                    from_email=settings.EMAIL_HOST_USER,
+                )
             return Response({
                 'message': 'Password reset instructions sent to your email'
             })
@@ -202,69 +196,102 @@ class AuthViewSet(viewsets.GenericViewSet):
     def reset_password(self, request):
         token = request.data.get('token')
         password = request.data.get('password')
-        try:
-            user = User.objects.get(
-                reset_password_token=token,
-                reset_password_expires__gt=timezone.now()
-            )
+        with transaction.atomic():
+            user = tokens.consume(token, tokens.PASSWORD_RESET)
+            if user is None:
+                return Response({
+                    'error': 'Invalid or expired reset token'
+                }, status=status.HTTP_400_BAD_REQUEST)
             user.set_password(password)
-            user.reset_password_token = ''
-            user.reset_password_expires = None
             user.save()
-            return Response({
-                'message': 'Password reset successful'
-            })
-        except User.DoesNotExist:
-            return Response({
-                'error': 'Invalid or expired reset token'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': 'Password reset successful'
+        })
 
     @action(detail=False, methods=['get'])
     def network(self, request):
-        """Get users based on filters"""
+        """Get directory sections with per-section limits, cursors and facet counts"""
+        paginator = DirectoryKeysetPagination()
+        limit = paginator.get_page_size(request)
+        after = paginator.decode_cursor(request, User)
+        after_id = after[0] if after else None
+        section = request.query_params.get('section', '').strip()
+        search_term = request.query_params.get('search', '').strip()
+        graduation_year = request.query_params.get('graduation_year', '').strip()
+        if graduation_year:
+            try:
+                graduation_year = int(graduation_year)
+            except ValueError:
+                return Response({
+                    'error': 'graduation_year must be a number'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            graduation_year = None
+
         try:
-            # Get query parameters
-            search_term = request.query_params.get('search', '').strip()
-            graduation_year = request.query_params.get('graduation_year', '')
-            
             # Start with all users except the current user
             queryset = User.objects.exclude(id=request.user.id)
             
-            # Apply search if provided
+            # Apply search if provided, through the people search index
             if search_term:
-                queryset = queryset.filter(
-                    Q(first_name__icontains=search_term) |
-                    Q(last_name__icontains=search_term) |
-                    Q(department__icontains=search_term)
-                )
+                matches = search.matching_ids(search_term)
+                queryset = queryset.filter(id__in=matches) if matches is not None else queryset.none()
+            searched = queryset
             
             # Apply graduation year filter if provided
-            if graduation_year:
+            if graduation_year is not None:
                 queryset = queryset.filter(graduation_year=graduation_year)
-            
-            # Get batch mates (same department and graduation year)
-            batch_mates = User.objects.filter(
-                department=request.user.department,
-                graduation_year=request.user.graduation_year
-            ).exclude(id=request.user.id)
-            
-            # Get department-wise users
-            department_users = {}
-            departments = ['CSE', 'EEE', 'ECE', 'AGRI']  # Update with your departments
-            
-            # If searching, only include departments that match the search
-            if search_term:
-                departments = [d for d in departments if search_term.upper() in d]
-            
-            for dept in departments:
-                dept_queryset = queryset.filter(department=dept)
-                if dept_queryset.exists():
-                    department_users[dept] = UserSerializer(dept_queryset, many=True).data
+
+            # Users that appear in several sections are serialized once
+            serialized = {}
+
+            def page_data(users):
+                page, next_after_id = directory.split_page(users, limit)
+                data = []
+                for user in page:
+                    if isinstance(user, dict):
+                        data.append(user)
+                        continue
+                    if user.id not in serialized:
+                        serialized[user.id] = UserSerializer(user).data
+                    data.append(serialized[user.id])
+                cursor = paginator.encode_cursor([next_after_id]) if next_after_id is not None else None
+                return data, cursor
+
+            # Next page of a single section
+            if section:
+                if section == 'batch_mates':
+                    users = directory.batch_mates(request.user, limit, after_id)
+                elif section == 'filtered_users':
+                    users = directory.section_page(queryset, limit, after_id)
+                else:
+                    users = directory.section_page(queryset.filter(department=section), limit, after_id)
+                users, cursor = page_data(users)
+                return Response({
+                    'section': section,
+                    'users': users,
+                    'next_cursor': cursor
+                })
+
+            # Batch mates (same department and graduation year) come from the cohort cache
+            batch_mates, batch_mates_cursor = page_data(directory.batch_mates(request.user, limit))
+
+            overall, by_department = directory.sections(queryset, limit)
+            filtered_users, filtered_cursor = page_data(overall)
+            department_users, department_cursors = {}, {}
+            for dept, users in by_department.items():
+                department_users[dept], department_cursors[dept] = page_data(users)
             
             return Response({
-                'batch_mates': UserSerializer(batch_mates, many=True).data,
+                'batch_mates': batch_mates,
                 'department_users': department_users,
-                'filtered_users': UserSerializer(queryset, many=True).data
+                'filtered_users': filtered_users,
+                'facets': directory.facet_counts(searched, graduation_year),
+                'cursors': {
+                    'batch_mates': batch_mates_cursor,
+                    'filtered_users': filtered_cursor,
+                    'department_users': department_cursors
+                }
             })
             
         except Exception as e:
@@ -272,13 +299,26 @@ class AuthViewSet(viewsets.GenericViewSet):
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Get the best matching people for a typeahead query"""
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT)), AUTOCOMPLETE_MAX_LIMIT))
+        except ValueError:
+            limit = AUTOCOMPLETE_LIMIT
+        users = search.autocomplete(query, limit, exclude_id=request.user.id)
+        return Response(UserSerializer(users, many=True).data)
+
     @action(detail=True, methods=['get', 'patch'])
     def profile(self, request, pk=None):
         try:
             user = self.get_object()
             if request.method == 'GET':
                 data = UserSerializer(user).data
-                data['is_followed_by_current_user'] = user.followers.filter(id=request.user.id).exists()
+                data['is_followed_by_current_user'] = follow_graph.is_following(request.user.id, user.id)
+                data['follower_count'] = follow_graph.followers_count(user.id)
+                data['following_count'] = follow_graph.following_count(user.id)
                 return Response(data)
             
             elif request.method == 'PATCH' and request.user.id == user.id:
@@ -300,6 +340,48 @@ class AuthViewSet(viewsets.GenericViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def recommendations(self, request):
+        """Get "people you may know" for the current user"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', RECOMMENDATIONS_LIMIT)), recommendations.TOP_K))
+        except ValueError:
+            limit = RECOMMENDATIONS_LIMIT
+        candidates = Recommendation.objects.filter(user=request.user).select_related('candidate').order_by('-score')
+        results = []
+        for recommendation in candidates:
+            # Skip people followed since the last recompute
+            if follow_graph.is_following(request.user.id, recommendation.candidate_id):
+                continue
+            results.append({
+                'user': UserSerializer(recommendation.candidate).data,
+                'score': recommendation.score,
+                'mutual_count': recommendation.mutual_count
+            })
+            if len(results) == limit:
+                break
+        return Response(results)
+
+    @action(detail=False, methods=['get'])
+    def auth_cache_stats(self, request):
+        """Hit/miss counters of this process's authenticated-user cache"""
+        return Response(user_cache.stats())
+
+    @action(detail=False, methods=['get'])
+    def google_verifier_stats(self, request):
+        """Key set cache counters of this process's Google ID token verifier"""
+        return Response(google.google_verifier.stats())
+
+    @action(detail=False, methods=['get'])
+    def email_outbox_stats(self, request):
+        """Depth of the email outbox and recent enqueue-to-sent latency"""
+        return Response(outbox.queue_stats())
+
+    @action(detail=False, methods=['get'])
+    def follow_graph_stats(self, request):
+        """Size and memory usage of this process's follow graph"""
+        return Response(follow_graph.stats())
+
     @action(detail=True, methods=['post'])
     def follow(self, request, pk=None):
         try:
@@ -310,17 +392,21 @@ class AuthViewSet(viewsets.GenericViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if request.user.following.filter(id=user_to_follow.id).exists():
+            # Decide from the graph after picking up other workers' changes
+            # to this user; the signal handlers update it as the edge changes
+            if follow_graph.is_following(request.user.id, user_to_follow.id, fresh=True):
                 request.user.following.remove(user_to_follow)
+                timeline.unfollow(request.user, user_to_follow)
                 is_following = False
             else:
                 request.user.following.add(user_to_follow)
+                timeline.follow(request.user, user_to_follow)
                 is_following = True
 
             return Response({
                 'is_following': is_following,
-                'follower_count': user_to_follow.followers.count(),
-                'following_count': user_to_follow.following.count()
+                'follower_count': follow_graph.followers_count(user_to_follow.id, fresh=True),
+                'following_count': follow_graph.following_count(user_to_follow.id)
             })
             
         except Exception as e:
@@ -332,25 +418,28 @@ def send_connection_request(request, user_id):
     try:
         receiver = User.objects.get(id=user_id)
         
-        # Check if connection already exists
-        existing_connection = Connection.objects.filter(
-            (Q(sender=request.user, receiver=receiver) | 
-             Q(sender=receiver, receiver=request.user))
-        ).first()
-        
-        if existing_connection:
+        # Check if connection already exists, in either direction
+        if Connection.objects.filter(**Connection.pair(request.user.id, receiver.id)).exists():
             return Response(
                 {"error": "Connection request already exists"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        connection = Connection.objects.create(
-            sender=request.user,
-            receiver=receiver,
-            status='PENDING'
-        )
+        try:
+            with transaction.atomic():
+                connection = Connection.objects.create(
+                    sender=request.user,
+                    receiver=receiver,
+                    status='PENDING'
+                )
+        except IntegrityError:
+            # A concurrent request created the pair after the check above
+            return Response(
+                {"error": "Connection request already exists"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = ConnectionSerializer(connection)
+        serializer = ConnectionSerializer(connection, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
     except User.DoesNotExist:
@@ -375,7 +464,7 @@ def handle_connection_request(request, connection_id):
         connection.status = 'ACCEPTED' if action == 'accept' else 'REJECTED'
         connection.save()
         
-        serializer = ConnectionSerializer(connection)
+        serializer = ConnectionSerializer(connection, context={'request': request})
         return Response(serializer.data)
         
     except Connection.DoesNotExist:
@@ -390,9 +479,18 @@ def get_connection_requests(request):
     connections = Connection.objects.filter(
         receiver=request.user,
         status='PENDING'
-    )
-    serializer = ConnectionSerializer(connections, many=True)
-    return Response(serializer.data)
+    ).select_related('sender')
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(connections, request)
+    serializer = ConnectionListSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_connection_request_count(request):
+    """Number of pending requests, for the notification badge"""
+    count = Connection.objects.filter(receiver=request.user, status='PENDING').count()
+    return Response({'count': count})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -400,9 +498,11 @@ def get_connections(request):
     connections = Connection.objects.filter(
         (Q(sender=request.user) | Q(receiver=request.user)),
         status='ACCEPTED'
-    )
-    serializer = ConnectionSerializer(connections, many=True)
-    return Response(serializer.data)
+    ).select_related('sender', 'receiver')
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(connections, request)
+    serializer = ConnectionListSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
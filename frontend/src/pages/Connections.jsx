@@ -3,13 +3,11 @@ import { motion } from 'framer-motion';
 import axios from 'axios';
 import { toast } from 'react-hot-toast';
 import { useNavigate } from 'react-router-dom';
+import { fetchAllPages } from '../utils/pagination';
 
 const ConnectionCard = ({ connection, onAccept, onReject, onRemove, type }) => {
-  const currentUserId = parseInt(localStorage.getItem('userId'));
   const navigate = useNavigate();
-  const user = type === 'request' ? connection.sender_details : 
-    (connection.sender_details.id === currentUserId ? 
-      connection.receiver_details : connection.sender_details);
+  const user = connection.other_user;
 
   const handleMessage = () => {
     navigate('/dashboard/messages', { state: { selectedUser: user } });
@@ -80,8 +78,7 @@ const Connections = () => {
 
   const fetchRequests = async () => {
     try {
-      const response = await axios.get('/api/users/connections/requests/');
-      setRequests(response.data);
+      setRequests(await fetchAllPages(axios, '/api/users/connections/requests/'));
     } catch (error) {
       console.error('Error fetching requests:', error);
       toast.error('Failed to load connection requests');
@@ -90,8 +87,7 @@ const Connections = () => {
 
   const fetchConnections = async () => {
     try {
-      const response = await axios.get('/api/users/connections/');
-      setConnections(response.data);
+      setConnections(await fetchAllPages(axios, '/api/users/connections/'));
     } catch (error) {
       console.error('Error fetching connections:', error);
       toast.error('Failed to load connections');
@@ -4,6 +4,7 @@ import { useAuth } from '../context/AuthContext';
 import axios from 'axios';
 import { Link } from 'react-router-dom';
 import { formatDistanceToNow } from 'date-fns';
+import { fetchPage } from '../utils/pagination';
 
 // Post creation component
 const CreatePostForm = ({ onPostCreated }) => {
@@ -162,6 +163,8 @@ const CommentsSection = ({ post }) => {
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [error, setError] = useState('');
   const [showAllComments, setShowAllComments] = useState(false);
+  const [commentsCursor, setCommentsCursor] = useState(null);
+  const [loadingComments, setLoadingComments] = useState(false);
 
   const handleSubmitComment = async (e) => {
     e.preventDefault();
@@ -189,14 +192,20 @@ const CommentsSection = ({ post }) => {
     }
   };
 
+  // Comments are paged; each call loads the page after the last one shown
   const loadAllComments = async () => {
+    setLoadingComments(true);
     try {
-      const response = await axios.get(`/api/posts/comments/?post_id=${post.id}`);
-      setComments(response.data);
+      const cursor = showAllComments ? commentsCursor : null;
+      const page = await fetchPage(axios, '/api/posts/comments/', cursor, { post_id: post.id });
+      setComments(cursor ? [...comments, ...page.items] : page.items);
+      setCommentsCursor(page.cursor);
       setShowAllComments(true);
     } catch (err) {
       console.error('Error loading comments:', err);
       setError('Failed to load comments');
+    } finally {
+      setLoadingComments(false);
     }
   };
 
@@ -252,6 +261,15 @@ const CommentsSection = ({ post }) => {
           View all {post.comments_count} comments
         </button>
       )}
+      {showAllComments && commentsCursor && (
+        <button
+          onClick={loadAllComments}
+          disabled={loadingComments}
+          className="text-sm text-primary-600 hover:text-primary-700 mb-4"
+        >
+          {loadingComments ? 'Loading...' : 'Load more comments'}
+        </button>
+      )}
       
       {/* Comment form */}
       <form onSubmit={handleSubmitComment} className="flex space-x-2">
@@ -434,11 +452,18 @@ const Feed = () => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  // Fetch posts based on feed type
-  const fetchPosts = async () => {
+  // Fetch the first page of posts, or the page after `cursor`
+  const fetchPosts = async (cursor = null) => {
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+        setNextCursor(null);
+      }
       setError(null);
       
       let endpoint = '/api/posts/posts/';
@@ -450,24 +475,31 @@ const Feed = () => {
       }
       
       console.log('Fetching posts from:', endpoint);
-      const response = await axios.get(endpoint);
+      const page = await fetchPage(axios, endpoint, cursor);
       
       // Validate response data
-      if (response.data && Array.isArray(response.data)) {
+      if (page.items && Array.isArray(page.items)) {
         // Filter out any posts with missing critical data
-        const validPosts = response.data.filter(post => post && post.id && post.author);
+        const validPosts = page.items.filter(post => post && post.id && post.author);
         console.log('Valid posts:', validPosts.length);
-        setPosts(validPosts);
+        setPosts(cursor ? (current) => [...current, ...validPosts] : validPosts);
+        setNextCursor(page.cursor);
       } else {
-        console.error('Invalid response format from API:', response.data);
-        setPosts([]);
+        console.error('Invalid response format from API:', page.items);
+        if (!cursor) {
+          setPosts([]);
+        }
+        setNextCursor(null);
       }
     } catch (err) {
       console.error('Error fetching posts:', err);
       setError('Failed to load posts. Please try again.');
-      setPosts([]);
+      if (!cursor) {
+        setPosts([]);
+      }
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -560,7 +592,7 @@ const Feed = () => {
         <div className="bg-red-50 text-red-600 p-4 rounded-lg mb-6">
           <p>{error}</p>
           <button 
-            onClick={fetchPosts}
+            onClick={() => fetchPosts()}
             className="mt-2 px-4 py-2 bg-red-100 text-red-700 rounded-lg hover:bg-red-200 transition-colors"
           >
             Try Again
@@ -580,6 +612,15 @@ const Feed = () => {
               />
             ) : null
           ))}
+          {nextCursor && (
+            <button
+              onClick={() => fetchPosts(nextCursor)}
+              disabled={loadingMore}
+              className="w-full py-3 bg-white text-primary-600 rounded-xl shadow-sm hover:bg-gray-50 transition-colors"
+            >
+              {loadingMore ? 'Loading...' : 'Load more posts'}
+            </button>
+          )}
         </div>
       ) : (!loading && !error && (
         <div className="bg-white p-6 rounded-xl shadow-sm text-center">
@@ -3,6 +3,7 @@ import { useNavigate, useLocation } from 'react-router-dom';
 import toast from 'react-hot-toast';
 import axiosInstance from '../utils/axiosConfig';
 import { useAuth } from '../context/AuthContext';
+import { fetchAllPages, fetchPage } from '../utils/pagination';
 import { FiPaperclip, FiImage, FiVideo, FiFile, FiX } from 'react-icons/fi';
 
 const Messages = () => {
@@ -10,6 +11,9 @@ const Messages = () => {
     const [connectedUsers, setConnectedUsers] = useState([]);
     const [selectedUser, setSelectedUser] = useState(null);
     const [messages, setMessages] = useState([]);
+    // Cursor for the page of history before the oldest message shown
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
     const [newMessage, setNewMessage] = useState('');
     const [socket, setSocket] = useState(null);
     const [isConnecting, setIsConnecting] = useState(false);
@@ -23,6 +27,7 @@ const Messages = () => {
     const { user } = useAuth() || { user: null };
     const lastMessageRef = useRef(null);
     const reconnectTimeoutRef = useRef(null);
+    const keepScrollRef = useRef(false);
 
     // Scroll to bottom of messages
     const scrollToBottom = () => {
@@ -30,6 +35,11 @@ const Messages = () => {
     };
 
     useEffect(() => {
+        // Loading earlier messages should not jump back to the newest one
+        if (keepScrollRef.current) {
+            keepScrollRef.current = false;
+            return;
+        }
         scrollToBottom();
     }, [messages]);
 
@@ -43,9 +53,9 @@ const Messages = () => {
 
     const fetchConnectedUsers = async () => {
         try {
-            const response = await axiosInstance.get('/api/users/connections/');
-            const users = response.data.map(conn => {
-                const otherUser = conn.sender_details.id === user?.id ? conn.receiver_details : conn.sender_details;
+            const connections = await fetchAllPages(axiosInstance, '/api/users/connections/');
+            const users = connections.map(conn => {
+                const otherUser = conn.other_user;
                 return {
                     id: otherUser.id,
                     username: otherUser.full_name,
@@ -69,11 +79,11 @@ const Messages = () => {
         }
         
         try {
-            const response = await axiosInstance.get('/api/messaging/conversations/');
-            setConversations(response.data);
+            const conversations = await fetchAllPages(axiosInstance, '/api/messaging/conversations/');
+            setConversations(conversations);
             
             if (location.state?.selectedUser) {
-                const userConv = response.data.find(
+                const userConv = conversations.find(
                     conv => conv.other_user.id === location.state.selectedUser.id
                 );
                 if (userConv) {
@@ -117,12 +127,32 @@ const Messages = () => {
     const refreshMessages = async (userId) => {
         try {
             const response = await axiosInstance.get(`/api/messaging/messages/${userId}/`);
-            setMessages(response.data);
+            const newest = response.data;
+            // Keep any earlier pages the user has already loaded
+            setMessages(prev => newest.length
+                ? [...prev.filter(message => message.id && message.id < newest[0].id), ...newest]
+                : newest);
         } catch (error) {
             console.error('Error refreshing messages:', error);
         }
     };
 
+    const loadOlderMessages = async () => {
+        if (!selectedUser || !olderCursor) return;
+        setLoadingOlder(true);
+        try {
+            const page = await fetchPage(axiosInstance, `/api/messaging/messages/${selectedUser.id}/`, olderCursor);
+            keepScrollRef.current = true;
+            setMessages(prev => [...page.items, ...prev]);
+            setOlderCursor(page.cursor);
+        } catch (error) {
+            console.error('Error loading earlier messages:', error);
+            toast.error('Failed to load earlier messages');
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
     // Connect to WebSocket when component mounts or when selecting a new user
     useEffect(() => {
         const connectWebSocket = async () => {
@@ -237,9 +267,11 @@ const Messages = () => {
     // Fetch messages when selecting a conversation
     const handleSelectUser = async (user) => {
         setSelectedUser(user);
+        setOlderCursor(null);
         try {
-            const response = await axiosInstance.get(`/api/messaging/messages/${user.id}/`);
-            setMessages(response.data);
+            const page = await fetchPage(axiosInstance, `/api/messaging/messages/${user.id}/`);
+            setMessages(page.items);
+            setOlderCursor(page.cursor);
         } catch (error) {
             if (error.response?.status === 401) {
                 toast.error('Authentication error. Please log in again.');
@@ -485,6 +517,17 @@ const Messages = () => {
 
                         {/* Messages */}
                         <div className="flex-1 overflow-y-auto p-4 bg-gray-50">
+                            {olderCursor && (
+                                <div className="flex justify-center mb-4">
+                                    <button
+                                        onClick={loadOlderMessages}
+                                        disabled={loadingOlder}
+                                        className="text-sm text-primary-600 hover:text-primary-700"
+                                    >
+                                        {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+                                    </button>
+                                </div>
+                            )}
                             <div className="space-y-4">
                                 {messages.map((message, index) => (
                                     <div
@@ -5,6 +5,7 @@ import axios from 'axios';
 import { motion } from 'framer-motion';
 import { FiEdit2 } from 'react-icons/fi';
 import { toast } from 'react-hot-toast';
+import { fetchAllPages } from '../utils/pagination';
 
 const Profile = () => {
   const { userId } = useParams();
@@ -26,16 +27,14 @@ const Profile = () => {
     if (!isOwnProfile) {
       try {
         // Check both connections and pending requests
-        const [connectionsResponse, requestsResponse] = await Promise.all([
-          axios.get('/api/users/connections/'),
-          axios.get('/api/users/connections/requests/')
+        const [connections, requests] = await Promise.all([
+          fetchAllPages(axios, '/api/users/connections/'),
+          fetchAllPages(axios, '/api/users/connections/requests/')
         ]);
 
         // First check accepted connections
-        const connection = connectionsResponse.data.find(
-          conn => 
-            (conn.sender.id === currentUser.id && conn.receiver.id === parseInt(userId)) ||
-            (conn.receiver.id === currentUser.id && conn.sender.id === parseInt(userId))
+        const connection = connections.find(
+          conn => conn.other_user.id === parseInt(userId)
         );
         
         if (connection) {
@@ -45,10 +44,8 @@ const Profile = () => {
         }
 
         // Then check pending requests
-        const pendingRequest = requestsResponse.data.find(
-          conn => 
-            (conn.sender.id === currentUser.id && conn.receiver.id === parseInt(userId)) ||
-            (conn.receiver.id === currentUser.id && conn.sender.id === parseInt(userId))
+        const pendingRequest = requests.find(
+          conn => conn.other_user.id === parseInt(userId)
         );
 
         if (pendingRequest) {
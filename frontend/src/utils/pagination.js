@@ -0,0 +1,24 @@
+// List endpoints return one page at a time; the cursor for the next page
+// comes back in the X-Next-Cursor header (see backend/pagination.py).
+
+export const nextCursor = (response) => response.headers?.['x-next-cursor'] || null;
+
+// Fetch one page, starting after `cursor` when given
+export const fetchPage = async (client, url, cursor = null, params = {}) => {
+  const response = await client.get(url, {
+    params: cursor ? { ...params, cursor } : params,
+  });
+  return { items: response.data, cursor: nextCursor(response) };
+};
+
+// Follow the cursors to the end, for lists the page needs in full
+export const fetchAllPages = async (client, url, params = {}) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const page = await fetchPage(client, url, cursor, params);
+    items.push(...page.items);
+    cursor = page.cursor;
+  } while (cursor);
+  return items;
+};